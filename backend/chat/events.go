@@ -3,13 +3,28 @@ package main
 import (
 	"encoding/json"
 	"fmt"
+	"strconv"
+	"strings"
 	"time"
 
 	"github.com/getsentry/sentry-go"
 	"github.com/go-redis/redis/v7"
 )
 
-const notifyChannelName = "TSG_NOTIFY"
+const (
+	notifyStreamName = "TSG_NOTIFY_STREAM"
+	notifyGroupName  = "websocket"
+
+	// schemaVersion of the events written by the django backend (see notify/events.py)
+	schemaVersion = "1"
+
+	// maximum of events read with a single XREADGROUP
+	eventBatchSize = 100
+
+	// events delivered to another consumer, which have not been acknowledged for this long,
+	// are claimed on startup. Consumers idle for this long without pending events are deleted.
+	claimMinIdle = time.Minute
+)
 
 var userCountEvents = make(map[int]int)
 
@@ -24,16 +39,20 @@ func (e *Event) String() string {
 	return fmt.Sprintf("User-id: %d, Typ: %s", e.UserID, e.Typ)
 }
 
-// Watches in redis the notfiy list.
+// Watches in redis the notify stream.
 // The django backend stores event which are meant to be sent
 // a specific user.
 //
-// If an event gets stored in the list in redis,
-// watchRedisNotifiyList() consumes the event.
+// The stream is read in batches via a consumer group. The name of the consumer is
+// stable across restarts (CHAT_CONSUMER_NAME). After a restart, the worker first claims the
+// events other consumers did not acknowledge, e.g. a consumer of a recreated container
+// with another name, and then reads its own pending events which have not been acknowledged yet.
+// Each batch gets acknowledged after all of its events have been sent, so
+// restarting the worker does not lose any event.
 //
 // Afterwards, the event gets sent to the user, if
 // the user is currently online and has an active websocket connection.
-func watchRedisNotifiyList() {
+func watchRedisNotifyStream() {
 
 	log.Info("Connecting with Redis...")
 	client, err := connectRedis()
@@ -43,6 +62,18 @@ func watchRedisNotifiyList() {
 		sentry.CaptureException(err)
 	}
 
+	err = client.XGroupCreateMkStream(notifyStreamName, notifyGroupName, "0").Err()
+	if err != nil && !strings.HasPrefix(err.Error(), "BUSYGROUP") {
+		log.Fatalf("Failed to create consumer group, err: %s\n", err)
+		sentry.CaptureException(err)
+	}
+
+	consumer := getEnvOrDefaultValue("CHAT_CONSUMER_NAME")
+	if err := claimPendingEvents(client, consumer); err != nil {
+		log.Warnf("Could not claim the pending events of other consumers, err: %s\n", err)
+		sentry.CaptureException(err)
+	}
+
 	log.Infoln("Successfully connected with Redis, now listening for tasks!")
 
 	// Start goroutine which resets the maximum of events per user
@@ -54,33 +85,175 @@ func watchRedisNotifiyList() {
 		}
 	}()
 
+	// Read the pending events first, then continue with the new ones
+	lastID := "0"
+
 	for {
 
-		result, err := client.BLPop(0, notifyChannelName).Result()
+		streams, err := client.XReadGroup(&redis.XReadGroupArgs{
+			Group:    notifyGroupName,
+			Consumer: consumer,
+			Streams:  []string{notifyStreamName, lastID},
+			Count:    eventBatchSize,
+			Block:    0,
+		}).Result()
 
 		if err != nil {
-			log.Fatalf("Could not read from redis list, err: %s\n", err)
+			log.Fatalf("Could not read from redis stream, err: %s\n", err)
 			sentry.CaptureException(err)
 		}
 
-		var event Event
-		err = json.Unmarshal([]byte(result[1]), &event)
+		var messages []redis.XMessage
+		if len(streams) > 0 {
+			messages = streams[0].Messages
+		}
+
+		if lastID != ">" {
+			if len(messages) == 0 {
+				lastID = ">"
+				continue
+			}
+			lastID = messages[len(messages)-1].ID
+		}
+
+		ids := make([]string, 0, len(messages))
+		for _, message := range messages {
+			ids = append(ids, message.ID)
+			handleMessage(message)
+		}
+
+		if len(ids) > 0 {
+			if err := client.XAck(notifyStreamName, notifyGroupName, ids...).Err(); err != nil {
+				log.Warnf("Could not acknowledge events, err: %s\n", err)
+				sentry.CaptureException(err)
+			}
+		}
+	}
+
+}
+
+// claimPendingEvents claims the events, which have been delivered to other consumers of the group
+// but have not been acknowledged for at least claimMinIdle. They are read afterwards as pending events of
+// the given consumer. Other consumers without pending events, which are idle as long, are deleted.
+func claimPendingEvents(client *redis.Client, consumer string) error {
+	start := "-"
+	for {
+		pending, err := client.XPendingExt(&redis.XPendingExtArgs{
+			Stream: notifyStreamName,
+			Group:  notifyGroupName,
+			Start:  start,
+			End:    "+",
+			Count:  eventBatchSize,
+		}).Result()
 		if err != nil {
-			log.Warnf("Could not unmarshal json: %s\n", err)
-			sentry.CaptureException(err)
+			return err
+		}
+
+		ids := make([]string, 0, len(pending))
+		for _, p := range pending {
+			if p.Consumer != consumer && p.Idle >= claimMinIdle {
+				ids = append(ids, p.ID)
+			}
+		}
+
+		if len(ids) > 0 {
+			claimed, err := client.XClaimJustID(&redis.XClaimArgs{
+				Stream:   notifyStreamName,
+				Group:    notifyGroupName,
+				Consumer: consumer,
+				MinIdle:  claimMinIdle,
+				Messages: ids,
+			}).Result()
+			if err != nil {
+				return err
+			}
+			log.Infof("Claimed %d pending events of other consumers\n", len(claimed))
+		}
+
+		if len(pending) < eventBatchSize {
+			break
+		}
+		start = nextStreamID(pending[len(pending)-1].ID)
+	}
+
+	return deleteIdleConsumers(client, consumer)
+}
+
+// deleteIdleConsumers deletes the consumers of the group except the given one, which do not have
+// pending events and have been idle for at least claimMinIdle.
+func deleteIdleConsumers(client *redis.Client, consumer string) error {
+	consumers, err := client.Do("XINFO", "CONSUMERS", notifyStreamName, notifyGroupName).Result()
+	if err != nil {
+		return err
+	}
+
+	infos, _ := consumers.([]interface{})
+	for _, info := range infos {
+		fields, _ := info.([]interface{})
+
+		// Each consumer is a flat list of its name, pending and idle fields & values
+		values := make(map[string]interface{})
+		for i := 0; i+1 < len(fields); i += 2 {
+			if key, ok := fields[i].(string); ok {
+				values[key] = fields[i+1]
+			}
+		}
+
+		name, _ := values["name"].(string)
+		pending, _ := values["pending"].(int64)
+		idle, _ := values["idle"].(int64)
+		if name == "" || name == consumer || pending > 0 || time.Duration(idle)*time.Millisecond < claimMinIdle {
 			continue
 		}
 
-		// We could also think about accumlating events per user id in a map.
-		// Then start for each id in the map a goroutine which sends the events in a given rate.
-		if !limitEventsReached(event.UserID) {
-			log.Infof("Got Event: %s. Now sending event to user\n", event.String())
-			sendEvent(event)
-		} else {
-			log.Infof("User with id %d already got the maximum of events. Not sending event!\n", event.UserID)
+		if err := client.XGroupDelConsumer(notifyStreamName, notifyGroupName, name).Err(); err != nil {
+			return err
 		}
+		log.Infof("Deleted idle consumer %s\n", name)
 	}
 
+	return nil
+}
+
+// nextStreamID returns the smallest stream ID after the given one
+func nextStreamID(id string) string {
+	parts := strings.SplitN(id, "-", 2)
+	if len(parts) != 2 {
+		return id
+	}
+	seq, err := strconv.ParseUint(parts[1], 10, 64)
+	if err != nil {
+		return id
+	}
+	return fmt.Sprintf("%s-%d", parts[0], seq+1)
+}
+
+// handleMessage decodes a single entry of the notify stream and sends it to the user.
+func handleMessage(message redis.XMessage) {
+
+	if version, _ := message.Values["v"].(string); version != schemaVersion {
+		log.Warnf("Skipping event %s with unknown schema version %v\n", message.ID, message.Values["v"])
+		return
+	}
+
+	data, _ := message.Values["event"].(string)
+
+	var event Event
+	err := json.Unmarshal([]byte(data), &event)
+	if err != nil {
+		log.Warnf("Could not unmarshal json: %s\n", err)
+		sentry.CaptureException(err)
+		return
+	}
+
+	// We could also think about accumlating events per user id in a map.
+	// Then start for each id in the map a goroutine which sends the events in a given rate.
+	if !limitEventsReached(event.UserID) {
+		log.Infof("Got Event: %s. Now sending event to user\n", event.String())
+		sendEvent(event)
+	} else {
+		log.Infof("User with id %d already got the maximum of events. Not sending event!\n", event.UserID)
+	}
 }
 
 // limitEventsReached returns true if a user has reached his maximum number of notifications
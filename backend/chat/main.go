@@ -24,6 +24,9 @@ var (
 		"REDIS_ADDR":        "localhost:6379",
 		"REDIS_PASSWORD":    "",
 		"GO_SENTRY_DSN":     "",
+
+		// Name of the consumer of the notify stream, has to be unique per running chat server
+		"CHAT_CONSUMER_NAME": "chat",
 	}
 
 	ctx = context.Background()
@@ -54,7 +57,7 @@ func main() {
 	go handleMessages()
 
 	// Start routine which watches redis for new events.
-	go watchRedisNotifiyList()
+	go watchRedisNotifyStream()
 
 	http.HandleFunc("/ws", handleConnections)
 
@@ -0,0 +1,64 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import redis
+
+from tsg.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Bumped after every run of the periodic jobs, as those change the data of all companies.
+MARKET_VERSION_KEY = "tsg:cache:market"
+
+# Prefix of the versions per company, bumped by writes which only affect a few companies such as orders & bonds.
+COMPANY_VERSION_KEY = "tsg:cache:company:"
+
+
+def bump_market_version() -> None:
+    """Invalidates all cached responses"""
+    try:
+        redis_client.incr(MARKET_VERSION_KEY)
+    except redis.exceptions.ConnectionError:
+        logger.error("Could not connect with redis to bump the market version!")
+
+
+def bump_company_versions(*company_ids: int) -> None:
+    """Invalidates the cached responses of the given companies"""
+    if not company_ids:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for company_id in set(company_ids):
+        pipe.incr(f"{COMPANY_VERSION_KEY}{company_id}")
+
+    try:
+        pipe.execute()
+    except redis.exceptions.ConnectionError:
+        logger.error(f"Could not connect with redis to bump the versions of {company_ids}!")
+
+
+def get_versions(company_id: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Returns the market version and the version of the given company with a single round trip
+    """
+    keys = [MARKET_VERSION_KEY]
+    if company_id is not None:
+        keys.append(f"{COMPANY_VERSION_KEY}{company_id}")
+
+    versions = [int(v or 0) for v in redis_client.mget(keys)]
+    return versions[0], versions[1] if company_id is not None else 0
+
+
+def get_company_version(company_id: int) -> Optional[int]:
+    """Returns the version of the given company or None if redis is not available"""
+    try:
+        return int(redis_client.get(f"{COMPANY_VERSION_KEY}{company_id}") or 0)
+    except redis.exceptions.ConnectionError:
+        logger.error(f"Could not connect with redis to get the version of {company_id}!")
+        return None
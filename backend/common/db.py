@@ -0,0 +1,53 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from typing import Dict, Sequence, Type
+
+from django.db import connection, models
+
+
+def upsert(
+    model: Type[models.Model],
+    fields: Sequence[str],
+    rows: Sequence[Sequence],
+    conflict_fields: Sequence[str],
+    update: Dict[str, str],
+    batch_size: int = 500,
+) -> None:
+    """
+    Inserts the given rows and updates the existing ones with a single INSERT ... ON CONFLICT per batch.
+
+    fields are the names of the model fields of every row, conflict_fields the names of a unique constraint
+    of the model. update maps the names of the fields, which should be set on a conflict, to a sql expression.
+    The expression can refer to the existing row as "current" and to the inserted row as "EXCLUDED", e.g.
+
+        upsert(Candle, fields, rows, ["company", "resolution", "start"], {"volume": "current.volume + EXCLUDED.volume"})
+    """
+    if not rows:
+        return
+
+    opts = model._meta
+    model_fields = [opts.get_field(name) for name in fields]
+    columns = ", ".join(connection.ops.quote_name(f.column) for f in model_fields)
+    conflict = ", ".join(connection.ops.quote_name(opts.get_field(name).column) for name in conflict_fields)
+    updates = ", ".join(
+        f"{connection.ops.quote_name(opts.get_field(name).column)} = {expression}"
+        for name, expression in update.items()
+    )
+    placeholder = f"({', '.join(['%s'] * len(model_fields))})"
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i : i + batch_size]
+            params = [
+                field.get_db_prep_save(value, connection) for row in batch for field, value in zip(model_fields, row)
+            ]
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(opts.db_table)} AS current ({columns}) "
+                f"VALUES {', '.join([placeholder] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}",
+                params,
+            )
@@ -4,7 +4,24 @@ Use of this source code is governed by a AGPL-3.0
 license that can be found in the LICENSE.txt file.
 """
 
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import DatabaseError, connection
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -15,3 +32,299 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = "page_size"
     max_page_size = 1000
+
+
+class OptionalPageNumberPagination(StandardResultsSetPagination):
+    """
+    Pagination for views, which return all results unless a page is requested with ?page or ?page_size,
+    so clients relying on the unpaginated response keep working.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class EstimatedCountPage(Page):
+    """
+    Page which knows whether there is a next page without relying on the count of the paginator
+    """
+
+    def __init__(self, object_list, number, paginator, has_next: bool):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which only counts the rows exactly if the planner estimates less rows than the threshold.
+
+    Otherwise the planner estimate is used as the count. As the estimate might be off, a page fetches one row
+    more than its size to know whether there is a next page, and pages past the estimated count can be requested.
+    """
+
+    # Results with less rows are counted exactly
+    threshold = 10_000
+
+    @cached_property
+    def estimate(self) -> Optional[int]:
+        """
+        Returns the amount of rows estimated by the PostgreSQL planner or None if there is no estimate
+        """
+        if connection.vendor != "postgresql" or not isinstance(self.object_list, QuerySet):
+            return None
+
+        # QuerySet.explain() returns the plan as text, so we run EXPLAIN ourselves to get the json
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+        except (DatabaseError, EmptyResultSet):
+            return None
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @cached_property
+    def count_exact(self) -> bool:
+        return self.estimate is None or self.estimate < self.threshold
+
+    @cached_property
+    def count(self) -> int:
+        if self.count_exact:
+            return super().count
+        return self.estimate
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+
+        # The estimate might be too low, whether a page is empty is checked in page()
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return super().validate_number(number)
+        if number < 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(_("That page contains no results"))
+
+        return EstimatedCountPage(rows[: self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    """
+    Pagination for views on large tables, such as trades, statements of account and notifications.
+
+    For large results, counting all rows costs more than fetching the page itself. So the count of
+    the planner is used above the threshold (see EstimatedCountPaginator). The response tells
+    with count_exact whether the count is exact.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.page.paginator.count),
+                    ("count_exact", self.page.paginator.count_exact),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder cuts datetimes to milliseconds, but cursors need the exact value
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor based pagination for views sorted by a single field, see BaseListAPIServerSide.
+
+    Instead of an OFFSET, each page continues after the (sort value, id) of the last row of the
+    previous page, so deep pages are as fast as the first one and rows inserted in the meantime
+    do not shift the pages. The id breaks ties between rows with the same sort value.
+    As there is no count, the response only contains the links to the next & previous page.
+
+    The cursors are opaque to the client, they only have to be passed back in the cursor parameter.
+    """
+
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    max_page_size = StandardResultsSetPagination.max_page_size
+
+    cursor_query_param = "cursor"
+
+    # Clients opt in with ?pagination=cursor for the first page
+    mode_query_param = "pagination"
+    mode = "cursor"
+
+    invalid_cursor_message = _("Invalid cursor")
+
+    def __init__(self):
+        self.base_url = None
+        self.page_size_value = self.page_size
+        self.field = None
+        self.descending = True
+        self.next_position = None
+        self.previous_position = None
+
+    @classmethod
+    def is_requested(cls, request) -> bool:
+        if request is None:
+            return False
+        params = request.query_params
+        return params.get(cls.mode_query_param) == cls.mode or cls.cursor_query_param in params
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset) -> Tuple[str, bool]:
+        """
+        Returns the attribute name of the field the queryset is sorted by and whether it is sorted descending
+        """
+        ordering = queryset.query.order_by
+        order = ordering[0] if ordering and isinstance(ordering[0], str) else "-id"
+
+        descending = order.startswith("-")
+        name = order.lstrip("-")
+        if name == "pk":
+            name = "id"
+
+        # Foreign keys are sorted by their id
+        try:
+            field = queryset.model._meta.get_field(name)
+            if field.is_relation:
+                name = field.attname
+        except FieldDoesNotExist:
+            # annotated field such as the value of orders
+            pass
+
+        return name, descending
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size_value = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        cursor = self.decode_cursor(encoded) if encoded else None
+        backwards = bool(cursor and cursor["r"])
+
+        # Paging backwards is the same as paging forwards in the reversed order
+        descending = self.descending != backwards
+
+        queryset = queryset.order_by(*self.order_by(descending))
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor["v"], cursor["id"], descending))
+
+        rows = list(queryset[: self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[: self.page_size_value]
+
+        if backwards:
+            rows.reverse()
+
+        first = self.position(rows[0]) if rows else None
+        last = self.position(rows[-1]) if rows else None
+
+        if backwards:
+            self.next_position = last
+            self.previous_position = first if has_more else None
+        else:
+            self.next_position = last if has_more else None
+            self.previous_position = first if cursor is not None else None
+
+        return rows
+
+    def order_by(self, descending: bool) -> list:
+        sign = "-" if descending else ""
+        if self.field == "id":
+            return [f"{sign}id"]
+        return [f"{sign}{self.field}", f"{sign}id"]
+
+    def after(self, value, id_, descending: bool) -> Q:
+        """
+        Returns the filter for all rows after the given position.
+
+        PostgreSQL sorts NULL values last for ascending and first for descending orderings.
+        """
+        if self.field == "id":
+            return Q(id__lt=id_) if descending else Q(id__gt=id_)
+
+        field = self.field
+        if descending:
+            if value is None:
+                return Q(**{f"{field}__isnull": True, "id__lt": id_}) | Q(**{f"{field}__isnull": False})
+            return Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": id_})
+
+        if value is None:
+            return Q(**{f"{field}__isnull": True, "id__gt": id_})
+        return Q(**{f"{field}__gt": value}) | Q(**{field: value, "id__gt": id_}) | Q(**{f"{field}__isnull": True})
+
+    def position(self, row) -> Tuple:
+        # Rows are dicts for views with a values_serializer_class
+        if isinstance(row, dict):
+            return row[self.field], row["id"]
+        return getattr(row, self.field), row.id
+
+    def encode_cursor(self, position, backwards: bool) -> str:
+        value, id_ = position
+        data = json.dumps({"v": value, "id": id_, "r": backwards}, cls=CursorJSONEncoder)
+        cursor = base64.urlsafe_b64encode(data.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, encoded: str) -> dict:
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(cursor, dict) or not {"v", "id", "r"} <= cursor.keys():
+                raise ValueError
+            int(cursor["id"])
+        except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, backwards=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, backwards=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("previous", self.get_previous_link()), ("results", data)])
+        )
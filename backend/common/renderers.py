@@ -0,0 +1,150 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import csv
+from typing import Iterable, Iterator, List
+
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, which encodes with orjson if it is installed and otherwise falls back to the stdlib encoder.
+
+    The output is the same as the one of the JSONRenderer: types orjson does not know (Decimal, lazy strings)
+    and datetimes are passed to the encoder_class of the JSONRenderer, so e.g. datetimes keep being cut to
+    milliseconds. Indented responses, which are only requested by hand, are always rendered by the stdlib.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or dict()
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+        # Same as the JSONRenderer, these are valid json but not valid javascript
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+        return ret
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """
+    Opt-in compact representation for large tables, requested with ?format=columnar.
+
+    Instead of repeating the keys in every row, a list of objects (or the results of a paginated response)
+    is rendered as its column names and a list of rows:
+
+        {"columns": ["id", "price"], "rows": [[1, 2.5], [2, 3.0]]}
+
+    Keys a row does not have, such as the hidden buyer of a trade with a private depot, are null.
+    """
+
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = to_columns(data)
+        elif isinstance(data, dict) and isinstance(data.get("results"), list):
+            data["results"] = to_columns(data["results"])
+
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def to_columns(rows: list) -> dict:
+    """
+    Returns the given list of dicts as its columns and rows. Lists of other values are not changed.
+    """
+    if not all(isinstance(row, dict) for row in rows):
+        return rows
+
+    # Rows might miss some keys, so the columns are ordered like the most complete row
+    columns = dict.fromkeys(max(rows, key=len, default=dict()))
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+
+    columns = list(columns)
+    return {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+
+
+# Renderers of large tables, which can also be requested in the compact representation
+TABLE_RENDERER_CLASSES = (FastJSONRenderer, ColumnarJSONRenderer, BrowsableAPIRenderer)
+
+
+class Echo:
+    """File-like object for the csv writer, which returns the written line instead of buffering it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders rows as csv, requested with ?format=csv. Used by the exports, see common.views.StreamingExportMixin.
+
+    Nested values are selected with dotted columns, e.g. "trade.buyer.name". Missing values are empty.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        columns = list(rows[0]) if rows else list()
+        return b"".join(self.stream(rows, columns))
+
+    def stream(self, rows: Iterable[dict], columns: List[str]) -> Iterator[bytes]:
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns).encode()
+        for row in rows:
+            yield writer.writerow([to_cell(get_value(row, column)) for column in columns]).encode()
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """
+    Renders rows as newline delimited json, one row per line, requested with ?format=ndjson.
+    Used by the exports, see common.views.StreamingExportMixin.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return b"".join(self.stream(rows))
+
+    def stream(self, rows: Iterable[dict], columns: List[str] = None) -> Iterator[bytes]:
+        for row in rows:
+            yield super().render(row) + b"\n"
+
+
+def get_value(row: dict, column: str):
+    """Returns the value of a dotted column of a row with nested dicts or None if it does not exist"""
+    value = row
+    for key in column.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def to_cell(value) -> str:
+    return "" if value is None else str(value)
+
+
+# Renderers of the exports, the first one is the default
+EXPORT_RENDERER_CLASSES = (CSVRenderer, NDJSONRenderer)
@@ -0,0 +1,115 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import functools
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+from django.db.models import QuerySet
+from rest_framework.serializers import BaseSerializer
+
+# A mapper turns a row into the value of a single field
+Mapper = Callable[[dict], object]
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ModelSerializer for large lists, which builds the same representation
+    from .values() rows instead of model instances.
+
+    Creating a model instance and the nested serializers for every row dominates the time of our list responses.
+    Instead, the readable fields of the serializer_class are compiled once into the columns to select
+    and a mapper per field. Nested serializers are selected over their relation,
+    so ``company = CompanyUrlSerializer()`` selects ``company_id``, ``company__name`` and so on.
+
+    Per-row logic of the serializer_class, such as hiding fields, has to be reproduced in to_representation().
+    The tests compare the rendered output of both serializers byte by byte.
+    """
+
+    serializer_class = None
+
+    # Fields, which the serializer_class always removes from its representation
+    exclude = ()
+
+    # Columns not rendered as a field but needed by to_representation()
+    extra_columns = ()
+
+    # Columns, which are computed by the database: name -> expression
+    expressions = dict()
+
+    def __init__(self, context: dict = None, prefix: str = ""):
+        self.context = context or dict()
+        self.prefix = prefix
+
+        columns, self.mappers = compile_serializer(type(self), prefix)
+        self.columns = columns + [f"{prefix}{column}" for column in self.extra_columns]
+
+    def rows(self, queryset: QuerySet) -> QuerySet:
+        """
+        Returns the rows of the queryset with all columns needed for the representation
+        """
+        columns = [column for column in self.columns if column not in self.expressions]
+        return queryset.values(*columns, **self.expressions)
+
+    def to_representation(self, row: dict) -> OrderedDict:
+        return OrderedDict([(name, mapper(row)) for name, mapper in self.mappers])
+
+    def many(self, rows) -> list:
+        return [self.to_representation(row) for row in rows]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_serializer(values_serializer_class, prefix: str) -> Tuple[List[str], List[Tuple[str, Mapper]]]:
+    """
+    Returns the columns & the mappers of the fields of the serializer_class of the given ValuesSerializer
+    """
+    serializer = values_serializer_class.serializer_class(context={"request": None})
+    fields = [f for f in serializer._readable_fields if f.field_name not in values_serializer_class.exclude]
+    return compile_fields(fields, prefix)
+
+
+def compile_fields(fields, prefix: str, relation: str = None) -> Tuple[List[str], List[Tuple[str, Mapper]]]:
+    columns = list()
+    mappers = list()
+
+    for field in fields:
+        source = "__".join(field.source_attrs)
+
+        if isinstance(field, BaseSerializer):
+            # Nested serializer of a foreign key
+            nested_relation = f"{prefix}{source}"
+            nested_columns, nested_mappers = compile_fields(
+                field._readable_fields, f"{nested_relation}__", relation=nested_relation
+            )
+            columns += nested_columns
+            mappers.append((field.field_name, nested_mapper(f"{nested_relation}_id", nested_mappers)))
+            continue
+
+        # The id of a related object is stored on the row itself
+        column = f"{relation}_id" if relation is not None and source == "id" else f"{prefix}{source}"
+        if column not in columns:
+            columns.append(column)
+        mappers.append((field.field_name, field_mapper(column, field.to_representation)))
+
+    return columns, mappers
+
+
+def field_mapper(column: str, to_representation: Callable) -> Mapper:
+    def mapper(row: dict):
+        value = row[column]
+        # Same as Serializer.to_representation(), None is not passed to the field
+        return None if value is None else to_representation(value)
+
+    return mapper
+
+
+def nested_mapper(column: str, mappers: List[Tuple[str, Mapper]]) -> Mapper:
+    def mapper(row: dict):
+        if row[column] is None:
+            return None
+        return OrderedDict([(name, m(row)) for name, m in mappers])
+
+    return mapper
@@ -9,7 +9,11 @@ from django.db.models import Model
 from django.utils import timezone
 from rest_framework.test import APITestCase, APITransactionTestCase
 
+from common.cache import bump_market_version
+from core.company_cache import company_cache
 from core.models import Company
+from core.shareholders import clear_shareholders
+from core.sidebar import clear_sidebar
 from tsg.const import DATETIME_FORMAT
 from users.models import User
 
@@ -38,6 +42,13 @@ class TestBaseMixin:
     ONE_HUNDRED_THOUSAND = 100000
 
     def setUp(self):
+        # Do not serve responses cached by other tests
+        bump_market_version()
+        clear_sidebar()
+        company_cache.clear()
+        clear_shareholders()
+        Company.clear_centralbank_identity()
+
         self.user = User.objects.create(username="A", password="password", email="A@web.de")
         self.company = Company.objects.create(name="Company", user=self.user, cash=self.ONE_HUNDRED_THOUSAND)
         self.user_two = User.objects.create(username="D", password="password", email="d@web.de")
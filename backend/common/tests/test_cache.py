@@ -0,0 +1,105 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+
+from common.cache import bump_company_versions, bump_market_version, get_versions
+from common.test_base import BaseTestCase
+from core.models import Company, DepotPosition
+from periodic_tasks.scheduler import AdaptiveScheduler
+from tsg.redis import redis_client
+
+
+class ResponseCacheTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("core:company", kwargs={"isin": self.company.isin})
+
+    def get(self) -> tuple:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def rename(self, name: str) -> None:
+        # update() does not trigger any signal
+        Company.objects.filter(id=self.company.id).update(name=name)
+
+    def test_versions(self):
+        market, company = get_versions(self.company.id)
+
+        bump_company_versions(self.company.id)
+        self.assertEqual(get_versions(self.company.id), (market, company + 1))
+
+        bump_market_version()
+        self.assertEqual(get_versions(self.company.id), (market + 1, company + 1))
+        self.assertEqual(get_versions()[1], 0)
+
+    def test_cached_response_is_served_without_queries(self):
+        response, queries = self.get()
+        self.assertGreater(queries, 0)
+
+        cached, queries = self.get()
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached["Content-Type"], response["Content-Type"])
+        self.assertEqual(cached.json()["name"], "Company")
+
+    def test_company_version_invalidates(self):
+        self.get()
+        self.rename("Renamed")
+        self.assertEqual(self.get()[0].json()["name"], "Company")
+
+        bump_company_versions(self.company.id)
+        self.assertEqual(self.get()[0].json()["name"], "Renamed")
+
+    def test_market_version_invalidates(self):
+        self.get()
+        self.rename("Renamed")
+
+        bump_market_version()
+        self.assertEqual(self.get()[0].json()["name"], "Renamed")
+
+    def test_errors_are_not_cached(self):
+        url = reverse("core:company", kwargs={"isin": "DE999999"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_decorated_handler(self):
+        url = reverse("core:liquidity", kwargs={"isin": self.company.isin})
+        response = self.client.get(url)
+
+        with CaptureQueriesContext(connection) as context:
+            cached = self.client.get(url)
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(cached.json(), response.json())
+
+    def test_cache_scope(self):
+        urls = [
+            reverse("core:shareholders", kwargs={"isin": self.company.isin}),
+            reverse("stats:past_key_figures", kwargs={"isin": self.company.isin}),
+        ]
+        cached = [self.client.get(url).json() for url in urls]
+
+        # update() does not trigger any signal, the responses of the company are invalidated by its version
+        DepotPosition.objects.filter(company=self.company).update(amount=1)
+        self.assertEqual([self.client.get(url).json() for url in urls], cached)
+
+        bump_company_versions(self.company.id)
+        self.assertNotEqual(self.client.get(urls[0]).json(), cached[0])
+
+    def test_responses_expire_after_the_shortest_tick(self):
+        pattern = "tsg:cache:response:CompanyRetrieveView:*"
+        for key in redis_client.scan_iter(pattern):
+            redis_client.delete(key)
+
+        self.get()
+        keys = list(redis_client.scan_iter(pattern))
+        self.assertEqual(len(keys), 1)
+        self.assertLessEqual(redis_client.ttl(keys[0]), AdaptiveScheduler.MIN_INTERVAL)
@@ -0,0 +1,142 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework.reverse import reverse
+
+from common.pagination import EstimatedCountPaginator
+from common.test_base import BaseTestCase
+from core.models import StatementOfAccount
+
+
+class KeysetPaginationTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("core:statement", kwargs={"isin": self.company.isin})
+
+        amounts = [None, 5, 5, 5, 1, None, 10, 3, 3, None, 7, 5, 2]
+        statements = StatementOfAccount.objects.bulk_create(
+            [
+                StatementOfAccount(company=self.company, typ="Bond", value=i % 4, amount=amount, received=i % 2 == 0)
+                for i, amount in enumerate(amounts)
+            ]
+        )
+
+        # Some rows share the same timestamp
+        now = timezone.now()
+        for i, s in enumerate(statements):
+            StatementOfAccount.objects.filter(id=s.id).update(created=now - timedelta(microseconds=i // 3))
+
+    def expected(self, sort: str) -> list:
+        sign = "-" if sort.startswith("-") else ""
+        ordering = [sort] if sort.lstrip("-") == "id" else [sort, f"{sign}id"]
+        return list(
+            StatementOfAccount.objects.filter(company=self.company).order_by(*ordering).values_list("id", flat=True)
+        )
+
+    def walk(self, url: str, link: str) -> tuple:
+        ids = list()
+        last = None
+        while url:
+            rsp = self.client.get(url)
+            self.assertEqual(rsp.status_code, 200)
+            data = rsp.json()
+            self.assertNotIn("count", data)
+
+            page = [s["id"] for s in data["results"]]
+            ids += page if link == "next" else page[::-1]
+            last = data
+            url = data[link]
+        return ids, last
+
+    def test_walk_forwards_and_backwards(self):
+        for sort in ["-id", "id", "amount", "-amount", "value", "-created", "received"]:
+            expected = self.expected(sort)
+
+            ids, last_page = self.walk(f"{self.url}?pagination=cursor&page_size=4&sort={sort}", "next")
+            self.assertEqual(ids, expected, sort)
+
+            # and back again from the last page
+            ids, _ = self.walk(last_page["previous"], "previous")
+            last_page_ids = [s["id"] for s in last_page["results"]]
+            self.assertEqual(ids[::-1] + last_page_ids, expected, sort)
+
+    def test_first_page(self):
+        rsp = self.client.get(f"{self.url}?pagination=cursor&page_size=5")
+        data = rsp.json()
+
+        self.assertEqual([s["id"] for s in data["results"]], self.expected("-id")[:5])
+        self.assertIsNone(data["previous"])
+        self.assertIn("cursor=", data["next"])
+
+    def test_stable_under_inserts(self):
+        rsp = self.client.get(f"{self.url}?pagination=cursor&page_size=5").json()
+        StatementOfAccount.objects.create(company=self.company, typ="Bond", value=1, amount=1, received=True)
+
+        second = self.client.get(rsp["next"]).json()
+        self.assertEqual([s["id"] for s in second["results"]], self.expected("-id")[6:11])
+
+    def test_page_number_pagination_stays_default(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["count"], len(self.expected("-id")))
+        self.assertNotIn("next", data["results"][0])
+
+    def test_invalid_cursor(self):
+        rsp = self.client.get(f"{self.url}?cursor=invalid")
+        self.assertEqual(rsp.status_code, 404)
+
+
+class EstimatedCountPaginationTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("core:statement", kwargs={"isin": self.company.isin})
+
+        StatementOfAccount.objects.bulk_create(
+            [StatementOfAccount(company=self.company, typ="Bond", value=i, amount=i, received=True) for i in range(11)]
+        )
+        self.ids = list(
+            StatementOfAccount.objects.filter(company=self.company).order_by("-id").values_list("id", flat=True)
+        )
+
+    def walk(self) -> list:
+        ids = list()
+        url = f"{self.url}?page_size=4"
+        while url:
+            data = self.client.get(url).json()
+            ids += [s["id"] for s in data["results"]]
+            url = data["next"]
+        return ids
+
+    def test_small_results_are_counted_exactly(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["count"], 11)
+        self.assertTrue(data["count_exact"])
+        self.assertEqual(self.walk(), self.ids)
+
+    def test_large_results_are_estimated(self):
+        with mock.patch.object(EstimatedCountPaginator, "threshold", 0):
+            data = self.client.get(self.url).json()
+            self.assertFalse(data["count_exact"])
+            self.assertIsInstance(data["count"], int)
+
+            # The estimate does not decide about the pages
+            self.assertEqual(self.walk(), self.ids)
+            self.assertEqual(self.client.get(f"{self.url}?page_size=4&page=4").status_code, 404)
+
+    def test_estimate_without_count_query(self):
+        queryset = StatementOfAccount.objects.filter(company=self.company).order_by("-id")
+        paginator = EstimatedCountPaginator(queryset, 4)
+
+        with mock.patch.object(EstimatedCountPaginator, "threshold", 0):
+            with self.assertNumQueries(2):
+                # explain & the page itself
+                page = paginator.page(1)
+                self.assertGreaterEqual(paginator.count, 0)
+
+        self.assertTrue(page.has_next())
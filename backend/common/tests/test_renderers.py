@@ -0,0 +1,95 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+
+from common import renderers
+from common.renderers import FastJSONRenderer, to_columns
+from common.test_base import BaseTestCase
+from core.models import Company, Trade
+
+DATA = OrderedDict(
+    [
+        ("price", Decimal("12.30")),
+        ("created", timezone.now()),
+        ("day", datetime.date(2020, 3, 1)),
+        ("name", "Zürich\u2028\u2029"),
+        ("lazy", _("Price cannot be equal or less than 0")),
+        ("results", [{"id": 1, "user_id": None, "private": True}, {"id": 2, "amount": 3}]),
+    ]
+)
+
+
+class FastJSONRendererTest(SimpleTestCase):
+    @skipIf(renderers.orjson is None, "orjson is not installed")
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    @skipIf(renderers.orjson is None, "orjson is not installed")
+    def test_renders_with_orjson(self):
+        with mock.patch.object(renderers.orjson, "dumps", wraps=renderers.orjson.dumps) as dumps:
+            ret = FastJSONRenderer().render(DATA)
+
+        dumps.assert_called_once()
+        self.assertEqual(ret, JSONRenderer().render(DATA))
+
+    @mock.patch.object(renderers, "orjson", None)
+    def test_fallback_without_orjson(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_indent(self):
+        expected = JSONRenderer().render(DATA, renderer_context={"indent": 4})
+        self.assertEqual(FastJSONRenderer().render(DATA, renderer_context={"indent": 4}), expected)
+
+    def test_to_columns(self):
+        self.assertEqual(
+            to_columns([{"id": 1, "buyer": {"id": 2}}, {"id": 2, "seller": None}]),
+            {"columns": ["id", "buyer", "seller"], "rows": [[1, {"id": 2}, None], [2, None, None]]},
+        )
+        self.assertEqual(to_columns([1, 2]), [1, 2])
+
+
+class ColumnarJSONRendererTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two)
+        Trade.objects.create(buyer=self.company, seller=self.company_two, company=self.company_two, price=2)
+        Trade.objects.create(
+            buyer=self.company_two, seller=self.company, company=self.company_two, price=1, buyer_pd=True
+        )
+
+    def test_trades(self):
+        url = reverse("core:trades")
+        rows = self.client.get(url).json()
+        data = self.client.get(url, {"format": "columnar"}).json()
+
+        self.assertEqual(data["count"], rows["count"])
+
+        columns = data["results"]["columns"]
+        self.assertEqual(columns, list(rows["results"][1].keys()))
+        self.assertEqual(len(data["results"]["rows"]), 2)
+
+        for row, expected in zip(data["results"]["rows"], rows["results"]):
+            self.assertEqual({c: v for c, v in zip(columns, row) if c in expected}, expected)
+
+        # The hidden buyer of the private depot stays hidden
+        self.assertIsNone(data["results"]["rows"][0][columns.index("buyer")])
+
+    def test_company_trades(self):
+        url = reverse("core:company_trades", kwargs={"isin": self.company_two.isin})
+        data = self.client.get(url, {"format": "columnar"}).json()
+
+        self.assertEqual(data["company_name"], "Company Two")
+        self.assertEqual(len(data["results"]["rows"]), 1)
@@ -4,14 +4,29 @@ Use of this source code is governed by a AGPL-3.0
 license that can be found in the LICENSE.txt file.
 """
 
+import functools
 import logging
-from typing import Union
+from typing import Callable, Iterator, Optional, Union
 
+import redis
 from django.db.models import QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
+from common.cache import get_versions
+from common.pagination import KeysetPagination
+from common.renderers import EXPORT_RENDERER_CLASSES
+from tsg.redis import redis_client
+
 logger = logging.getLogger(__name__)
 
+# Cached responses are versioned. Writes, which neither bump the market nor the company version, such as
+# QuerySet.update(), are only picked up once the response expires. So the timeout is the shortest interval
+# between two ticks of the periodic jobs (see periodic_tasks.scheduler.AdaptiveScheduler.MIN_INTERVAL).
+CACHE_TIMEOUT = 60
+
 
 class BaseListAPIServerSide:
     """
@@ -22,6 +37,15 @@ class BaseListAPIServerSide:
 
     default_ordering = "-id"
 
+    # Used instead of the pagination_class if the client asks for it, see KeysetPagination
+    cursor_pagination_class = KeysetPagination
+
+    # Used instead of the serializer_class to list the objects, see common.serializers.ValuesSerializer
+    values_serializer_class = None
+
+    # Amount of rows fetched at once by the server-side cursor of an export
+    export_chunk_size = 2000
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if hasattr(self.get_queryset, "is_overridden"):
@@ -43,6 +67,37 @@ class BaseListAPIServerSide:
 
         return qs.order_by(order).filter(**self.get_filter_kwargs())
 
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, "_paginator")
+            and self.pagination_class is not None
+            and self.cursor_pagination_class.is_requested(self.request)
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        if self.values_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.values_serializer_class(context=self.get_serializer_context())
+        queryset = self.get_rows(serializer)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.many(page))
+
+        return Response(serializer.many(queryset))
+
+    def get_rows(self, serializer):
+        """Returns the rows to list with the values_serializer_class"""
+        return serializer.rows(self.filter_queryset(self.get_queryset()))
+
+    def get_export_rows(self, serializer) -> Iterator[dict]:
+        """Returns an iterator over all rows to export with the values_serializer_class, see StreamingExportMixin"""
+        return serializer.rows(self.get_queryset()).iterator(chunk_size=self.export_chunk_size)
+
     def get_queryset_list(self) -> Union[QuerySet, None]:
         """If you need to override the get_queryset method, override this"""
         return None
@@ -78,6 +133,39 @@ class BaseListAPIServerSide:
         return ["id"]
 
 
+class StreamingExportMixin:
+    """
+    Mixin for ListApiViews with a values_serializer_class, which streams all rows of the list
+    as csv (default) or ndjson (?format=ndjson) instead of paginating them.
+
+    The rows are read with a server-side cursor and written while they are read, so the memory
+    does not grow with the amount of rows. Rows are exported in the default ordering without
+    the filter_queryset() of the list, i.e. the exports contain the whole history.
+    """
+
+    renderer_classes = EXPORT_RENDERER_CLASSES
+
+    # Dotted columns of the csv export, e.g. "trade.buyer.name". The ndjson export contains the whole rows.
+    export_columns = ()
+
+    def get_order(self) -> str:
+        return self.default_ordering
+
+    def get_filename(self) -> str:
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.values_serializer_class(context=self.get_serializer_context())
+        rows = (serializer.to_representation(row) for row in self.get_export_rows(serializer))
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows, list(self.export_columns)), content_type=request.accepted_media_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="{self.get_filename()}.{renderer.format}"'
+        return response
+
+
 class PaginatedResponseMixin:
     def get_paginated_response(self, queryset):
         page = self.paginate_queryset(queryset)
@@ -87,3 +175,75 @@ class PaginatedResponseMixin:
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+
+def cache_response(method: Callable) -> Callable:
+    """
+    Decorator for GET handlers of a view, which caches the rendered response in redis.
+
+    The cache key contains the market version and, if the view has a cache scope, the version of the company
+    (see common.cache). Hence, a cached response is served until the periodic jobs ran, the company has been
+    changed by an order or a bond or at most CACHE_TIMEOUT seconds.
+
+    The view has to implement get_cache_scope(), see CachedResponseMixin.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+
+        # The browsable api needs the whole response to render
+        if isinstance(renderer, BrowsableAPIRenderer):
+            return method(self, request, *args, **kwargs)
+
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+
+        try:
+            key = get_cache_key(self, request)
+            content = redis_client.get(key)
+        except redis.exceptions.ConnectionError:
+            logger.error("Could not connect with redis, not caching the response!")
+            return method(self, request, *args, **kwargs)
+
+        if content is not None:
+            return HttpResponse(content, content_type=content_type)
+
+        response = method(self, request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        content = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+        redis_client.set(key, content, ex=CACHE_TIMEOUT)
+
+        return HttpResponse(content, content_type=content_type)
+
+    return wrapper
+
+
+def get_cache_key(view, request) -> str:
+    """
+    Returns the cache key of a response, which contains the current versions of the market and the company
+    """
+    company_id = view.get_cache_scope()
+    market_version, company_version = get_versions(company_id)
+
+    return (
+        f"tsg:cache:response:{view.__class__.__name__}:{request.accepted_media_type}:{market_version}:"
+        f"{company_id}:{company_version}:{request.build_absolute_uri()}"
+    )
+
+
+class CachedResponseMixin:
+    """
+    Mixin for views, which caches the GET responses. See cache_response.
+    """
+
+    def get_cache_scope(self) -> Optional[int]:
+        """Returns the id of the company the response belongs to, whose version is part of the cache key"""
+        return None
+
+    @cache_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
@@ -5,7 +5,7 @@ license that can be found in the LICENSE.txt file.
 """
 
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
@@ -13,6 +13,14 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import core.signals
-        from core.models import Company
+        from core.models import Bond, Company
+        from users.models import Profile
 
         post_save.connect(core.signals.create_models_new_company, sender=Company)
+        post_save.connect(core.signals.invalidate_company_responses, sender=Company)
+        post_delete.connect(core.signals.invalidate_company_responses, sender=Company)
+        post_save.connect(core.signals.rebuild_sidebar, sender=Company)
+        post_save.connect(core.signals.invalidate_company_cache, sender=Company)
+        post_delete.connect(core.signals.invalidate_company_cache, sender=Company)
+        post_save.connect(core.signals.invalidate_profile_company_responses, sender=Profile)
+        post_save.connect(core.signals.add_bond_value, sender=Bond)
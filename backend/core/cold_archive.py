@@ -0,0 +1,331 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import datetime
+import itertools
+import json
+import logging
+import mmap
+import operator
+import os
+import struct
+import zlib
+from collections import Counter
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.utils.encoders import JSONEncoder
+
+from common.serializers import ValuesSerializer
+from core.models import StatementOfAccount, Trade
+from core.serializers import StatementOfAccountValuesSerializer, TradeValuesSerializer
+
+logger = logging.getLogger(__name__)
+
+# Archived partitions (see core/partitions.py) are stored as one cold file per table and month,
+# <COLD_ARCHIVE_DIR>/<table>/<year>_<month>.cold, so the history stays readable without the database.
+#
+# A file stores the .values() rows of the list views, so companies & trades are already joined, in segments.
+# For every key column, e.g. the company of a statement, the rows of each company are one segment,
+# ordered by their id descending. A segment stores its rows column by column as zlib compressed json.
+# The index of the segments is stored at the end of the file. Besides the position of a segment, it stores
+# the amount of rows of the segment per value of the filter columns, e.g. of trades with a private depot,
+# so pages & counts are computed without reading the segments, which are not on the page:
+#
+#     MAGIC | offset of the index (uint64) | segments ... | index (zlib compressed json)
+#
+# The files are read through a memory map, so only the index & the requested segments are read from disk.
+#
+# The segments of all companies of a month share one file instead of a file per company & month: a month
+# of a busy market already has thousands of companies with only a few rows each. A single file keeps the
+# amount of files small and lets a page, which spans several companies' months, be read from one map.
+MAGIC = b"TSGCOLD1"
+HEADER = struct.Struct("<8sQ")
+
+# Amount of rows fetched at once while writing, only the rows of a single segment are kept in memory
+CHUNK_SIZE = 2000
+
+
+class Archive:
+    def __init__(
+        self,
+        queryset: Callable[[], QuerySet],
+        values_serializer_class,
+        keys: Tuple[str, ...],
+        filter_columns: Tuple[str, ...] = (),
+    ):
+        self.queryset = queryset
+        self.values_serializer_class = values_serializer_class
+
+        # Columns the rows are looked up by
+        self.keys = keys
+
+        # Columns the list views filter by besides the key, the rows of a segment are counted per their values
+        self.filter_columns = filter_columns
+
+    def serializer(self) -> ValuesSerializer:
+        return self.values_serializer_class()
+
+    def columns(self) -> List[str]:
+        serializer = self.serializer()
+        return list(dict.fromkeys(serializer.columns + list(serializer.expressions)))
+
+
+# Statements are archived before the trades, as their rows contain their trade
+ARCHIVES = {
+    "statement_of_account": Archive(
+        lambda: StatementOfAccount.objects.all(), StatementOfAccountValuesSerializer, ("company_id",)
+    ),
+    "trade": Archive(
+        lambda: Trade.objects.add_value(),
+        TradeValuesSerializer,
+        ("seller_id", "company_id"),
+        ("buyer_pd", "seller_pd"),
+    ),
+}
+
+
+def get_directory(table: str) -> str:
+    return os.path.join(settings.COLD_ARCHIVE_DIR, table)
+
+
+def get_path(table: str, month: datetime.datetime) -> str:
+    return os.path.join(get_directory(table), f"{month:%Y_%m}.cold")
+
+
+def encode_column(values: list) -> Tuple[str, list]:
+    """Returns the type of the column and its values as json types"""
+    typ = next((type(v).__name__ for v in values if v is not None), "NoneType")
+    if typ == "Decimal":
+        return "decimal", [None if v is None else str(v) for v in values]
+    if typ == "datetime":
+        return "datetime", [None if v is None else v.isoformat() for v in values]
+    return "json", values
+
+
+def decode_column(typ: str, values: list) -> list:
+    if typ == "decimal":
+        return [None if v is None else Decimal(v) for v in values]
+    if typ == "datetime":
+        return [None if v is None else datetime.datetime.fromisoformat(v) for v in values]
+    return values
+
+
+def write_segment(f, archive: Archive, columns: List[str], rows: List[dict]) -> tuple:
+    """Writes the rows of a segment to the file and returns its entry of the index"""
+    types, values = zip(*[encode_column([row[c] for row in rows]) for c in columns])
+    data = zlib.compress(json.dumps({"types": types, "values": values}, cls=JSONEncoder).encode())
+    counts = Counter(tuple(row[c] for c in archive.filter_columns) for row in rows)
+    segment = (f.tell(), len(data), len(rows), list(counts.items()))
+    f.write(data)
+    return segment
+
+
+def write(table: str, month: datetime.datetime, end: datetime.datetime, path: str = None) -> Optional[str]:
+    """
+    Writes the rows of the given table created in [month, end) to the given path, by default the cold file
+    of the month. Returns the path of the file or None if the table is not archived.
+
+    Cold files are never overwritten, so a month can only be archived once.
+
+    The rows are streamed ordered by the key, so each segment is written as soon as all of its rows
+    have been read and the month never has to fit into memory.
+    """
+    archive = ARCHIVES.get(table)
+    if archive is None:
+        return None
+
+    if os.path.exists(get_path(table, month)):
+        raise FileExistsError(f"{get_path(table, month)} has already been archived")
+    path = path or get_path(table, month)
+
+    columns = archive.columns()
+    serializer = archive.serializer()
+    queryset = archive.queryset().filter(created__gte=month, created__lt=end)
+
+    os.makedirs(get_directory(table), exist_ok=True)
+
+    index = {"columns": columns, "filter_columns": archive.filter_columns, "keys": dict()}
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0))
+
+        for key in archive.keys:
+            rows = serializer.rows(queryset.filter(**{f"{key}__isnull": False}).order_by(key, "-id"))
+
+            segments = dict()
+            for key_value, group in itertools.groupby(rows.iterator(chunk_size=CHUNK_SIZE), operator.itemgetter(key)):
+                segments[key_value] = write_segment(f, archive, columns, list(group))
+            index["keys"][key] = segments
+
+        offset = f.tell()
+        f.write(zlib.compress(json.dumps(index).encode()))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset))
+
+    segments = sum(len(segments) for segments in index["keys"].values())
+    logger.info(f"Wrote {segments} segments of {table} to {path}")
+    return path
+
+
+class ColdFile:
+    """Reader of a cold file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, offset = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a cold archive")
+
+        index = json.loads(zlib.decompress(self.mm[offset:]))
+        self.columns = index["columns"]
+        self.filter_columns = index["filter_columns"]
+        # json turned the key values into strings
+        self.keys = {key: {int(k): v for k, v in segments.items()} for key, segments in index["keys"].items()}
+
+    def count(self, key: str, value: int, filters: dict = None) -> int:
+        """Returns the amount of rows of the segment with the given filters on other columns"""
+        segment = self.keys.get(key, dict()).get(value)
+        if segment is None:
+            return 0
+
+        if not filters:
+            return segment[2]
+
+        if set(filters) <= set(self.filter_columns):
+            positions = [(self.filter_columns.index(k), v) for k, v in filters.items()]
+            return sum(n for values, n in segment[3] if all(values[i] == v for i, v in positions))
+
+        # Columns without counts in the index, only this segment is read
+        return len(self.rows(key, value, filters))
+
+    def rows(self, key: str, value: int, filters: dict = None) -> List[dict]:
+        """Returns the rows of the segment with the given filters on other columns"""
+        segment = self.keys.get(key, dict()).get(value)
+        if segment is None:
+            return list()
+
+        offset, length = segment[:2]
+        data = json.loads(zlib.decompress(self.mm[offset : offset + length]))
+        values = [decode_column(typ, column) for typ, column in zip(data["types"], data["values"])]
+        rows = [dict(zip(self.columns, row)) for row in zip(*values)]
+
+        if filters:
+            rows = [row for row in rows if all(row.get(k) == v for k, v in filters.items())]
+        return rows
+
+
+# Readers of the cold files by path, the files do not change once they have been written
+_files: Dict[str, ColdFile] = dict()
+
+
+def get_files(table: str) -> List[ColdFile]:
+    """Returns the readers of the cold files of the given table, the newest month first"""
+    directory = get_directory(table)
+    if not os.path.isdir(directory):
+        return list()
+
+    files = list()
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".cold"):
+            continue
+        path = os.path.join(directory, name)
+        if path not in _files:
+            _files[path] = ColdFile(path)
+        files.append(_files[path])
+    return files
+
+
+def get_key(table: str, filters: dict) -> Optional[Tuple[str, int]]:
+    """Returns the key column & its value the filters of a list view can be looked up by in the cold files"""
+    archive = ARCHIVES.get(table)
+    if archive is None:
+        return None
+    return next(((key, filters[key]) for key in archive.keys if key in filters), None)
+
+
+def iter_rows(table: str, filters: dict) -> Iterator[dict]:
+    """
+    Yields the rows of the cold files with the filters of a list view, the newest first.
+    Only a single segment is read into the memory at once.
+    """
+    lookup = get_key(table, filters)
+    if lookup is None:
+        return
+
+    key, value = lookup
+    # Filters on other columns, e.g. trades of private depots, are applied to the rows
+    others = {k: v for k, v in filters.items() if k != key}
+
+    for f in get_files(table):
+        yield from f.rows(key, value, others)
+
+
+class ColdRows:
+    """
+    Rows of a list view, followed by the rows of the cold files with the same filters.
+
+    Archived rows are older than the rows in the database, so for views ordered by the id descending,
+    the cold rows simply follow the rows of the database. Pages are sliced from both without loading
+    the rows, which are not on the page: the database rows are sliced by the database and the segments
+    of the cold files are skipped by their counts in the index, only the segments on the page are read.
+    """
+
+    def __init__(self, rows: QuerySet, table: str, filters: dict):
+        self.db_rows = rows
+        self.table = table
+        self.key, self.value = get_key(table, filters)
+
+        # Filters on other columns, e.g. trades of private depots
+        self.filters = {k: v for k, v in filters.items() if k != self.key}
+
+    @cached_property
+    def db_count(self) -> int:
+        return self.db_rows.count()
+
+    @cached_property
+    def cold_counts(self) -> List[Tuple[ColdFile, int]]:
+        """Returns the cold files, the newest month first, with their amount of rows"""
+        return [(f, f.count(self.key, self.value, self.filters)) for f in get_files(self.table)]
+
+    def count(self) -> int:
+        return self.db_count + sum(n for _, n in self.cold_counts)
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def cold_slice(self, start: int, stop: Optional[int]) -> List[dict]:
+        rows = list()
+        offset = 0
+        for f, n in self.cold_counts:
+            if stop is not None and offset >= stop:
+                break
+            if n and offset + n > start:
+                segment = f.rows(self.key, self.value, self.filters)
+                rows += segment[max(start - offset, 0) : None if stop is None else stop - offset]
+            offset += n
+        return rows
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item : item + 1][0]
+
+        start, stop = item.start or 0, item.stop
+        rows = list()
+        if start < self.db_count:
+            rows += list(self.db_rows[start : stop if stop is not None else self.db_count])
+
+        cold_start = max(start - self.db_count, 0)
+        cold_stop = None if stop is None else max(stop - self.db_count, 0)
+        if cold_stop is None or cold_stop > 0:
+            rows += self.cold_slice(cold_start, cold_stop)
+
+        return rows
@@ -0,0 +1,81 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from common.cache import get_company_version
+from core.models import Company
+
+logger = logging.getLogger(__name__)
+
+
+class CompanyInfo(NamedTuple):
+    """The fields of a company, which are needed to show or link a company"""
+
+    id: int
+    name: str
+    user_id: Optional[int]
+    isin: str
+
+    def url_data(self) -> OrderedDict:
+        """Returns the same data as the CompanyUrlSerializer"""
+        return OrderedDict([("name", self.name), ("user_id", self.user_id), ("isin", self.isin), ("id", self.id)])
+
+
+class CompanyCache:
+    """
+    In-process cache of the name, user & isin of companies by their id.
+
+    Renderers only need these fields, but ran a query for every request to get them.
+    Saving or deleting a company bumps its version in redis (see core/signals.py), so every process drops
+    its entry: an entry is only used while the company has the version it was cached with.
+    Updates without signals, e.g. QuerySet.update(), are picked up once the entry expires.
+    If redis is not available, the company is always read from the database.
+
+    Companies which do not exist are not cached, as they might be created in the meantime.
+    Authorization checks must not rely on this cache, but read the database.
+    """
+
+    timeout = 60
+
+    def __init__(self):
+        self.companies = dict()
+
+    def get(self, company_id: int) -> Optional[CompanyInfo]:
+        """Returns the company with the given id or None if it does not exist"""
+        version = get_company_version(company_id)
+        entry = self.companies.get(company_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now and version is not None and entry[1] == version:
+            return entry[2]
+
+        company = Company.objects.filter(id=company_id).values_list("id", "name", "user_id", "isin").first()
+        if company is None:
+            self.companies.pop(company_id, None)
+            return None
+
+        info = CompanyInfo(*company)
+        self.companies[company_id] = (now + self.timeout, version, info)
+        return info
+
+    def get_by_isin(self, isin: str) -> Optional[CompanyInfo]:
+        """Returns the company with the given isin or None if it does not exist"""
+        return self.get(Company.get_id_from_isin(isin))
+
+    def exists(self, isin: str) -> bool:
+        return self.get_by_isin(isin) is not None
+
+    def invalidate(self, company_id: int) -> None:
+        self.companies.pop(company_id, None)
+
+    def clear(self) -> None:
+        self.companies.clear()
+
+
+company_cache = CompanyCache()
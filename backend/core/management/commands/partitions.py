@@ -0,0 +1,68 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.partitions import (
+    FUTURE_MONTHS,
+    PARTITIONED_TABLES,
+    archive_partition,
+    create_future_partitions,
+    get_partitions,
+    hot_since,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the partitions of the trades & statements of account for the next months. "
+        "With --archive, the partitions before the given month are exported to compressed files and dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=FUTURE_MONTHS, help="Amount of months to create the partitions in advance"
+        )
+        parser.add_argument(
+            "--archive", type=str, default=None, help="Archive the partitions before this month, e.g. 2020-04"
+        )
+        parser.add_argument("--directory", type=str, default=".", help="Directory to store the archived partitions in")
+
+    def handle(self, *args, **options):
+        tables = [table for table in PARTITIONED_TABLES if is_partitioned(table)]
+        if not tables:
+            self.stdout.write("The tables are not partitioned, only postgresql supports partitions.")
+            return
+
+        if options["archive"]:
+            self.archive(tables, options["archive"], options["directory"])
+            return
+
+        for table in tables:
+            for name in create_future_partitions(table, options["months"]):
+                self.stdout.write(f"Created {name}")
+
+    def archive(self, tables, month: str, directory: str):
+        try:
+            before = datetime.datetime.strptime(month, "%Y-%m").replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            raise CommandError(f"{month} is not a month like 2020-04")
+
+        if before > hot_since():
+            raise CommandError(f"Cannot archive hot partitions, only months before {hot_since():%Y-%m} can be archived")
+
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory")
+
+        for table in tables:
+            for name, partition_month in get_partitions(table):
+                if partition_month < before:
+                    path = archive_partition(table, partition_month, directory)
+                    self.stdout.write(f"Archived {name} to {path}")
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_reserved_cash(apps, schema_editor):
+    """
+    Sets the reserved cash of every company to the value of its buy orders
+    """
+    Company = apps.get_model("core", "Company")
+    Order = apps.get_model("core", "Order")
+
+    values = (
+        Order.objects.filter(typ="Buy")
+        .values("order_by_id")
+        .annotate(s=Sum(ExpressionWrapper(F("price") * F("amount"), output_field=DecimalField())))
+    )
+    companies = [Company(id=v["order_by_id"], reserved_cash=v["s"]) for v in values]
+    Company.objects.bulk_update(companies, ["reserved_cash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_remove_order_depot_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="company",
+            name="reserved_cash",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=25),
+        ),
+        migrations.RunPython(backfill_reserved_cash, migrations.RunPython.noop),
+    ]
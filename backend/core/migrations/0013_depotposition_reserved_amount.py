@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_reserved_amount(apps, schema_editor):
+    """
+    Sets the reserved amount of every depot position to the amount of its sell orders
+    """
+    DepotPosition = apps.get_model("core", "DepotPosition")
+    Order = apps.get_model("core", "Order")
+
+    amount = (
+        Order.objects.filter(typ="Sell", order_by_id=OuterRef("depot_of_id"), order_of_id=OuterRef("company_id"))
+        .order_by()
+        .values("order_by_id")
+        .annotate(s=Sum("amount"))
+        .values("s")[:1]
+    )
+    DepotPosition.objects.update(reserved_amount=Coalesce(Subquery(amount, output_field=models.IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_company_reserved_cash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="depotposition",
+            name="reserved_amount",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reserved_amount, migrations.RunPython.noop),
+    ]
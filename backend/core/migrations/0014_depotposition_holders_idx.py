@@ -0,0 +1,17 @@
+# Generated by Django 3.0.4 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_depotposition_reserved_amount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='depotposition',
+            index=models.Index(fields=['company', '-amount', '-id'], name='depot_position_holders_idx'),
+        ),
+    ]
@@ -0,0 +1,167 @@
+import datetime
+
+from django.db import migrations
+
+TABLES = ("trade", "statement_of_account")
+
+# Amount of months the partitions are created in advance, see core/partitions.py
+FUTURE_MONTHS = 3
+
+
+def month_start(time, months=0):
+    time = time.astimezone(datetime.timezone.utc)
+    month = time.year * 12 + time.month - 1 + months
+    return datetime.datetime(month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def partition_table(cursor, table):
+    """
+    Replaces the given table with a table partitioned by the month of the created column,
+    keeping its rows, sequence, indexes and foreign keys.
+    """
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f"SELECT min(created) FROM {table}")
+    first = cursor.fetchone()[0] or datetime.datetime.now(datetime.timezone.utc)
+
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+
+    cursor.execute(f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created)")
+    cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    month = month_start(first)
+    last = month_start(datetime.datetime.now(datetime.timezone.utc), FUTURE_MONTHS)
+    while month <= last:
+        end = month_start(month, 1)
+        cursor.execute(
+            f"CREATE TABLE {table}_{month:%Y_%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [month, end]
+        )
+        month = end
+
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned")
+    cursor.execute(f"DROP TABLE {table}_unpartitioned")
+
+    # The partition key has to be part of the primary key. The primary key, indexes & foreign keys
+    # are created with their old names on the partitioned table.
+    cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created)")
+    for index in indexes:
+        cursor.execute(index)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+
+def partition_tables(apps, schema_editor):
+    """
+    Partitions the trade & statement_of_account tables by month, see core/partitions.py.
+
+    Only postgresql supports partitioned tables, other databases keep the plain tables.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        # A foreign key can only reference a partitioned table if the partition key is part of the reference.
+        # The trade of a statement or a trade history is a plain column now, deletions are still cascaded by django.
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid IN (SELECT to_regclass(t) FROM unnest(%s) AS t)",
+            [list(TABLES)],
+        )
+        for name, table in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+        for table in TABLES:
+            partition_table(cursor, table)
+
+
+def unpartition_table(cursor, table):
+    """
+    Replaces the given partitioned table with a plain table, keeping the rows of its partitions,
+    its sequence, indexes and foreign keys. The primary key is the id again.
+    """
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [table, table],
+    )
+    # Indexes of a partitioned table are created ON ONLY the table itself
+    indexes = [row[0].replace(" ON ONLY ", " ON ") for row in cursor.fetchall()]
+
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+
+    cursor.execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)")
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+    cursor.execute(f"DROP TABLE {table}_partitioned")
+
+    cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    for index in indexes:
+        cursor.execute(index)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+
+def unpartition_tables(apps, schema_editor):
+    """
+    Reverts partition_tables. Rows of archived partitions are not restored, see core/partitions.py.
+
+    The foreign keys referencing the tables are created as NOT VALID: rows may still reference
+    trades which have been archived. New rows are checked, existing ones can be validated with
+    ALTER TABLE ... VALIDATE CONSTRAINT once those references have been cleaned up.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            unpartition_table(cursor, table)
+
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if field.remote_field is None or field.related_model._meta.db_table not in TABLES:
+                    continue
+                table, column = model._meta.db_table, field.column
+                target = field.related_model._meta.db_table
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fk_{target}_id FOREIGN KEY ({column}) "
+                    f"REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED NOT VALID"
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_depotposition_holders_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
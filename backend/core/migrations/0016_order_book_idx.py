@@ -0,0 +1,17 @@
+# Generated by Django 3.0.4 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_partition_trades_statements'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_of', 'typ', 'price'], name='order_book_idx'),
+        ),
+    ]
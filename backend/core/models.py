@@ -10,9 +10,10 @@ import re
 
 from datetime import timedelta
 from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 from django.db import models, transaction
-from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Q
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -24,6 +25,30 @@ from tsg.const import CENTRALBANK
 logger = logging.getLogger(__name__)
 
 
+class CentralbankIdentity(NamedTuple):
+    id: int
+    isin: str
+
+
+# See Company.get_centralbank_identity()
+_centralbank_identity = None
+
+
+class OrderSnapshot(NamedTuple):
+    """Everything needed to validate a new order of a company, see Company.get_order_snapshot()"""
+
+    cash: Decimal
+    reserved_cash: Decimal
+    orders_count: int
+    order_of_exists: bool
+    # None if the company does not have the company of the order in its depot
+    depot_amount: Optional[int]
+    depot_reserved_amount: Optional[int]
+
+    def available_cash(self) -> Decimal:
+        return self.cash - self.reserved_cash
+
+
 class CompanyQuerySet(models.QuerySet):
     def delete(self):
         raise NotImplementedError("Cannot bulk delete companies")
@@ -57,6 +82,11 @@ class Company(models.Model):
 
     shares = models.PositiveIntegerField(default=1000000)
 
+    # The value of all buy orders of the company, which cannot be spent on anything else.
+    # Maintained by Order, OrderQuerySet, the OrderTask & the DynamicOrdersTask and
+    # reconciled by the ReservedCashTask.
+    reserved_cash = models.DecimalField(max_digits=25, decimal_places=2, default=0)
+
     class Meta:
         db_table = "company"
 
@@ -65,6 +95,29 @@ class Company(models.Model):
         """Returns the centralbank"""
         return cls.objects.get(name=CENTRALBANK)
 
+    @classmethod
+    def get_centralbank_identity(cls) -> CentralbankIdentity:
+        """
+        Returns the id & isin of the centralbank.
+
+        The centralbank is created by a migration and never changes afterwards,
+        so it is only queried once per process.
+        """
+        global _centralbank_identity
+        if _centralbank_identity is None:
+            _centralbank_identity = CentralbankIdentity(*cls.objects.values_list("id", "isin").get(name=CENTRALBANK))
+        return _centralbank_identity
+
+    @classmethod
+    def get_centralbank_id(cls) -> int:
+        return cls.get_centralbank_identity().id
+
+    @classmethod
+    def clear_centralbank_identity(cls) -> None:
+        """Forgets the id & isin of the centralbank, e.g. for tests which recreate the centralbank"""
+        global _centralbank_identity
+        _centralbank_identity = None
+
     @classmethod
     def get_id_from_isin(cls, isin: str) -> int:
         """Returns the ID from the ISIN"""
@@ -85,16 +138,88 @@ class Company(models.Model):
         """Returns the amount of bonds currently in the depot of the company"""
         return self.bond_set.count()
 
+    @classmethod
+    def change_reserved_cash(cls, changes: Dict[int, Decimal]) -> None:
+        """Adds the given values to the reserved cash of the companies given by id with a single query"""
+        companies = [cls(id=k, reserved_cash=F("reserved_cash") + v) for k, v in changes.items() if v]
+        if companies:
+            cls.objects.bulk_update(companies, ["reserved_cash"])
+
     def enough_money(self, transaction_value) -> bool:
-        """Returns True if the company has enough money for the transaction"""
-        orders_value = (
-            self.orders_by.add_value().filter(typ=Order.type_buy()).aggregate(s=Coalesce(Sum("value"), 0))["s"]
-        )
-        total = (self.cash - orders_value) - transaction_value
+        """
+        Returns True if the company has enough money for the transaction.
+
+        Inside of a transaction the row of the company stays locked until the transaction ends,
+        so concurrent orders and bonds cannot spend the same cash.
+        """
+        qs = Company.objects.filter(id=self.id)
+        if transaction.get_connection().in_atomic_block:
+            qs = qs.select_for_update()
+        cash, reserved_cash = qs.values_list("cash", "reserved_cash").get()
+
+        total = (cash - reserved_cash) - transaction_value
         if total < 0:
             logger.info(f"{self} does not have enough money, has: {total}, transaction_value: {transaction_value}")
         return total >= 0
 
+    def get_order_snapshot(self, order_of_id: Optional[int]) -> OrderSnapshot:
+        """
+        Returns the cash, open orders and the depot position of the given company with a single query.
+        Without a company only the cash and open orders are returned.
+
+        Same as enough_money(), inside of a transaction the row of the company stays locked until
+        the transaction ends. All orders of the company lock this row, so neither its cash nor its depot
+        can be offered twice by concurrent orders.
+        """
+        qs = Company.objects.filter(id=self.id)
+        if transaction.get_connection().in_atomic_block:
+            qs = qs.select_for_update(of=("self",))
+
+        orders_count = (
+            Order.objects.filter(order_by_id=OuterRef("id"))
+            .order_by()
+            .values("order_by_id")
+            .annotate(c=Count("id"))
+            .values("c")
+        )
+        # Orders only trade with the depot, never with the private depot
+        position = DepotPosition.objects.filter(depot_of_id=OuterRef("id"), company_id=order_of_id, private_depot=False)
+
+        snapshot = (
+            qs.annotate(
+                orders_count=Coalesce(Subquery(orders_count, output_field=IntegerField()), 0),
+                order_of_exists=Exists(Company.objects.filter(id=order_of_id)),
+                depot_amount=Subquery(position.values("amount")[:1]),
+                depot_reserved_amount=Subquery(position.values("reserved_amount")[:1]),
+            )
+            .values_list(*OrderSnapshot._fields)
+            .get()
+        )
+        return OrderSnapshot(*snapshot)
+
+    def get_order_snapshots(self, order_of_ids: Iterable[int]) -> Dict[int, OrderSnapshot]:
+        """
+        Same as get_order_snapshot() for orders of several companies at once
+        """
+        order_of_ids = set(order_of_ids)
+
+        snapshot = self.get_order_snapshot(None)
+        existing = set(Company.objects.filter(id__in=order_of_ids).values_list("id", flat=True))
+        positions = DepotPosition.objects.filter(
+            depot_of_id=self.id, company_id__in=order_of_ids, private_depot=False
+        ).values_list("company_id", "amount", "reserved_amount")
+        positions = {company_id: (amount, reserved_amount) for company_id, amount, reserved_amount in positions}
+
+        snapshots = dict()
+        for order_of_id in order_of_ids:
+            depot_amount, depot_reserved_amount = positions.get(order_of_id, (None, None))
+            snapshots[order_of_id] = snapshot._replace(
+                order_of_exists=order_of_id in existing,
+                depot_amount=depot_amount,
+                depot_reserved_amount=depot_reserved_amount,
+            )
+        return snapshots
+
     def bid(self) -> Order:
         """Bid is the price of the highest buy-orders"""
 
@@ -158,7 +283,21 @@ class Company(models.Model):
         if trades_count != trades_history_count:
             raise ValueError("Trade history has not been implemented for all trades")
 
-        return super().delete(using, keep_parents)
+        from core.sidebar import change_order_counts
+
+        with transaction.atomic():
+            # Orders of this company and, by the cascade, orders by this company are deleted,
+            # so they are subtracted from the order counts of the sidebar
+            counts = Order.objects.filter(Q(order_of=self) | Q(order_by=self)).aggregate(
+                buy=Count("id", filter=Q(typ=Order.type_buy())), sell=Count("id", filter=Q(typ=Order.type_sell()))
+            )
+
+            # The cascade would not release the cash other companies reserved for orders of this company
+            Order.objects.filter(order_of=self).delete()
+
+            deleted = super().delete(using, keep_parents)
+            change_order_counts(buy=-counts["buy"], sell=-counts["sell"])
+        return deleted
 
     def __str__(self):
         return self.name
@@ -208,6 +347,70 @@ class OrderQuerySet(models.QuerySet):
         """
         return self.annotate(value=ExpressionWrapper(F("price") * F("amount"), output_field=DecimalField()))
 
+    def reserved_cash_by_company(self) -> Dict[int, Decimal]:
+        """Returns the value of the buy orders in the queryset per company"""
+        values = (
+            self.filter(typ=Order.type_buy())
+            .order_by()
+            .values("order_by_id")
+            .annotate(s=Sum(ExpressionWrapper(F("price") * F("amount"), output_field=DecimalField())))
+        )
+        return {v["order_by_id"]: v["s"] for v in values}
+
+    def reserved_amount_by_position(self) -> Dict[Tuple[int, int], int]:
+        """Returns the amount of the sell orders in the queryset per depot position (depot_of_id, company_id)"""
+        values = (
+            self.filter(typ=Order.type_sell()).order_by().values("order_by_id", "order_of_id").annotate(s=Sum("amount"))
+        )
+        return {(v["order_by_id"], v["order_of_id"]): v["s"] for v in values}
+
+    def create_batch(self, orders: List[Order]) -> List[Order]:
+        """Creates the orders with a single insert and reserves their cash & shares"""
+        reserved_cash = dict()
+        reserved_amount = dict()
+        for order in orders:
+            key = (order.order_by_id, order.order_of_id)
+            reserved_cash[key[0]] = reserved_cash.get(key[0], 0) + order.get_reserved_cash()
+            reserved_amount[key] = reserved_amount.get(key, 0) + order.get_reserved_amount()
+
+        with transaction.atomic(savepoint=False):
+            orders = self.bulk_create(orders)
+            Company.change_reserved_cash(reserved_cash)
+            DepotPosition.change_reserved_amount(reserved_amount)
+        return orders
+
+    def update_amounts(self, amounts: Dict[int, int]) -> None:
+        """
+        Sets the amounts of the orders given by id after they have been partially filled and releases
+        the cash & shares reserved by the filled part. Orders which do not exist anymore are skipped.
+        """
+        orders = list(self.filter(id__in=amounts).only("typ", "price", "amount", "order_by_id", "order_of_id"))
+
+        reserved_cash = dict()
+        reserved_amount = dict()
+        for order in orders:
+            old_cash, old_amount = order.get_reserved_cash(), order.get_reserved_amount()
+            order.amount = amounts[order.id]
+
+            key = (order.order_by_id, order.order_of_id)
+            reserved_cash[key[0]] = reserved_cash.get(key[0], 0) + order.get_reserved_cash() - old_cash
+            reserved_amount[key] = reserved_amount.get(key, 0) + order.get_reserved_amount() - old_amount
+
+        with transaction.atomic(savepoint=False):
+            Order.objects.bulk_update(orders, fields=["amount"])
+            Company.change_reserved_cash(reserved_cash)
+            DepotPosition.change_reserved_amount(reserved_amount)
+
+    def delete(self):
+        """Deletes the orders and releases the cash reserved by buy orders & the shares reserved by sell orders"""
+        with transaction.atomic(savepoint=False):
+            reserved_cash = self.reserved_cash_by_company()
+            reserved_amount = self.reserved_amount_by_position()
+            deleted = super().delete()
+            Company.change_reserved_cash({k: -v for k, v in reserved_cash.items()})
+            DepotPosition.change_reserved_amount({k: -v for k, v in reserved_amount.items()})
+        return deleted
+
 
 class Order(models.Model):
     """
@@ -252,6 +455,8 @@ class Order(models.Model):
 
     class Meta:
         db_table = "order"
+        # Order books of a company, used by the matching & the crossed books check of the scheduler
+        indexes = [models.Index(fields=["order_of", "typ", "price"], name="order_book_idx")]
 
     @classmethod
     def type_buy(cls) -> str:
@@ -264,6 +469,38 @@ class Order(models.Model):
     def get_value(self):
         return self.price * self.amount
 
+    def get_reserved_cash(self) -> Decimal:
+        """Returns the cash the order reserves of the company which created it"""
+        return self.get_value() if self.typ == Order.type_buy() else Decimal(0)
+
+    def get_reserved_amount(self) -> int:
+        """Returns the amount of shares the order reserves of the depot of the company which created it"""
+        return self.amount if self.typ == Order.type_sell() else 0
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if self._state.adding:
+                cash = self.get_reserved_cash()
+                amount = self.get_reserved_amount()
+            else:
+                old = Order.objects.only("typ", "price", "amount").get(id=self.id)
+                cash = self.get_reserved_cash() - old.get_reserved_cash()
+                amount = self.get_reserved_amount() - old.get_reserved_amount()
+
+            super().save(*args, **kwargs)
+            Company.change_reserved_cash({self.order_by_id: cash})
+            DepotPosition.change_reserved_amount({(self.order_by_id, self.order_of_id): amount})
+
+    def delete(self, using=None, keep_parents=False):
+        cash = {self.order_by_id: -self.get_reserved_cash()}
+        amount = {(self.order_by_id, self.order_of_id): -self.get_reserved_amount()}
+
+        with transaction.atomic(savepoint=False):
+            deleted = super().delete(using, keep_parents)
+            Company.change_reserved_cash(cash)
+            DepotPosition.change_reserved_amount(amount)
+        return deleted
+
     def __str__(self):
         return f"Order by:{self.order_by}, Order of: {self.order_of}, Amount: {self.amount}, Price: {self.price}"
 
@@ -386,15 +623,33 @@ class DepotPosition(models.Model):
 
     private_depot = models.BooleanField(default=False)
 
+    # The amount of shares of all sell orders of the depot, which cannot be sold again.
+    # Maintained like Company.reserved_cash and reconciled by the ReservedCashTask.
+    reserved_amount = models.PositiveIntegerField(default=0)
+
     class Meta:
         # Each company should have another company only once in his depot.
         # Company A should not be able to have two positions of Company B in his depot.
         unique_together = ["company", "depot_of", "private_depot"]
         db_table = "depot_position"
+        # Shareholders of a company, largest first
+        indexes = [models.Index(fields=["company", "-amount", "-id"], name="depot_position_holders_idx")]
 
     def __str__(self):
         return f"Depot: {self.depot_of}, Share: {self.company}"
 
+    @classmethod
+    def change_reserved_amount(cls, changes: Dict[Tuple[int, int], int]) -> None:
+        """
+        Adds the given amounts to the reserved amount of the positions given by (depot_of_id, company_id).
+        Sell orders are only placed for the depot, so the positions of the private depot are never reserved.
+        """
+        for (depot_of_id, company_id), amount in changes.items():
+            if amount:
+                cls.objects.filter(depot_of_id=depot_of_id, company_id=company_id, private_depot=False).update(
+                    reserved_amount=F("reserved_amount") + amount
+                )
+
 
 class InterestRate(models.Model):
     """
@@ -445,10 +700,7 @@ class Trade(models.Model):
     """
     Model to store a Trade (=seller & buyer of a share)
 
-    TODO: We should look forward to implementing multiple tables for this model.
-        After days have passed move all the data to another table.
-        So for each day we know in which table to check for the data:
-        See here for more information: https://stackoverflow.com/questions/5036357/single-django-model-multiple-tables
+    On postgresql the table is partitioned by the month a trade has been created in, see core/partitions.py
     """
 
     id = models.BigAutoField(primary_key=True, editable=False)
@@ -576,6 +828,8 @@ class StatementOfAccount(models.Model):
     Transactions are for instance:
         - buying/selling shares
         - buying bonds & getting paid back
+
+    Same as the trades, the table is partitioned by month, see core/partitions.py
     """
 
     TYPES = [("Order", "Order"), ("Bond", "Bond")]
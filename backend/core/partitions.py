@@ -0,0 +1,164 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import datetime
+import gzip
+import logging
+import os
+from typing import List, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import cold_archive
+
+logger = logging.getLogger(__name__)
+
+# The trade and statement_of_account tables are partitioned by the month they have been created in,
+# see core/migrations/0015_partition_trades_statements.py. Every month has its own partition, named
+# <table>_<year>_<month>. Rows outside of the existing months are stored in the partition <table>_default.
+#
+# The list views only read the hot partitions, i.e. the last HOT_MONTHS months, unless the history is requested.
+# Old partitions can be archived: they are exported to a compressed csv file and dropped.
+# Both is done by the partitions command, see core/management/commands/partitions.py.
+#
+# Before a partition is dropped, its rows are also written to the cold archive, see core/cold_archive.py.
+# Statements are archived before the trades, as the cold rows of a statement contain its trade.
+PARTITIONED_TABLES = ("statement_of_account", "trade")
+
+# Amount of months, including the current one, the list views show by default
+HOT_MONTHS = 3
+
+# Amount of months the partitions are created in advance
+FUTURE_MONTHS = 3
+
+
+def is_partitioned(table: str) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+        return cursor.fetchone() is not None
+
+
+def month_start(time: datetime.datetime, months: int = 0) -> datetime.datetime:
+    """Returns the start of the month of the given time in UTC, moved by the given amount of months"""
+    time = time.astimezone(datetime.timezone.utc)
+    month = time.year * 12 + time.month - 1 + months
+    return datetime.datetime(month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def hot_since() -> datetime.datetime:
+    """Returns the time since which rows are in the hot partitions"""
+    return month_start(timezone.now(), -(HOT_MONTHS - 1))
+
+
+def partition_name(table: str, month: datetime.datetime) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def get_partitions(table: str) -> List[Tuple[str, datetime.datetime]]:
+    """Returns the name and the month of the monthly partitions of the given table, ordered by the month"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = list()
+    for name in names:
+        try:
+            month = datetime.datetime.strptime(name[len(table) + 1 :], "%Y_%m").replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            # the default partition
+            continue
+        partitions.append((name, month))
+
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(table: str, month: datetime.datetime) -> bool:
+    """
+    Creates the partition of the given month if it does not exist yet and returns whether it has been created.
+
+    Rows of the month, which have been stored in the default partition so far, are moved to the new partition.
+    """
+    name = partition_name(table, month)
+    if name in dict(get_partitions(table)):
+        return False
+
+    start, end = month, month_start(month, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {name}_moved AS "
+            f"WITH moved AS (DELETE FROM {table}_default WHERE created >= %s AND created < %s RETURNING *) "
+            f"SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {name}_moved")
+        moved = cursor.rowcount
+        cursor.execute(f"DROP TABLE {name}_moved")
+
+    logger.info(f"Created partition {name}, moved {moved} rows from the default partition")
+    return True
+
+
+def create_future_partitions(table: str, months: int = FUTURE_MONTHS) -> List[str]:
+    """Creates the partitions of the current and the next months. Returns the names of the created partitions"""
+    now = timezone.now()
+    created = list()
+    for i in range(months + 1):
+        month = month_start(now, i)
+        if create_partition(table, month):
+            created.append(partition_name(table, month))
+    return created
+
+
+def archive_partition(table: str, month: datetime.datetime, directory: str) -> str:
+    """
+    Exports the partition of the given month to <directory>/<partition>.csv.gz and the cold archive,
+    detaches and drops it. Returns the path of the exported file.
+    """
+    name = partition_name(table, month)
+    path = os.path.join(directory, f"{name}.csv.gz")
+
+    # The cold file is written to a temporary file and only moved to the cold archive once the partition
+    # has been dropped, otherwise the rows would be served from the partition and the cold file.
+    cold_path = cold_archive.get_path(table, month)
+    temporary_path = f"{cold_path}.tmp"
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            if cold_archive.write(table, month, month_start(month, 1), temporary_path) is not None:
+                transaction.on_commit(lambda: os.replace(temporary_path, cold_path))
+
+            with gzip.open(path, "wt") as f:
+                cursor.cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+
+            if table == "trade":
+                # The rows referencing a trade have no foreign key anymore, see the migration. Dropping the
+                # partition does the same as the on_delete of the models: the history is deleted, the trade
+                # of a statement is set to null. Both are part of the cold rows written above.
+                cursor.execute(f"DELETE FROM trade_history WHERE trade_id IN (SELECT id FROM {name})")
+                cursor.execute(
+                    f"UPDATE statement_of_account SET trade_id = NULL WHERE trade_id IN (SELECT id FROM {name})"
+                )
+
+            # A partition cannot be dropped while checks of deferred foreign keys of its rows are pending
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+    except Exception:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    logger.info(f"Archived partition {name} to {path}")
+    return path
@@ -5,18 +5,22 @@ license that can be found in the LICENSE.txt file.
 """
 
 import logging
+from collections import OrderedDict
 from decimal import Decimal
 
-from django.db.models import F
+from django.db.models import DecimalField, ExpressionWrapper, F
 from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.fields import DateTimeField
 
-from core.models import Bond, Company, DepotPosition, InterestRate, Order, StatementOfAccount, Trade
+from common.serializers import ValuesSerializer
+from core.models import Bond, Company, DepotPosition, InterestRate, Order, OrderSnapshot, StatementOfAccount, Trade
+from core.sidebar import change_order_count, change_order_counts
 from periodic_tasks.orders import check_orders_single_company
+from periodic_tasks.scheduler import mark_dirty
 from stats.serializers import KeyFiguresSerializer
-from tsg.const import DATETIME_FORMAT, START_CASH
+from tsg.const import DATETIME_FORMAT, MAXIMUM_ORDER_BATCH, START_CASH
 from users.serializers import UserSerializer
 
 logger = logging.getLogger(__name__)
@@ -58,16 +62,6 @@ class CompanyUrlSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class CompanySidebarSerializer(serializers.ModelSerializer):
-
-    share_price = serializers.DecimalField(source="keyfigures.share_price", max_digits=40, decimal_places=2)
-
-    class Meta:
-        model = Company
-        fields = ("name", "isin", "id", "share_price")
-        read_only_fields = fields
-
-
 class FirstCompanyCreationSerializer(serializers.ModelSerializer):
     """
     Serializer for creating the first company of a user
@@ -150,6 +144,7 @@ class BondSerializer(serializers.ModelSerializer):
             Company.objects.filter(id=company_id).update(cash=F("cash") - value)
             bond = Bond.objects.create(company_id=company_id, value=value, rate=rate, runtime=runtime)
 
+        mark_dirty(company_id)
         return bond
 
     def validate_runtime(self, value):
@@ -223,74 +218,85 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def validate_order_of_isin(self, value: str) -> str:
         """
-        Validate that the order_of isin is valid. It must be an existing company and not the same as the
-        buying company.
+        Validate that the order_of isin is valid. It must not be the buying company nor the centralbank.
+        Whether the company exists is validated with the rest of the order in validate().
         """
         if value == self.company.isin:
             raise serializers.ValidationError(_("You cannot create an order for your own company!"))
 
-        if not Company.objects.filter(id=Company.get_id_from_isin(value)).exists():
+        order_of_id = Company.get_id_from_isin(value)
+        if order_of_id == -1:
             raise serializers.ValidationError(_("A company with the given isin does not exist"))
 
-        if Company.get_centralbank().isin == value:
+        if order_of_id == Company.get_centralbank_id():
             raise serializers.ValidationError(_("You cannot place an order on the Centralbank"))
 
         return value
 
-    def validate_enough_money(self, value) -> None:
+    def validate_enough_money(self, value, snapshot: OrderSnapshot) -> None:
         """
         Validate that the buying company has enough money
         """
-        company = self.company
-
-        if company.enough_money(transaction_value=value) is False:
+        total = snapshot.available_cash() - value
+        if total < 0:
+            logger.info(f"{self.company} does not have enough money, has: {total}, transaction_value: {value}")
             raise serializers.ValidationError(_("You do not have enough Cash"))
 
-    def validate_sell_order(self, amount: int, order_of_id: int) -> None:
+    def validate_sell_order(self, amount: int, snapshot: OrderSnapshot) -> None:
         """
-        Validate that the selling company has the amount of shares in his depot
+        Validate that the selling company has the amount of shares in his depot,
+        which are not already offered by his other sell orders.
         """
-        try:
-            d = DepotPosition.objects.get(depot_of=self.company, company_id=order_of_id)
-        except DepotPosition.DoesNotExist:
-            logger.exception(f"{self.company} does not have {order_of_id} in his depot")
+        if snapshot.depot_amount is None:
+            logger.info(f"{self.company} does not have the company of the order in his depot")
             raise serializers.ValidationError({"order_of_isin": "You do not have this company in your depot"})
 
-        if d.amount < amount:
+        depot_amount, reserved_amount = snapshot.depot_amount, snapshot.depot_reserved_amount
+        if reserved_amount and depot_amount - reserved_amount < amount:
             raise serializers.ValidationError(
-                {"amount": f"You only have {d.amount} shares in your depot but want to sell {amount}!"}
+                {
+                    "amount": f"You only have {depot_amount} shares in your depot, {reserved_amount} of them "
+                    f"are already in sell orders, but want to sell {amount}!"
+                }
             )
 
-    def validate(self, data):
-        order_by_isin = self.company.isin
-        order_of_isin = data.get("order_of_isin")
-
-        self.validate_order_of_isin(order_of_isin)
+        if depot_amount < amount:
+            raise serializers.ValidationError(
+                {"amount": f"You only have {depot_amount} shares in your depot but want to sell {amount}!"}
+            )
 
-        order_by_id = Company.get_id_from_isin(order_by_isin)
-        order_of_id = Company.get_id_from_isin(order_of_isin)
+    def validate(self, data):
+        order_of_id = Company.get_id_from_isin(data.get("order_of_isin"))
+
+        # Everything else is validated against a single query (see Company.get_order_snapshot)
+        # or the snapshot of the batch the order is part of
+        batch = self.context.get("batch")
+        if batch is not None:
+            snapshot = batch.get_snapshot(order_of_id)
+        else:
+            snapshot = self.company.get_order_snapshot(order_of_id)
+        if not snapshot.order_of_exists:
+            raise serializers.ValidationError({"order_of_isin": _("A company with the given isin does not exist")})
 
         price = data.get("price")
         amount = data.get("amount")
 
         typ = data.get("typ")
         if typ == Order.type_sell():
-            self.validate_sell_order(amount, order_of_id)
+            self.validate_sell_order(amount, snapshot)
 
         value = price * amount
-        self.validate_enough_money(value=value)
+        self.validate_enough_money(value, snapshot)
 
-        if Order.objects.filter(order_by_id=order_by_id).count() > 100:
+        if snapshot.orders_count > 100:
             raise serializers.ValidationError("You already have more than 100 orders!")
 
+        data["order_of_id"] = order_of_id
         return data
 
     def create(self, validated_data) -> Order:
-        order_by_isin = self.company.isin
-        order_of_isin = validated_data.get("order_of_isin")
-
-        order_by_id = Company.get_id_from_isin(order_by_isin)
-        order_of_id = Company.get_id_from_isin(order_of_isin)
+        order_by_id = self.company.id
+        order_of_id = validated_data.get("order_of_id")
 
         price = validated_data.get("price")
         amount = validated_data.get("amount")
@@ -300,11 +306,147 @@ class OrderSerializer(serializers.ModelSerializer):
             order_by_id=order_by_id, order_of_id=order_of_id, amount=amount, price=price, typ=typ
         )
 
-        check_orders_single_company.delay(order_of_id)
+        change_order_count(typ, 1)
+        mark_dirty(order_by_id, order_of_id)
+        transaction.on_commit(lambda: check_orders_single_company.delay(order_of_id))
 
         return order
 
 
+class OrderBatch:
+    """
+    Locked snapshot of the cash & depot of a company (see Company.get_order_snapshots),
+    which takes the orders already accepted in the same batch into account.
+    """
+
+    def __init__(self, company: Company, order_of_ids):
+        self.company = company
+        self.snapshots = company.get_order_snapshots(order_of_ids)
+        self.orders = list()
+        self.reserved_cash = Decimal(0)
+        self.reserved_amount = dict()
+
+    def get_snapshot(self, order_of_id: int) -> OrderSnapshot:
+        if order_of_id not in self.snapshots:
+            # Only the companies of the batch are loaded upfront
+            self.snapshots.update(self.company.get_order_snapshots([order_of_id]))
+        snapshot = self.snapshots[order_of_id]
+
+        depot_reserved_amount = snapshot.depot_reserved_amount
+        if depot_reserved_amount is not None:
+            depot_reserved_amount += self.reserved_amount.get(order_of_id, 0)
+
+        return snapshot._replace(
+            reserved_cash=snapshot.reserved_cash + self.reserved_cash,
+            orders_count=snapshot.orders_count + len(self.orders),
+            depot_reserved_amount=depot_reserved_amount,
+        )
+
+    def add(self, order: Order) -> None:
+        self.orders.append(order)
+        self.reserved_cash += order.get_reserved_cash()
+        self.reserved_amount[order.order_of_id] = (
+            self.reserved_amount.get(order.order_of_id, 0) + order.get_reserved_amount()
+        )
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    """
+    Creates & cancels several orders of the company of the user at once.
+
+    Cancellations are processed first. Every order is then validated like a single order by the OrderSerializer,
+    but against one locked snapshot of the company, which includes the orders before it in the same batch.
+    Invalid orders and unknown cancellations do not fail the batch, instead there is a result for every item.
+    """
+
+    orders = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    cancel = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, data):
+        if not Company.objects.filter(user=self.context["request"].user).exists():
+            raise serializers.ValidationError(_("You need a company to create orders"))
+
+        size = len(data["orders"]) + len(data["cancel"])
+        if size == 0:
+            raise serializers.ValidationError(_("The batch does not contain any orders or cancellations"))
+
+        if size > MAXIMUM_ORDER_BATCH:
+            raise serializers.ValidationError(
+                _("A batch can contain at most %s orders and cancellations") % MAXIMUM_ORDER_BATCH
+            )
+        return data
+
+    def create(self, validated_data) -> dict:
+        company = self.context["request"].user.company
+
+        cancelled = self.cancel_orders(company, validated_data["cancel"])
+        created = self.create_orders(company, validated_data["orders"])
+        mark_dirty(company.id, *{order.order_of_id for order in created if isinstance(order, Order)})
+
+        return {
+            "orders": [{"status": 201, "id": r.id} if isinstance(r, Order) else r for r in created],
+            "cancel": cancelled,
+        }
+
+    def cancel_orders(self, company: Company, order_ids: list) -> list:
+        orders = Order.objects.filter(id__in=order_ids, order_by_id=company.id)
+        types = dict(orders.values_list("id", "typ"))
+
+        if types:
+            orders.delete()
+            buys = sum(1 for typ in types.values() if typ == Order.type_buy())
+            change_order_counts(buy=-buys, sell=-(len(types) - buys))
+
+        return [{"status": 204 if order_id in types else 404, "id": order_id} for order_id in order_ids]
+
+    def create_orders(self, company: Company, items: list) -> list:
+        """Returns the created order or the errors for every item"""
+        if not items:
+            return list()
+
+        # Same as the field validation of the isin, which trims the value
+        order_of_ids = {Company.get_id_from_isin(str(item.get("order_of_isin", "")).strip()) for item in items}
+        batch = OrderBatch(company, order_of_ids)
+        context = {**self.context, "batch": batch}
+
+        results = list()
+        for item in items:
+            serializer = OrderSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                results.append({"status": 400, "errors": serializer.errors})
+                continue
+
+            data = serializer.validated_data
+            order = Order(
+                order_by_id=company.id,
+                order_of_id=data["order_of_id"],
+                price=data["price"],
+                amount=data["amount"],
+                typ=data["typ"],
+            )
+            batch.add(order)
+            results.append(order)
+
+        orders = Order.objects.create_batch(batch.orders)
+
+        buys = sum(1 for order in orders if order.typ == Order.type_buy())
+        change_order_counts(buy=buys, sell=len(orders) - buys)
+
+        # A single matching per company, no matter how many of its orders are in the batch
+        affected = {order.order_of_id for order in orders}
+
+        def check_orders():
+            for order_of_id in affected:
+                check_orders_single_company.delay(order_of_id)
+
+        transaction.on_commit(check_orders)
+
+        return results
+
+    def to_representation(self, instance):
+        return instance
+
+
 class InterestRateSerializer(serializers.ModelSerializer):
     class Meta:
         model = InterestRate
@@ -398,7 +540,24 @@ class TradeSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        user = self.context["request"].user
+
+        # if it has a tradehistory instance
+        # then one of the companies got deleted
+        names = None
+        if hasattr(instance, "tradehistory"):
+            h = instance.tradehistory
+            names = (h.buyer_name, h.seller_name, h.company_name)
+
+        return self.hide_private_depots(data, self.context["request"].user, names)
+
+    @staticmethod
+    def hide_private_depots(data, user, names) -> dict:
+        """
+        Removes the buyer/seller who traded with their private depot and adds the history.
+
+        names are the buyer, seller & company name of the trade history or None if the trade has no history.
+        Shared with TradeValuesSerializer.
+        """
         anonymous = user.is_anonymous
 
         # We do not want to pass the data about users
@@ -414,19 +573,106 @@ class TradeSerializer(serializers.ModelSerializer):
 
         history = dict()
 
-        # if it has a tradehistory instance
-        # then one of the companies got deleted
-        if hasattr(instance, "tradehistory"):
-            h = instance.tradehistory
+        if names is not None:
+            buyer_name, seller_name, company_name = names
 
             # we could discuss if we make the private depots public if the
             # company gets deleted
             if not data["buyer_pd"]:
-                history["buyer_name"] = h.buyer_name
+                history["buyer_name"] = buyer_name
             if not data["seller_pd"]:
-                history["seller_name"] = h.seller_name
-            history["company_name"] = h.company_name
+                history["seller_name"] = seller_name
+            history["company_name"] = company_name
 
         data["history"] = history
 
         return data
+
+
+class TradeValuesSerializer(ValuesSerializer):
+    """
+    Serializes trades from .values() rows, see TradeSerializer
+    """
+
+    serializer_class = TradeSerializer
+    extra_columns = (
+        "tradehistory__id",
+        "tradehistory__buyer_name",
+        "tradehistory__seller_name",
+        "tradehistory__company_name",
+    )
+
+    def __init__(self, context: dict = None, prefix: str = ""):
+        super().__init__(context, prefix)
+        self.history_columns = [f"{prefix}{column}" for column in self.extra_columns]
+
+    def to_representation(self, row: dict) -> OrderedDict:
+        data = super().to_representation(row)
+
+        history_id, *names = [row[column] for column in self.history_columns]
+        names = names if history_id is not None else None
+
+        return TradeSerializer.hide_private_depots(data, self.context["request"].user, names)
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    """
+    Serializes orders from .values() rows, see OrderSerializer
+    """
+
+    serializer_class = OrderSerializer
+
+    # OrderSerializer.to_representation() compares the user_id of order_by with the user object,
+    # so the creator of an order is never returned
+    exclude = ("order_by",)
+
+
+class StatementOfAccountValuesSerializer(ValuesSerializer):
+    """
+    Serializes statements of account from .values() rows including their trade, see StatementOfAccountSerializer
+    """
+
+    serializer_class = StatementOfAccountSerializer
+
+    # StatementOfAccountSerializer sets the value of the trade before serializing it
+    expressions = {
+        "trade__value": ExpressionWrapper(F("trade__price") * F("trade__amount"), output_field=DecimalField())
+    }
+
+    def __init__(self, context: dict = None, prefix: str = ""):
+        super().__init__(context, prefix)
+        self.trade = TradeValuesSerializer(self.context, prefix=f"{prefix}trade__")
+        self.columns += [f"{prefix}trade_id"] + self.trade.columns
+
+    def to_representation(self, row: dict) -> OrderedDict:
+        data = super().to_representation(row)
+
+        if row[f"{self.prefix}typ"] == "Order" and row[f"{self.prefix}trade_id"] is not None:
+            data["trade"] = self.trade.to_representation(row)
+
+        return data
+
+
+class DepotPositionValuesSerializer(ValuesSerializer):
+    """
+    Serializes depot positions from .values() rows, see DepotPositionSerializer
+    """
+
+    serializer_class = DepotPositionSerializer
+
+
+class ShareholderValuesSerializer(ValuesSerializer):
+    """
+    Serializes shareholders from .values() rows, see ShareholderSerializer
+    """
+
+    serializer_class = ShareholderSerializer
+
+    # needed for the percentage, see core/shareholders.py
+    extra_columns = ("company_id", "company__shares")
+
+    def to_representation(self, row: dict) -> OrderedDict:
+        data = super().to_representation(row)
+        if data["private_depot"]:
+            del data["depot_of"]
+        return data
@@ -0,0 +1,95 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import json
+import logging
+from decimal import Decimal
+from typing import Dict, List
+
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import DepotPosition
+from core.serializers import ShareholderValuesSerializer
+from tsg.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Hash with the largest shareholders of every company by company id, rebuilt every tick by the KeyFiguresTask
+TOP_SHAREHOLDERS_KEY = "tsg:shareholders:top"
+
+# Amount of shareholders stored per company
+TOP_SHAREHOLDERS = 10
+
+# Only shareholders with at most this percentage of a company count to its free float
+FREE_FLOAT_MAX_PERCENTAGE = 20
+
+
+def build_shareholders() -> Dict[int, Decimal]:
+    """
+    Stores the largest shareholders of every company with their percentage in redis and
+    returns the free float of every company which has shareholders.
+
+    Both are computed in a single pass over all depot positions, ordered by the index on (company, -amount, -id).
+    For an explanation of the free float see KeyFiguresBase.free_float.
+
+    The shareholders are stored once the current transaction, i.e. the one of the key figures, has been committed.
+    """
+    serializer = ShareholderValuesSerializer()
+    positions = serializer.rows(DepotPosition.objects.order_by("company_id", "-amount", "-id"))
+
+    free_floats = dict()
+    top = dict()
+    for row in positions.iterator():
+        company_id = row["company_id"]
+        shares = row["company__shares"]
+
+        # Same as DepotPosition.add_percentage(), the database divides integers
+        percentage = row["amount"] * 100 // shares
+        if percentage <= FREE_FLOAT_MAX_PERCENTAGE:
+            free_floats[company_id] = free_floats.get(company_id, 0) + percentage
+
+        holders = top.setdefault(company_id, list())
+        if len(holders) < TOP_SHAREHOLDERS:
+            holders.append(shareholder_data(serializer, row))
+
+    mapping = {k: json.dumps(v, cls=JSONEncoder) for k, v in top.items()}
+
+    def store():
+        pipe = redis_client.pipeline()
+        pipe.delete(TOP_SHAREHOLDERS_KEY)
+        if mapping:
+            pipe.hset(TOP_SHAREHOLDERS_KEY, mapping=mapping)
+        pipe.execute()
+        logger.info(f"Stored the top shareholders of {len(mapping)} companies")
+
+    transaction.on_commit(store)
+    return {k: Decimal(v) for k, v in free_floats.items()}
+
+
+def shareholder_data(serializer: ShareholderValuesSerializer, row: dict) -> dict:
+    data = serializer.to_representation(row)
+    data["percentage"] = (Decimal(row["amount"] * 100) / row["company__shares"]).quantize(Decimal("0.01"))
+    return data
+
+
+def get_top_shareholders(company_id: int) -> List[dict]:
+    """
+    Returns the largest shareholders of the given company.
+
+    Companies, which did not have shareholders during the last build, are queried.
+    """
+    data = redis_client.hget(TOP_SHAREHOLDERS_KEY, company_id)
+    if data is not None:
+        return json.loads(data)
+
+    serializer = ShareholderValuesSerializer()
+    positions = DepotPosition.objects.filter(company_id=company_id).order_by("-amount", "-id")
+    return [shareholder_data(serializer, row) for row in serializer.rows(positions)[:TOP_SHAREHOLDERS]]
+
+
+def clear_shareholders() -> None:
+    redis_client.delete(TOP_SHAREHOLDERS_KEY)
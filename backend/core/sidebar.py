@@ -0,0 +1,110 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import Company, InterestRate, Order
+from tsg.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Newest companies, the latest bond rate and the amount of companies.
+# Rebuilt by the periodic jobs and when a company has been created.
+SIDEBAR_KEY = "tsg:sidebar"
+
+# Hash with the amount of buy & sell orders, maintained on every insert, delete & match of orders
+ORDER_COUNTS_KEY = "tsg:sidebar:orders"
+
+# Only change the order counts if they have been seeded, otherwise the next read seeds them from the database
+CHANGE_ORDER_COUNTS_SCRIPT = redis_client.register_script(
+    """
+    if redis.call("exists", KEYS[1]) == 1 then
+        redis.call("hincrby", KEYS[1], "buy_orders_count", ARGV[1])
+        redis.call("hincrby", KEYS[1], "sell_orders_count", ARGV[2])
+    end
+    """
+)
+
+
+def build_sidebar() -> dict:
+    """
+    Builds the sidebar from the database and stores it in redis
+    """
+    companies = Company.objects.order_by("-id").values("name", "isin", "id", share_price=F("keyfigures__share_price"))[
+        :5
+    ]
+
+    data = {
+        "companies": list(companies),
+        "bond_rate": InterestRate.get_latest_rate(),
+        "companies_count": Company.objects.count(),
+    }
+
+    # Store the data the same way it would have been rendered
+    data = json.loads(json.dumps(data, cls=JSONEncoder))
+    redis_client.set(SIDEBAR_KEY, json.dumps(data))
+    return data
+
+
+def seed_order_counts() -> dict:
+    """
+    Counts the buy & sell orders in the database and stores the counts in redis
+    """
+    counts = Order.objects.aggregate(
+        sell_orders_count=Count("id", filter=Q(typ=Order.type_sell())),
+        buy_orders_count=Count("id", filter=Q(typ=Order.type_buy())),
+    )
+    redis_client.hset(ORDER_COUNTS_KEY, mapping=counts)
+    return counts
+
+
+def change_order_counts(buy: int = 0, sell: int = 0) -> None:
+    """
+    Adds the given amounts to the order counts after the current transaction has been committed
+    """
+    if buy or sell:
+        transaction.on_commit(lambda: CHANGE_ORDER_COUNTS_SCRIPT(keys=[ORDER_COUNTS_KEY], args=[buy, sell]))
+
+
+def change_order_count(typ: str, amount: int) -> None:
+    """Changes the count of the given order type (see Order.TYPES)"""
+    if typ == Order.type_buy():
+        change_order_counts(buy=amount)
+    else:
+        change_order_counts(sell=amount)
+
+
+def get_sidebar() -> dict:
+    """
+    Returns the sidebar with a single round trip to redis.
+
+    The database is only queried if the sidebar has not been built or the order counts have not been seeded yet.
+    """
+    pipe = redis_client.pipeline()
+    pipe.get(SIDEBAR_KEY)
+    pipe.hgetall(ORDER_COUNTS_KEY)
+    sidebar, counts = pipe.execute()
+
+    data = json.loads(sidebar) if sidebar else build_sidebar()
+
+    if counts:
+        counts = {k.decode(): int(v) for k, v in counts.items()}
+    else:
+        counts = seed_order_counts()
+
+    data["buy_orders_count"] = counts["buy_orders_count"]
+    data["sell_orders_count"] = counts["sell_orders_count"]
+    return data
+
+
+def clear_sidebar() -> None:
+    """Removes the sidebar and the order counts, so they will be rebuilt with the next read"""
+    redis_client.delete(SIDEBAR_KEY, ORDER_COUNTS_KEY)
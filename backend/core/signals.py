@@ -7,10 +7,14 @@ license that can be found in the LICENSE.txt file.
 import logging
 
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 
-from core.models import Activity, DepotPosition, Company
-from stats.models import CompanyVolume, HistoryCompanyData, KeyFigures, PastKeyFigures
+from common.cache import bump_company_versions
+from core.company_cache import company_cache
+from core.sidebar import build_sidebar
+from core.models import Company
+from stats.models import KeyFigures
 from tsg.const import CENTRALBANK
 from users.models import Profile
 
@@ -20,10 +24,21 @@ logger = logging.getLogger(__name__)
 def create_models_new_company(sender, instance, created, **kwargs):
     """
     Signal to create models upon company creation
+
+    The models are looked up in the app registry of the company. The migration creating the centralbank
+    (core/migrations/0009_create_centralbank.py) calls this signal with a company of its historical models,
+    so the rows are written with the columns the tables had at that migration.
     """
 
     if created:
         company = instance
+        apps = company._meta.apps
+        Activity = apps.get_model("core", "Activity")
+        DepotPosition = apps.get_model("core", "DepotPosition")
+        CompanyVolume = apps.get_model("stats", "CompanyVolume")
+        HistoryCompanyData = apps.get_model("stats", "HistoryCompanyData")
+        KeyFigures = apps.get_model("stats", "KeyFigures")
+        PastKeyFigures = apps.get_model("stats", "PastKeyFigures")
 
         logger.info(
             f"Creating new objects for the new company {company}, cash: {company.cash}, shares: {company.shares}"
@@ -40,7 +55,9 @@ def create_models_new_company(sender, instance, created, **kwargs):
             CompanyVolume.objects.create(company_id=company.id, day=time)
 
             if company.name != CENTRALBANK:
-                DepotPosition.objects.create(depot_of=Company.get_centralbank(), company=company, amount=company.shares)
+                DepotPosition.objects.create(
+                    depot_of_id=Company.get_centralbank_id(), company=company, amount=company.shares
+                )
 
             book_value = company.cash
             share_price = company.cash / company.shares
@@ -55,7 +72,18 @@ def create_models_new_company(sender, instance, created, **kwargs):
                 share_price=share_price,
             )
 
-            PastKeyFigures.past_from_current_key_figure(k).save()
+            # Same as PastKeyFigures.past_from_current_key_figure, which historical models do not have
+            PastKeyFigures.objects.create(
+                company_id=company.id,
+                shares=company.shares,
+                day=time,
+                book_value=k.book_value,
+                activity=k.activity,
+                cdgr=k.cdgr,
+                free_float=k.free_float,
+                ttoc=k.ttoc,
+                share_price=k.share_price,
+            )
 
             # set isin
             _id = company.id
@@ -77,3 +105,45 @@ def create_models_new_company(sender, instance, created, **kwargs):
 
                 p.create_default_logo()
                 p.save()
+
+
+def add_bond_value(sender, instance, created, **kwargs):
+    """
+    Signal to add a bought bond to the liquidity of the company until the next run of the KeyFiguresTask
+    """
+    if created:
+        KeyFigures.objects.filter(company_id=instance.company_id).update(bond_value=F("bond_value") + instance.value)
+
+
+def invalidate_company_responses(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached responses and company cache entries of a company
+    after it has been changed, for instance its name, or deleted
+    """
+    transaction.on_commit(lambda: bump_company_versions(instance.id))
+
+
+def invalidate_company_cache(sender, instance, **kwargs):
+    """
+    Signal to remove a renamed or deleted company from the company cache of this process right away,
+    other processes drop it once its version has been bumped (see invalidate_company_responses)
+    """
+    company_cache.invalidate(instance.id)
+    # Another request might have cached the old state before the transaction got committed
+    transaction.on_commit(lambda: company_cache.invalidate(instance.id))
+
+
+def invalidate_profile_company_responses(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached responses of the companies of a user after the profile, and so the logo, changed
+    """
+    company_ids = list(Company.objects.filter(user_id=instance.user_id).values_list("id", flat=True))
+    transaction.on_commit(lambda: bump_company_versions(*company_ids))
+
+
+def rebuild_sidebar(sender, instance, created, **kwargs):
+    """
+    Signal to show a new company in the sidebar right away
+    """
+    if created:
+        transaction.on_commit(build_sidebar)
@@ -0,0 +1,171 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core import cold_archive
+from core.models import Company, StatementOfAccount, Trade
+from core.partitions import archive_partition, create_partition, get_partitions, month_start, partition_name
+
+
+def run_on_commit(fn):
+    fn()
+
+
+class ColdArchiveTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings = override_settings(COLD_ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        cold_archive._files.clear()
+        self.addCleanup(cold_archive._files.clear)
+
+        self.month = month_start(timezone.now(), -12)
+        self.old_trade, self.old_statement = self.trade(self.month, price="2.50")
+        self.trade_, self.statement = self.trade(timezone.now(), price=3)
+
+    def trade(self, created, price):
+        trade = Trade.objects.create(buyer=self.centralbank, seller=self.company, company=self.company, price=price)
+        statement = StatementOfAccount.objects.create(
+            company=self.company, typ="Order", value=trade.get_value(), amount=1, received=True, trade=trade
+        )
+        Trade.objects.filter(id=trade.id).update(created=created)
+        StatementOfAccount.objects.filter(id=statement.id).update(created=created)
+        return trade, statement
+
+    def archive(self):
+        for table in ["statement_of_account", "trade"]:
+            create_partition(table, self.month)
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch("django.db.transaction.on_commit", run_on_commit):
+            before = month_start(self.month, 1)
+            call_command("partitions", "--archive", f"{before:%Y-%m}", "--directory", directory, stdout=StringIO())
+
+    def test_write_and_read(self):
+        path = cold_archive.write("trade", self.month, month_start(self.month, 1))
+        f = cold_archive.ColdFile(path)
+
+        rows = f.rows("seller_id", self.company.id)
+        self.assertEqual([row["id"] for row in rows], [self.old_trade.id])
+        self.assertEqual(rows, f.rows("company_id", self.company.id))
+        self.assertEqual(f.count("seller_id", self.company.id), 1)
+        self.assertEqual(f.rows("seller_id", self.centralbank.id), [])
+        self.assertEqual(f.count("seller_id", self.company.id, {"seller_pd": True}), 0)
+        self.assertEqual(f.rows("seller_id", self.company.id, {"seller_pd": True}), [])
+
+        row = rows[0]
+        self.assertEqual(row["price"], Decimal("2.50"))
+        self.assertEqual(row["created"], self.month)
+        self.assertEqual(row["seller__name"], self.company.name)
+
+    def test_history_is_merged_with_the_cold_archive(self):
+        urls = [reverse(name, kwargs={"isin": self.company.isin}) for name in ["core:company_trades", "core:statement"]]
+        before = [self.client.get(url, {"history": 1}).json() for url in urls]
+        self.assertTrue(all(len(data["results"]) == 2 for data in before))
+
+        self.archive()
+        self.assertFalse(Trade.objects.filter(id=self.old_trade.id).exists())
+        self.assertFalse(StatementOfAccount.objects.filter(id=self.old_statement.id).exists())
+
+        for url, data in zip(urls, before):
+            self.assertEqual(self.client.get(url, {"history": 1}).json(), data)
+
+            # without the history, old rows are neither read from the database nor the archive
+            self.assertEqual(len(self.client.get(url).json()["results"]), 1)
+
+    def test_segments_are_written_while_streaming(self):
+        company_two = Company.objects.create(name="Company Two", user=self.user_two)
+        trades = [self.trade(self.month, price=1)[0] for _ in range(2)]
+        Trade.objects.filter(id__in=[t.id for t in trades]).update(seller=company_two)
+        self.trade(self.month, price=1)
+
+        # the rows of a company span several chunks
+        with mock.patch.object(cold_archive, "CHUNK_SIZE", 1):
+            path = cold_archive.write("trade", self.month, month_start(self.month, 1))
+        f = cold_archive.ColdFile(path)
+
+        self.assertEqual([row["id"] for row in f.rows("seller_id", company_two.id)], [t.id for t in reversed(trades)])
+        self.assertEqual(f.count("seller_id", self.company.id), 2)
+        self.assertEqual(f.count("company_id", self.company.id), 4)
+
+    def test_months_are_only_archived_once(self):
+        cold_archive.write("trade", self.month, month_start(self.month, 1))
+        with self.assertRaises(FileExistsError):
+            cold_archive.write("trade", self.month, month_start(self.month, 1))
+
+    def test_cold_file_is_only_published_if_the_partition_has_been_dropped(self):
+        create_partition("trade", self.month)
+        path = cold_archive.get_path("trade", self.month)
+
+        # exporting the csv fails after the cold file has been written, so the transaction is rolled back
+        with self.assertRaises(FileNotFoundError):
+            archive_partition("trade", self.month, os.path.join(tempfile.gettempdir(), "does", "not", "exist"))
+
+        self.assertIn(partition_name("trade", self.month), dict(get_partitions("trade")))
+        self.assertEqual(os.listdir(cold_archive.get_directory("trade")), [])
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch("django.db.transaction.on_commit", run_on_commit):
+            archive_partition("trade", self.month, directory)
+        self.assertEqual(os.listdir(cold_archive.get_directory("trade")), [os.path.basename(path)])
+
+    def test_pages_span_the_database_and_the_archive(self):
+        self.archive()
+        url = reverse("core:company_trades", kwargs={"isin": self.company.isin})
+
+        first = self.client.get(url, {"history": 1, "page_size": 1}).json()
+        second = self.client.get(url, {"history": 1, "page_size": 1, "page": 2}).json()
+
+        self.assertEqual(first["count"], 2)
+        self.assertEqual([t["id"] for t in first["results"]], [self.trade_.id])
+        self.assertEqual([t["id"] for t in second["results"]], [self.old_trade.id])
+        self.assertIsNone(second["next"])
+
+    def test_pages_only_read_the_segments_on_the_page(self):
+        older_month = month_start(self.month, -1)
+        older_trade, _ = self.trade(older_month, price=2)
+        for table in ["statement_of_account", "trade"]:
+            create_partition(table, older_month)
+        self.archive()
+
+        url = reverse("core:company_trades", kwargs={"isin": self.company.isin})
+        read = cold_archive.ColdFile.rows
+        with mock.patch.object(cold_archive.ColdFile, "rows", autospec=True, side_effect=read) as rows:
+            # the trades of private depots are counted by the index, the page reads the next row to know
+            # whether there is a next page
+            first = self.client.get(url, {"history": 1, "page_size": 1}).json()
+            self.assertEqual(first["count"], 3)
+            self.assertEqual([t["id"] for t in first["results"]], [self.trade_.id])
+            self.assertEqual(rows.call_count, 1)
+
+            # the segment of the newer month is skipped
+            rows.reset_mock()
+            third = self.client.get(url, {"history": 1, "page_size": 1, "page": 3}).json()
+            self.assertEqual([t["id"] for t in third["results"]], [older_trade.id])
+            self.assertEqual(rows.call_count, 1)
+            self.assertTrue(rows.call_args[0][0].path.endswith(f"{older_month:%Y_%m}.cold"))
+
+    def test_export_contains_the_archive(self):
+        self.archive()
+        url = reverse("core:company_trades_export", kwargs={"isin": self.company.isin})
+
+        lines = b"".join(self.client.get(url, {"format": "ndjson"}).streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [self.trade_.id, self.old_trade.id])
@@ -0,0 +1,86 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import mock
+
+from rest_framework.reverse import reverse
+
+from common.cache import bump_company_versions
+from common.test_base import BaseTestCase
+from core.company_cache import CompanyCache, company_cache
+from core.models import Company, Trade
+from core.serializers import CompanyUrlSerializer
+
+
+def run_on_commit(fn):
+    fn()
+
+
+@mock.patch("django.db.transaction.on_commit", run_on_commit)
+class CompanyCacheTest(BaseTestCase):
+    def test_lookups_are_cached(self):
+        with self.assertNumQueries(1):
+            company = company_cache.get_by_isin(self.company.isin)
+            self.assertEqual(company_cache.get(self.company.id), company)
+            self.assertTrue(company_cache.exists(self.company.isin))
+
+        self.assertEqual(company.name, "Company")
+        self.assertEqual(company.user_id, self.user.id)
+        self.assertEqual(company.url_data(), CompanyUrlSerializer(instance=self.company).data)
+
+    def test_missing_companies_are_not_cached(self):
+        self.assertFalse(company_cache.exists("US999999"))
+        self.assertFalse(company_cache.exists("invalid"))
+
+        with self.assertNumQueries(1):
+            company_cache.get(999999)
+
+    def test_rename_and_delete_invalidate(self):
+        company = Company.objects.create(name="Old")
+        self.assertEqual(company_cache.get(company.id).name, "Old")
+
+        company.name = "New"
+        company.save()
+        self.assertEqual(company_cache.get(company.id).name, "New")
+
+        company.delete()
+        self.assertIsNone(company_cache.get(company.id))
+
+    def test_version_bumps_of_other_processes_invalidate(self):
+        company_cache.get(self.company.id)
+
+        # another process renamed the company, this process only sees the bumped version in redis
+        Company.objects.filter(id=self.company.id).update(name="Renamed")
+        self.assertEqual(company_cache.get(self.company.id).name, "Company")
+
+        bump_company_versions(self.company.id)
+        self.assertEqual(company_cache.get(self.company.id).name, "Renamed")
+
+    def test_delete_bumps_the_version(self):
+        company = Company.objects.create(name="Deleted")
+        company_cache.get(company.id)
+
+        # the deletion only removes the entry of this process, others see the bumped version
+        with mock.patch.object(company_cache, "invalidate"):
+            company.delete()
+        self.assertIsNone(company_cache.get(company.id))
+
+    def test_entries_expire(self):
+        with mock.patch.object(CompanyCache, "timeout", 0):
+            company_cache.get(self.company.id)
+
+        # update() does not send any signal
+        Company.objects.filter(id=self.company.id).update(name="Renamed")
+        self.assertEqual(company_cache.get(self.company.id).name, "Renamed")
+
+    def test_company_renderer(self):
+        Trade.objects.create(buyer=self.company, seller=self.company, company=self.company)
+        url = reverse("core:company_trades", kwargs={"isin": self.company.isin})
+        self.assertEqual(self.client.get(url).json()["company_name"], "Company")
+
+        with self.assertNumQueries(3):
+            # explain, count & the page itself
+            self.assertEqual(self.client.get(url).json()["company_name"], "Company")
@@ -119,6 +119,18 @@ class CompanyTestCase(BaseTestCase):
         self.assertTrue(CompanyVolume.objects.filter(company=cb).exists())
         self.assertTrue(KeyFigures.objects.filter(company=cb).exists())
 
+    def test_centralbank_identity_is_memoized(self):
+        Company.clear_centralbank_identity()
+        with self.assertNumQueries(1):
+            identity = Company.get_centralbank_identity()
+            self.assertEqual(Company.get_centralbank_id(), identity.id)
+
+        self.assertEqual(identity, (self.centralbank.id, self.centralbank.isin))
+
+        Company.clear_centralbank_identity()
+        with self.assertNumQueries(1):
+            Company.get_centralbank_id()
+
     def test_cannot_delete_company_if_has_depot_positions(self):
         DepotPosition.objects.create(depot_of=self.company, company=self.company_b, amount=10000, price_bought=15)
         with self.assertRaises(ValueError):
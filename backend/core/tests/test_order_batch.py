@@ -0,0 +1,137 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import Company, DepotPosition, Order
+from core.serializers import OrderBatch
+from tsg.const import MAXIMUM_ORDER_BATCH
+from users.models import User
+
+
+def run_on_commit(fn):
+    fn()
+
+
+class OrderBatchApiTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("core:orders_batch")
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two, cash=100)
+        self.company_three = Company.objects.create(name="Company Three", cash=100)
+        DepotPosition.objects.create(depot_of=self.company, company=self.company_two, amount=100)
+        self.client.force_authenticate(user=self.user)
+
+    def order(self, company: Company, **data) -> dict:
+        return {"order_of_isin": company.isin, "price": 1, "amount": 10, "typ": "Buy", **data}
+
+    def post(self, data: dict):
+        with mock.patch("django.db.transaction.on_commit", run_on_commit), mock.patch(
+            "core.serializers.check_orders_single_company"
+        ) as check_orders:
+            rsp = self.client.post(self.url, data, format="json")
+        return rsp, check_orders
+
+    def test_create_orders(self):
+        orders = [
+            self.order(self.company_two),
+            self.order(self.company_two, typ="Sell", amount=60),
+            # only 40 shares are left to sell
+            self.order(self.company_two, typ="Sell", amount=41),
+            self.order(self.company_three, price=2),
+            self.order(self.company_three, price=-1),
+        ]
+        rsp, check_orders = self.post({"orders": orders})
+        self.assertEqual(rsp.status_code, 200, rsp.content)
+
+        results = rsp.json()["orders"]
+        self.assertEqual([r["status"] for r in results], [201, 201, 400, 201, 400])
+        self.assertIn("already in sell orders", results[2]["errors"]["amount"][0])
+        self.assertIn("price", results[4]["errors"])
+
+        created = Order.objects.filter(order_by=self.company).order_by("id")
+        self.assertEqual([o.id for o in created], [results[i]["id"] for i in [0, 1, 3]])
+
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.reserved_cash, 30)
+        self.assertEqual(DepotPosition.objects.get(depot_of=self.company).reserved_amount, 60)
+
+        # one matching per company
+        self.assertEqual(
+            sorted(c.args[0] for c in check_orders.delay.call_args_list), [self.company_two.id, self.company_three.id]
+        )
+
+    def test_orders_are_validated_against_the_batch(self):
+        cash = self.company.cash
+        orders = [self.order(self.company_two, price=cash / 20), self.order(self.company_two, price=cash / 20)]
+        orders.append(self.order(self.company_two, price=1))
+
+        rsp, _ = self.post({"orders": orders})
+        self.assertEqual([r["status"] for r in rsp.json()["orders"]], [201, 201, 400])
+
+    def test_cancel_orders(self):
+        order = Order.objects.create(order_by=self.company, order_of=self.company_two, price=5, amount=10, typ="Buy")
+        other = Order.objects.create(order_by=self.company_two, order_of=self.company, price=1, amount=1, typ="Buy")
+
+        # the cash of the cancelled order can be used by the new orders
+        cash = self.company.cash
+        rsp, _ = self.post({"cancel": [order.id, other.id], "orders": [self.order(self.company_two, price=cash / 10)]})
+        data = rsp.json()
+
+        self.assertEqual(data["cancel"], [{"status": 204, "id": order.id}, {"status": 404, "id": other.id}])
+        self.assertEqual(data["orders"][0]["status"], 201)
+        self.assertTrue(Order.objects.filter(id=other.id).exists())
+        self.assertFalse(Order.objects.filter(id=order.id).exists())
+
+    def test_isin_with_whitespace(self):
+        orders = [self.order(self.company_two, order_of_isin=f" {self.company_two.isin} ")]
+        rsp, _ = self.post({"orders": orders})
+        self.assertEqual(rsp.status_code, 200, rsp.content)
+        self.assertEqual(rsp.json()["orders"][0]["status"], 201)
+
+    def test_snapshot_of_a_company_which_has_not_been_loaded(self):
+        batch = OrderBatch(self.company, [self.company_two.id])
+        snapshot = batch.get_snapshot(self.company_three.id)
+        self.assertTrue(snapshot.order_of_exists)
+        self.assertIsNone(snapshot.depot_amount)
+
+    def test_user_without_company(self):
+        user = User.objects.create(username="without_company", email="without_company@tsg.de")
+        self.client.force_authenticate(user=user)
+
+        rsp, _ = self.post({"orders": [self.order(self.company_two)]})
+        self.assertEqual(rsp.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_batch_size(self):
+        rsp, _ = self.post({"orders": [self.order(self.company_two)] * (MAXIMUM_ORDER_BATCH + 1)})
+        self.assertEqual(rsp.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+
+        rsp, _ = self.post({})
+        self.assertEqual(rsp.status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        rsp, _ = self.post({"orders": [self.order(self.company_two)]})
+        self.assertEqual(rsp.status_code, 401)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def queries(size: int) -> int:
+            Order.objects.all().delete()
+            # the log is bounded, start with an empty one
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                rsp, _ = self.post({"orders": [self.order(self.company_two)] * size})
+            self.assertEqual(Order.objects.count(), size, rsp.content)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(2), queries(20))
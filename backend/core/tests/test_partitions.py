@@ -0,0 +1,117 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import csv
+import gzip
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import StatementOfAccount, Trade, TradeHistory
+from core.partitions import (
+    PARTITIONED_TABLES,
+    create_partition,
+    get_partitions,
+    hot_since,
+    is_partitioned,
+    month_start,
+    partition_name,
+)
+
+
+class PartitionsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.assertTrue(all(is_partitioned(table) for table in PARTITIONED_TABLES))
+
+    def count(self, table: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def trade(self, months: int) -> Trade:
+        trade = Trade.objects.create(buyer=self.company, seller=self.centralbank, company=self.company)
+        Trade.objects.filter(id=trade.id).update(created=month_start(timezone.now(), months))
+        return trade
+
+    def test_month_start(self):
+        month = month_start(timezone.now())
+        self.assertEqual(month_start(month, 1).day, 1)
+        self.assertEqual(month_start(month, 12).year, month.year + 1)
+        self.assertEqual(month_start(month, -12).month, month.month)
+
+    def test_partitions_of_the_next_months_exist(self):
+        for table in PARTITIONED_TABLES:
+            names = dict(get_partitions(table))
+            self.assertIn(partition_name(table, month_start(timezone.now())), names)
+
+        # the command creates the missing ones
+        out = StringIO()
+        call_command("partitions", "--months", "6", stdout=out)
+        self.assertIn(partition_name("trade", month_start(timezone.now(), 6)), out.getvalue())
+
+    def test_create_partition_moves_rows_from_the_default_partition(self):
+        trade = self.trade(months=12)
+        self.assertEqual(self.count("trade_default"), 1)
+
+        month = month_start(timezone.now(), 12)
+        self.assertTrue(create_partition("trade", month))
+        self.assertFalse(create_partition("trade", month))
+
+        self.assertEqual(self.count("trade_default"), 0)
+        self.assertEqual(self.count(partition_name("trade", month)), 1)
+        self.assertTrue(Trade.objects.filter(id=trade.id).exists())
+
+    def test_archive(self):
+        trade = self.trade(months=-12)
+        recent = self.trade(months=0)
+        TradeHistory.objects.create(trade=trade, buyer_name="Buyer")
+        statement = StatementOfAccount.objects.create(
+            company=self.company, typ="Order", value=1, amount=1, received=True, trade=trade
+        )
+        create_partition("trade", month_start(timezone.now(), -12))
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(COLD_ARCHIVE_DIR=directory):
+            before = month_start(timezone.now(), -11)
+            call_command("partitions", "--archive", f"{before:%Y-%m}", "--directory", directory, stdout=StringIO())
+
+            name = partition_name("trade", month_start(timezone.now(), -12))
+            with gzip.open(os.path.join(directory, f"{name}.csv.gz"), "rt") as f:
+                rows = list(csv.DictReader(f))
+
+        self.assertEqual([int(row["id"]) for row in rows], [trade.id])
+        self.assertNotIn(name, dict(get_partitions("trade")))
+        self.assertFalse(Trade.objects.filter(id=trade.id).exists())
+        self.assertTrue(Trade.objects.filter(id=recent.id).exists())
+
+        # same as the on_delete of the models
+        self.assertFalse(TradeHistory.objects.filter(trade_id=trade.id).exists())
+        statement.refresh_from_db()
+        self.assertIsNone(statement.trade_id)
+
+    def test_hot_partitions_cannot_be_archived(self):
+        with self.assertRaises(CommandError):
+            call_command("partitions", "--archive", f"{timezone.now():%Y-%m}", stdout=StringIO())
+
+    def test_list_views_only_show_hot_partitions(self):
+        old = self.trade(months=-12)
+        recent = self.trade(months=0)
+        self.assertLess(month_start(timezone.now(), -12), hot_since())
+
+        url = reverse("core:trades")
+        ids = [t["id"] for t in self.client.get(url).json()["results"]]
+        self.assertEqual(ids, [recent.id])
+
+        ids = [t["id"] for t in self.client.get(url, {"history": 1}).json()["results"]]
+        self.assertEqual(ids, [recent.id, old.id])
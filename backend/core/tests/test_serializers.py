@@ -1,6 +1,21 @@
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
 from common.test_base import BaseTestCase
 
-from core.serializers import BondSerializer
+from core.models import Company, DepotPosition, Order, StatementOfAccount, Trade
+from core.serializers import (
+    BondSerializer,
+    DepotPositionSerializer,
+    DepotPositionValuesSerializer,
+    OrderSerializer,
+    OrderValuesSerializer,
+    StatementOfAccountSerializer,
+    StatementOfAccountValuesSerializer,
+    TradeSerializer,
+    TradeValuesSerializer,
+)
 
 
 class BondSerializerTestCase(BaseTestCase):
@@ -33,3 +48,134 @@ class BondSerializerTestCase(BaseTestCase):
         serializer = BondSerializer(data=data)
         self.assertEqual(serializer.is_valid(), False)
         self.assertTrue("value" in serializer.errors)
+
+
+class OrderSerializerTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two, cash=100)
+        DepotPosition.objects.create(depot_of=self.company, company=self.company_two, amount=100)
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=1, amount=60, typ="Sell")
+
+        request = APIRequestFactory().post("/")
+        request.user = self.user
+        self.context = {"request": request}
+
+        # memoized per process, see Company.get_centralbank_identity()
+        Company.get_centralbank_id()
+
+    def validate(self, **data) -> OrderSerializer:
+        data = {"order_of_isin": self.company_two.isin, "price": 1, "amount": 10, "typ": "Buy", **data}
+        serializer = OrderSerializer(data=data, context=self.context)
+        with self.assertNumQueries(1):
+            serializer.is_valid()
+        return serializer
+
+    def test_validation_runs_a_single_query(self):
+        serializer = self.validate()
+        self.assertEqual(serializer.errors, {})
+        self.assertEqual(serializer.validated_data["order_of_id"], self.company_two.id)
+
+        serializer = self.validate(typ="Sell", amount=40)
+        self.assertEqual(serializer.errors, {})
+
+    def test_invalid_orders(self):
+        serializer = self.validate(typ="Sell", amount=41)
+        self.assertIn("already in sell orders", serializer.errors["amount"][0])
+
+        serializer = self.validate(price=self.ONE_HUNDRED_THOUSAND)
+        self.assertEqual(serializer.errors, {"non_field_errors": ["You do not have enough Cash"]})
+
+        serializer = self.validate(order_of_isin="US999999")
+        self.assertEqual(serializer.errors, {"order_of_isin": ["A company with the given isin does not exist"]})
+
+    def test_company_without_depot_position_cannot_sell(self):
+        third = Company.objects.create(name="Company Three", cash=100)
+        serializer = self.validate(order_of_isin=third.isin, typ="Sell")
+        self.assertEqual(serializer.errors, {"order_of_isin": ["You do not have this company in your depot"]})
+
+    def test_order_limit(self):
+        Order.objects.bulk_create(
+            [Order(order_by=self.company, order_of=self.company_two, price=1, amount=1, typ="Buy") for _ in range(100)]
+        )
+        serializer = self.validate()
+        self.assertEqual(serializer.errors, {"non_field_errors": ["You already have more than 100 orders!"]})
+
+
+class ValuesSerializerTestCase(BaseTestCase):
+    """
+    The values serializers have to render exactly the same json as the model serializers
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two, cash=100)
+        self.deleted = Company.objects.create(name="Deleted")
+
+        trades = [
+            Trade.objects.create(buyer=self.company, seller=self.company_two, company=self.company_two, price=3.33),
+            Trade.objects.create(
+                buyer=self.company_two, seller=self.company, company=self.company_two, price=1, amount=7, buyer_pd=True
+            ),
+            Trade.objects.create(
+                buyer=self.company, seller=self.company_two, company=self.company, amount=3, seller_pd=True
+            ),
+            Trade.objects.create(buyer=self.company, seller=self.deleted, company=self.deleted, price=0.1, amount=9),
+        ]
+        Trade.create_trade_histories(self.deleted)
+        self.deleted.delete()
+
+        for trade in trades:
+            StatementOfAccount.objects.create(
+                company=self.company,
+                typ="Order",
+                value=trade.get_value(),
+                amount=trade.amount,
+                received=False,
+                trade=trade,
+            )
+        StatementOfAccount.objects.create(company=self.company, typ="Bond", value=1000.1, received=True)
+        # The trade of an order can be deleted
+        StatementOfAccount.objects.bulk_create(
+            [StatementOfAccount(company=self.company_two, typ="Order", value=10, amount=1, received=True)]
+        )
+
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=2.5, amount=10, typ="Buy")
+        Order.objects.create(order_by=self.company_two, order_of=self.company, price=1, amount=3, typ="Sell")
+
+        DepotPosition.objects.create(depot_of=self.company, company=self.company_two, amount=10, price_bought=1.11)
+        DepotPosition.objects.create(depot_of=self.company_two, company=self.company, amount=3)
+
+    def assertSameJson(self, queryset, serializer_class, values_serializer_class, user):
+        request = APIRequestFactory().get("/")
+        request.user = user
+        context = {"request": request}
+
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+
+        values_serializer = values_serializer_class(context=context)
+        rows = values_serializer.rows(queryset)
+        self.assertEqual(JSONRenderer().render(values_serializer.many(rows)), expected)
+
+        # No queries besides the rows themselves
+        with self.assertNumQueries(1):
+            values_serializer.many(values_serializer.rows(queryset))
+
+    def test_trades(self):
+        queryset = Trade.objects.add_value().order_by("id")
+        for user in [self.user, self.user_two, AnonymousUser()]:
+            self.assertSameJson(queryset, TradeSerializer, TradeValuesSerializer, user)
+
+    def test_orders(self):
+        queryset = Order.objects.add_value().order_by("-id")
+        for user in [self.user, AnonymousUser()]:
+            self.assertSameJson(queryset, OrderSerializer, OrderValuesSerializer, user)
+
+    def test_statements_of_account(self):
+        queryset = StatementOfAccount.objects.order_by("id")
+        for user in [self.user, self.user_two, AnonymousUser()]:
+            self.assertSameJson(queryset, StatementOfAccountSerializer, StatementOfAccountValuesSerializer, user)
+
+    def test_depot_positions(self):
+        queryset = DepotPosition.objects.order_by("-amount", "-id")
+        self.assertSameJson(queryset, DepotPositionSerializer, DepotPositionValuesSerializer, self.user)
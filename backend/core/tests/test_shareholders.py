@@ -0,0 +1,92 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import mock
+
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import Company, DepotPosition
+from core.shareholders import TOP_SHAREHOLDERS_KEY, build_shareholders, get_top_shareholders
+from periodic_tasks.key_figures import KeyFiguresTask
+from stats.models import KeyFigures
+from tsg.redis import redis_client
+
+
+def run_on_commit(fn):
+    fn()
+
+
+@mock.patch("django.db.transaction.on_commit", run_on_commit)
+class ShareholdersTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.holders = [Company.objects.create(name=f"Holder {i}", cash=100, shares=1000) for i in range(5)]
+
+        # the centralbank holds all shares of a new company
+        self.cb_position = DepotPosition.objects.get(company=self.company, depot_of=self.centralbank)
+        amounts = [150_000, 100_000, 50_000, 5_000, 5_000]
+        for holder, amount in zip(self.holders, amounts):
+            DepotPosition.objects.create(company=self.company, depot_of=holder, amount=amount)
+        DepotPosition.objects.filter(id=self.cb_position.id).update(amount=self.company.shares - sum(amounts))
+
+    def expected_ids(self) -> list:
+        return list(
+            DepotPosition.objects.filter(company=self.company).order_by("-amount", "-id").values_list("id", flat=True)
+        )
+
+    def test_free_float(self):
+        free_floats = build_shareholders()
+        # 15% + 10% + 5% + 0% + 0%, the centralbank holds more than 20%
+        self.assertEqual(free_floats[self.company.id], 30)
+
+        KeyFiguresTask().run()
+        self.assertEqual(KeyFigures.objects.get(company=self.company).free_float, 30)
+
+    def test_top_shareholders(self):
+        build_shareholders()
+
+        with self.assertNumQueries(0):
+            top = get_top_shareholders(self.company.id)
+
+        self.assertEqual([h["id"] for h in top], self.expected_ids())
+        self.assertEqual(top[0]["depot_of"]["id"], self.centralbank.id)
+        self.assertEqual(top[0]["percentage"], 69.0)
+        self.assertEqual(top[1]["percentage"], 15.0)
+
+        rsp = self.client.get(reverse("core:top_shareholders", kwargs={"isin": self.company.isin}))
+        self.assertEqual(rsp.json(), top)
+
+    def test_top_shareholders_are_stored_on_commit(self):
+        callbacks = list()
+        with mock.patch("django.db.transaction.on_commit", callbacks.append):
+            build_shareholders()
+
+        # e.g. the key figures are rolled back, the shareholders are not stored
+        self.assertFalse(redis_client.exists(TOP_SHAREHOLDERS_KEY))
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(redis_client.hexists(TOP_SHAREHOLDERS_KEY, self.company.id))
+
+    def test_top_shareholders_are_limited(self):
+        with mock.patch("core.shareholders.TOP_SHAREHOLDERS", 2):
+            build_shareholders()
+            self.assertEqual(len(get_top_shareholders(self.company.id)), 2)
+
+    def test_top_shareholders_before_the_first_build(self):
+        top = get_top_shareholders(self.company.id)
+        self.assertEqual([h["id"] for h in top], self.expected_ids())
+
+    def test_paginated_shareholders(self):
+        url = reverse("core:shareholders", kwargs={"isin": self.company.isin})
+
+        data = self.client.get(url).json()
+        self.assertEqual([h["id"] for h in data], self.expected_ids())
+
+        data = self.client.get(f"{url}?page_size=2&page=2").json()
+        self.assertEqual(data["count"], 6)
+        self.assertEqual([h["id"] for h in data["results"]], self.expected_ids()[2:4])
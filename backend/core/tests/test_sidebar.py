@@ -0,0 +1,126 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import Company, DepotPosition, Order
+from core.sidebar import build_sidebar, change_order_counts, get_sidebar
+from periodic_tasks.orders import OrderTask
+
+
+def run_on_commit(fn):
+    fn()
+
+
+@mock.patch("django.db.transaction.on_commit", run_on_commit)
+class SidebarTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two)
+
+    def counts(self) -> tuple:
+        data = get_sidebar()
+        return data["buy_orders_count"], data["sell_orders_count"]
+
+    def test_sidebar_is_served_without_queries(self):
+        get_sidebar()
+
+        with CaptureQueriesContext(connection) as context:
+            rsp = self.client.get(reverse("core:sidebar"))
+
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(rsp.json()["companies_count"], Company.objects.count())
+        self.assertEqual(rsp.json()["companies"][0]["name"], "Company Two")
+
+    def test_sidebar_gets_rebuilt(self):
+        get_sidebar()
+
+        # new companies are shown right away
+        newest = Company.objects.create(name="Newest")
+        self.assertEqual(get_sidebar()["companies"][0]["name"], "Newest")
+
+        Company.objects.filter(id=newest.id).update(name="Renamed")
+        self.assertEqual(get_sidebar()["companies"][0]["name"], "Newest")
+
+        # e.g. by the periodic jobs
+        build_sidebar()
+        self.assertEqual(get_sidebar()["companies"][0]["name"], "Renamed")
+
+    def test_order_counts_are_seeded(self):
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=1, amount=10, typ=Order.type_buy())
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_order_counts_are_not_changed_before_seeding(self):
+        change_order_counts(buy=5, sell=5)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_order_counts_on_create_and_delete(self):
+        self.assertEqual(self.counts(), (0, 0))
+
+        self.client.force_authenticate(self.user)
+        DepotPosition.objects.create(depot_of=self.company, company=self.company_two, amount=100)
+
+        for typ in [Order.type_buy(), Order.type_sell()]:
+            rsp = self.client.post(
+                reverse("core:orders"),
+                data={
+                    "order_by_isin": self.company.isin,
+                    "order_of_isin": self.company_two.isin,
+                    "price": 1,
+                    "amount": 10,
+                    "typ": typ,
+                },
+                format="json",
+            )
+            self.assertEqual(rsp.status_code, 201, rsp.content)
+
+        self.assertEqual(self.counts(), (1, 1))
+
+        order = Order.objects.get(typ=Order.type_buy())
+        url = reverse("core:order_company", kwargs={"isin": self.company.isin})
+        self.client.delete(url, data={"order_id": order.id})
+
+        self.assertEqual(self.counts(), (0, 1))
+
+    def test_order_counts_on_match(self):
+        self.assertEqual(self.counts(), (0, 0))
+        DepotPosition.objects.create(depot_of=self.company_two, company=self.company_two, amount=100)
+
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=2, amount=10, typ=Order.type_buy())
+        Order.objects.create(
+            order_by=self.company_two, order_of=self.company_two, price=1, amount=10, typ=Order.type_sell()
+        )
+        Order.objects.create(
+            order_by=self.company_two, order_of=self.company_two, price=1, amount=20, typ=Order.type_sell()
+        )
+        change_order_counts(buy=1, sell=2)
+
+        task = OrderTask()
+        task.check_single_company(self.company_two)
+        task.bulk_update()
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.counts(), (0, 1))
+
+    def test_order_counts_on_company_delete(self):
+        company = Company.objects.create(name="Deleted")
+
+        # orders of and by the deleted company
+        Order.objects.create(order_by=self.company, order_of=company, price=1, amount=10, typ=Order.type_buy())
+        Order.objects.create(order_by=self.company, order_of=company, price=2, amount=10, typ=Order.type_sell())
+        Order.objects.create(order_by=company, order_of=self.company_two, price=1, amount=10, typ=Order.type_buy())
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=1, amount=10, typ=Order.type_buy())
+        self.assertEqual(self.counts(), (3, 1))
+
+        company.delete()
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.counts(), (1, 0))
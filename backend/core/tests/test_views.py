@@ -4,7 +4,9 @@ Use of this source code is governed by a AGPL-3.0
 license that can be found in the LICENSE.txt file.
 """
 
+import csv
 import datetime
+import json
 from datetime import timedelta
 
 import pytest
@@ -25,6 +27,7 @@ from core.models import Company, Trade, TradeHistory
 from core.models import InterestRate
 from core.models import Order
 from core.models import StatementOfAccount
+from periodic_tasks.key_figures import KeyFiguresTask
 from tsg.const import CENTRALBANK
 from tsg.const import DATETIME_FORMAT
 from tsg.const import START_CASH
@@ -218,6 +221,10 @@ class CompanyApiTest(BaseTestCase):
         self.company_b.cash = 10000
         self.company_b.save()
 
+        # the bonds and the depot value are stored by the KeyFiguresTask
+        KeyFiguresTask().run()
+
+        # bonds bought after the run are added right away
         Bond.objects.create(company=self.company_b, value=1000, rate=1, runtime=1)
 
         with self.assertNumQueries(1):
@@ -788,6 +795,7 @@ class TradeApiTestCase(TestCase):
 
         should_be = {
             "count": 2,
+            "count_exact": True,
             "next": None,
             "previous": None,
             "results": [
@@ -850,6 +858,45 @@ class TradeApiTestCase(TestCase):
         response = self.client.get(url)
         self.assertDictEqual(should_be, response.json())
 
+    def test_trade_export(self):
+        """Test the trades of a company are streamed as csv & ndjson"""
+        url = reverse("core:company_trades_export", kwargs={"isin": self.company_2.isin})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(f'filename="trades_{self.company_2.isin}.csv"', response["Content-Disposition"])
+
+        rows = list(csv.DictReader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["id"], str(self.trade.id))
+        self.assertEqual(rows[0]["buyer.name"], "A")
+        self.assertEqual(rows[0]["value"], "0.00")
+        self.assertEqual(rows[0]["history.buyer_name"], "")
+        self.assertEqual(rows[0]["history.seller_name"], "")
+
+        # the names of deleted companies are taken from the history
+        TradeHistory.objects.create(trade=self.trade, buyer_name="Buyer", seller_name="Seller", company_name="B")
+        rows = list(csv.DictReader(b"".join(self.client.get(url).streaming_content).decode().splitlines()))
+        self.assertEqual(
+            [rows[0]["history.buyer_name"], rows[0]["history.seller_name"], rows[0]["history.company_name"]],
+            ["Buyer", "Seller", "B"],
+        )
+
+        # the ndjson rows are the same as the rows of the list
+        response = self.client.get(url, {"format": "ndjson"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        list_url = reverse("core:company_trades", kwargs={"isin": self.company_2.isin})
+        self.assertEqual([json.loads(line) for line in lines], self.client.get(list_url).json()["results"])
+
+        # trades with a private depot are not exported, same as in the list
+        url = reverse("core:company_trades_export", kwargs={"isin": self.company_3.isin})
+        self.assertEqual(b"".join(self.client.get(url, {"format": "ndjson"}).streaming_content), b"")
+
+        url = reverse("core:company_trades_export", kwargs={"isin": "DE999999"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
 
 @freeze_time(NOW)
 class StatementOfAccountApiTest(BaseTestCase):
@@ -939,6 +986,26 @@ class StatementOfAccountApiTest(BaseTestCase):
 
         self.assertListEqual(should_be, response.json().get("results"))
 
+    def test_export(self):
+        """Test the statement of account is streamed as csv & ndjson"""
+        url = reverse("core:statement_export", kwargs={"isin": self.company.isin})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'filename="statement_of_account_{self.company.isin}.csv"', response["Content-Disposition"])
+
+        rows = list(csv.DictReader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row["id"] for row in rows], [str(self.statement_order.id), str(self.statement_bond.id)])
+        self.assertEqual(rows[0]["trade.buyer.name"], self.company_two.name)
+        self.assertEqual(rows[0]["value"], "1000.00")
+        self.assertEqual(rows[1]["trade.id"], "")
+
+        response = self.client.get(url, {"format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        list_url = reverse("core:statement", kwargs={"isin": self.company.isin})
+        self.assertEqual([json.loads(line) for line in lines], self.client.get(list_url).json()["results"])
+
 
 class SidebarApiTest(BaseTestCase):
     def setUp(self):
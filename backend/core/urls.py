@@ -21,14 +21,22 @@ urlpatterns = [
     path("companies/liquidity/", views.LiquidityOverviewView.as_view(), name="liquidity_overiew"),
     path("companies/<slug:isin>/", views.CompanyRetrieveView.as_view(), name="company"),
     path("companies/<slug:isin>/shareholders/", views.ShareholdersListView.as_view(), name="shareholders"),
+    path("companies/<slug:isin>/shareholders/top/", views.TopShareholdersView.as_view(), name="top_shareholders"),
     path("companies/<slug:isin>/liquidity/", views.LiquidityRetrieveView.as_view(), name="liquidity"),
     path("companies/<slug:isin>/statement_of_account/", views.StatementOfAccountListView.as_view(), name="statement"),
+    path(
+        "companies/<slug:isin>/statement_of_account/export/",
+        views.StatementOfAccountExportView.as_view(),
+        name="statement_export",
+    ),
     path("companies/<slug:isin>/trades/", views.TradeCompanyListView.as_view(), name="company_trades"),
+    path("companies/<slug:isin>/trades/export/", views.TradeCompanyExportView.as_view(), name="company_trades_export"),
     path("companies/<slug:isin>/buyer_seller/", views.BuyerSellerListView.as_view(), name="company_buyer"),
     path("companies/<slug:isin>/orders/", views.OrderCompanyViewSet.as_view(), name="order_company"),
     path("companies/<slug:isin>/bond/", views.BondListCreateView.as_view(), name="bonds"),
     path("orders/", views.OrderListCreateAPIView.as_view(), name="orders"),
     path("orders/user/", views.UserOrderListAPIView.as_view(), name="orders_user"),
+    path("orders/batch/", views.OrderBatchView.as_view(), name="orders_batch"),
     path("trades/", views.TradeListView.as_view(), name="trades"),
     path("sidebar/", views.SidebarInfoRetrieveView.as_view(), name="sidebar"),
 ]
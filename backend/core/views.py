@@ -5,9 +5,10 @@ license that can be found in the LICENSE.txt file.
 """
 
 import logging
+from typing import Optional
 
-from django.db.models import DecimalField, OuterRef, Subquery, Sum, Count, Q
-from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.db.models import F
 from django.http import Http404
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers, status, viewsets
@@ -15,13 +16,16 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.generics import CreateAPIView, ListAPIView, ListCreateAPIView, RetrieveAPIView, get_object_or_404
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from common.pagination import StandardResultsSetPagination
-from common.views import BaseListAPIServerSide
+from common.pagination import EstimatedCountPagination, OptionalPageNumberPagination, StandardResultsSetPagination
+from common.renderers import TABLE_RENDERER_CLASSES, ColumnarJSONRenderer, FastJSONRenderer
+from common.views import BaseListAPIServerSide, CachedResponseMixin, StreamingExportMixin, cache_response
+from core import cold_archive
+from core.company_cache import company_cache
 from core.models import Bond, Company, DepotPosition, InterestRate, Order, StatementOfAccount, Trade
+from core.partitions import hot_since
 from core.serializers import (
     BondSerializer,
     CompanyKeyFiguresLogoSerializer,
@@ -29,20 +33,27 @@ from core.serializers import (
     CompanyUrlSerializer,
     DepotPositionSerializer,
     InterestRateSerializer,
+    OrderBatchSerializer,
     OrderSerializer,
     ShareholderSerializer,
     StatementOfAccountSerializer,
     TradeSerializer,
     FirstCompanyCreationSerializer,
     DepotPositionNameValueSerializer,
-    CompanySidebarSerializer,
+    DepotPositionValuesSerializer,
+    OrderValuesSerializer,
+    StatementOfAccountValuesSerializer,
+    TradeValuesSerializer,
 )
+from core.shareholders import get_top_shareholders
+from core.sidebar import change_order_count, get_sidebar
+from periodic_tasks.scheduler import mark_dirty
 from tsg.const import MAXIMUM_BONDS
 
 logger = logging.getLogger(__name__)
 
 
-class CompanyJsonRenderer(JSONRenderer):
+class CompanyJsonRenderer(FastJSONRenderer):
     """
     Custom Renderer used by multiple views such as depot, statement of account, trades and more
     to add a company field at the root of the json document.
@@ -53,22 +64,92 @@ class CompanyJsonRenderer(JSONRenderer):
         kwargs = renderer_context.get("kwargs")
         isin = kwargs.get("isin")
         if isin and isinstance(data, dict):
-            try:
-                company = Company.objects.only("name").get(id=Company.get_id_from_isin(isin))
-            except Company.DoesNotExist:
+            company = company_cache.get_by_isin(isin)
+            if company is None:
                 logger.info(f"Company with isin {isin} does not exist!")
                 raise Http404
             data["company_name"] = company.name
         return super().render(data, accepted_media_type, renderer_context)
 
 
+class CompanyColumnarJsonRenderer(CompanyJsonRenderer, ColumnarJSONRenderer):
+    """
+    CompanyJsonRenderer for the compact representation of tables, see ColumnarJSONRenderer
+    """
+
+
+class AtomicCreateMixin:
+    """
+    Creates the object in a single transaction, so the company locked during the validation
+    (see Company.enough_money) stays locked until the object has been created.
+    """
+
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+
 class CompanyViewMixin(APIView):
     def get_id(self):
         isin = self.kwargs.get("isin")
         return Company.get_id_from_isin(isin)
 
+    def get_cache_scope(self) -> Optional[int]:
+        """Cached responses belong to the company of the isin, see common.views.cache_response"""
+        return self.get_id() if self.kwargs.get("isin") else None
+
+
+def get_company_isin(isin: str) -> str:
+    """Returns the isin if the company exists, otherwise raises Http404"""
+    if not company_cache.exists(isin):
+        logger.info(f"Company with isin {isin} does not exist!")
+        raise Http404
+    return isin
+
+
+class HotPartitionsMixin:
+    """
+    Mixin for list views of partitioned tables, which only lists the rows of the hot partitions
+    unless the history is requested with ?history=1. See core/partitions.py
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.query_params.get("history") == "1":
+            return queryset
+        return queryset.filter(created__gte=hot_since())
+
 
-class CompanyRetrieveView(RetrieveAPIView):
+class ColdArchiveMixin(HotPartitionsMixin):
+    """
+    Mixin for list views of archived tables, which lists the rows of the cold archive after the rows
+    of the database if the history is requested. See core/cold_archive.py
+
+    Archived rows are only merged for the default ordering, as they are older than the rows of the database.
+    """
+
+    archive_table = None
+
+    def get_rows(self, serializer):
+        rows = super().get_rows(serializer)
+
+        filters = self.get_filter_kwargs()
+        if (
+            self.request.query_params.get("history") != "1"
+            or self.get_order() != self.default_ordering
+            or self.cursor_pagination_class.is_requested(self.request)
+            or cold_archive.get_key(self.archive_table, filters) is None
+        ):
+            return rows
+
+        return cold_archive.ColdRows(rows, self.archive_table, filters)
+
+    def get_export_rows(self, serializer):
+        yield from super().get_export_rows(serializer)
+        yield from cold_archive.iter_rows(self.archive_table, self.get_filter_kwargs())
+
+
+class CompanyRetrieveView(CompanyViewMixin, CachedResponseMixin, RetrieveAPIView):
     """
     Returns a Company by isin
     """
@@ -113,6 +194,7 @@ class BondListCreateView(BaseListAPIServerSide, ListCreateAPIView):
     def get_filter_kwargs(self):
         return {"company__isin": self.kwargs["isin"]}
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
 
         # TODO: Move to Serializer
@@ -182,7 +264,7 @@ class BondListCreateView(BaseListAPIServerSide, ListCreateAPIView):
             raise serializers.ValidationError(_("You don't have enough money!"))
 
 
-class OrderListCreateAPIView(BaseListAPIServerSide, ListCreateAPIView):
+class OrderListCreateAPIView(AtomicCreateMixin, BaseListAPIServerSide, ListCreateAPIView):
     """
     get:
     Returns all orders ordered by date_time
@@ -194,9 +276,11 @@ class OrderListCreateAPIView(BaseListAPIServerSide, ListCreateAPIView):
     """
 
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
     queryset = Order.objects.add_value().select_related("order_of", "order_by").all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
 
     def get_fields_sortable(self) -> [str]:
         fields = super().get_fields_sortable()
@@ -204,12 +288,34 @@ class OrderListCreateAPIView(BaseListAPIServerSide, ListCreateAPIView):
         return fields
 
 
+class OrderBatchView(APIView):
+    """
+    post:
+    Create and cancel several orders of the company of the user at once:
+
+        {"orders": [{"order_of_isin": "US000002", "typ": "Buy", "price": 1, "amount": 10}], "cancel": [5, 7]}
+
+    Returns a result for every order and cancellation, in the same order as they have been sent.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = OrderBatchSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class UserOrderListAPIView(BaseListAPIServerSide, ListAPIView):
     """
     Returns all orders of the user
     """
 
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
     permission_classes = (IsAuthenticated,)
     pagination_class = StandardResultsSetPagination
     queryset = Order.objects.add_value().select_related("order_of", "order_by").all()
@@ -244,16 +350,30 @@ class ActiveCompanyRetrieveView(RetrieveAPIView):
         return obj
 
 
-class ShareholdersListView(CompanyViewMixin, ListAPIView):
+class ShareholdersListView(CompanyViewMixin, CachedResponseMixin, ListAPIView):
     """
-    Returns the Shareholder of a company by isin
+    Returns the Shareholder of a company by isin, largest first.
+
+    All shareholders are returned unless a page is requested, see OptionalPageNumberPagination.
     """
 
     serializer_class = ShareholderSerializer
+    pagination_class = OptionalPageNumberPagination
 
     def get_queryset(self):
         id_ = self.get_id()
-        return DepotPosition.objects.filter(company_id=id_).select_related("depot_of").order_by("-amount")
+        return DepotPosition.objects.filter(company_id=id_).select_related("depot_of").order_by("-amount", "-id")
+
+
+class TopShareholdersView(CompanyViewMixin):
+    """
+    Returns the largest shareholders of a company by isin with their percentage of the company.
+
+    The shareholders are rebuilt every tick, see core/shareholders.py
+    """
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_top_shareholders(self.get_id()))
 
 
 class InterestRateViewSet(viewsets.ViewSet):
@@ -293,8 +413,10 @@ class DepotPositionViewSet(BaseListAPIServerSide, CompanyViewMixin, viewsets.Rea
 
     pagination_class = StandardResultsSetPagination
     renderer_classes = (CompanyJsonRenderer,)
+    values_serializer_class = DepotPositionValuesSerializer
 
     @action(detail=False, methods=["get"])
+    @cache_response
     def slim(self, request, isin=None):
         id_ = self.get_id()
         qs = DepotPosition.objects.add_value().select_related("company").filter(depot_of_id=id_, private_depot=False)
@@ -319,11 +441,12 @@ class DepotPositionViewSet(BaseListAPIServerSide, CompanyViewMixin, viewsets.Rea
         return qs
 
 
-class LiquidityRetrieveView(APIView):
+class LiquidityRetrieveView(CompanyViewMixin):
     """
     Returns the Data for the Liquidity-Chart
     """
 
+    @cache_response
     def get(self, request, *args, **kwargs):
         #     The Liquidity states where the company has invested its money
         #     and how much he holds in reverse.
@@ -333,35 +456,11 @@ class LiquidityRetrieveView(APIView):
         #         - Company has bonds
         #         - Company has invested in shares/stocks
         #
-        #     Hence, we need to retrieve data from 3 different tables.
+        #     The cash is read from the company, the bonds and the shares are stored
+        #     in its key figures by the KeyFiguresTask.
         isin = self.kwargs["isin"]
-        company = (
-            Company.objects.only("cash", "isin")
-            .filter(id=Company.get_id_from_isin(isin))
-            .annotate(
-                bond_value=Coalesce(
-                    Subquery(
-                        Bond.objects.filter(company_id=OuterRef("id"))
-                        .values("company_id")
-                        .annotate(s=Sum("value"))
-                        .values("s")[:1],
-                        output_field=DecimalField(),
-                    ),
-                    0,
-                ),
-                depot_value=Coalesce(
-                    Subquery(
-                        DepotPosition.objects.add_value()
-                        .filter(depot_of_id=OuterRef("id"))
-                        .values("depot_of_id")
-                        .annotate(s=Sum("value"))
-                        .values("s")[:1],
-                        output_field=DecimalField(),
-                    ),
-                    0,
-                ),
-            )
-            .values("cash", "bond_value", "depot_value")
+        company = Company.objects.filter(id=Company.get_id_from_isin(isin)).values(
+            "cash", bond_value=F("keyfigures__bond_value"), depot_value=F("keyfigures__depot_value")
         )
 
         company = company.first()
@@ -374,15 +473,17 @@ class LiquidityRetrieveView(APIView):
         return Response(data=data)
 
 
-class StatementOfAccountListView(BaseListAPIServerSide, CompanyViewMixin, ListAPIView):
+class StatementOfAccountListView(ColdArchiveMixin, BaseListAPIServerSide, CompanyViewMixin, ListAPIView):
     """
     View for retrieving the statement of account entries of a company
     given by isin.
     """
 
     serializer_class = StatementOfAccountSerializer
+    values_serializer_class = StatementOfAccountValuesSerializer
     queryset = StatementOfAccount.objects.select_related("trade").all()
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
+    archive_table = "statement_of_account"
 
     def get_filter_kwargs(self):
         return {"company_id": self.get_id()}
@@ -393,7 +494,30 @@ class StatementOfAccountListView(BaseListAPIServerSide, CompanyViewMixin, ListAP
         return fields
 
 
-class OrderCompanyViewSet(BaseListAPIServerSide, CompanyViewMixin, CreateAPIView, ListAPIView):
+class StatementOfAccountExportView(StreamingExportMixin, StatementOfAccountListView):
+    """
+    Streams the whole statement of account of a company given by isin as csv or ndjson
+    """
+
+    export_columns = (
+        "id",
+        "created",
+        "typ",
+        "value",
+        "amount",
+        "received",
+        "trade.id",
+        "trade.price",
+        "trade.buyer.name",
+        "trade.seller.name",
+        "trade.company.name",
+    )
+
+    def get_filename(self) -> str:
+        return f"statement_of_account_{get_company_isin(self.kwargs['isin'])}"
+
+
+class OrderCompanyViewSet(AtomicCreateMixin, BaseListAPIServerSide, CompanyViewMixin, CreateAPIView, ListAPIView):
     """
     get:
     Returns all orders of a company
@@ -406,6 +530,8 @@ class OrderCompanyViewSet(BaseListAPIServerSide, CompanyViewMixin, CreateAPIView
     """
 
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
     pagination_class = StandardResultsSetPagination
     queryset = Order.objects.all()
 
@@ -430,7 +556,15 @@ class OrderCompanyViewSet(BaseListAPIServerSide, CompanyViewMixin, CreateAPIView
         # TODO: PermissionClass?
         # Might not be necessary because we query with the user
         # but may be cleaner
-        Order.objects.filter(id=order_id, order_by_id=id_, order_by__user=user).delete()
+        order = (
+            Order.objects.filter(id=order_id, order_by_id=id_, order_by__user=user)
+            .only("typ", "price", "amount", "order_by_id", "order_of_id")
+            .first()
+        )
+        if order is not None:
+            order.delete()
+            change_order_count(order.typ, -1)
+            mark_dirty(id_)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -440,13 +574,15 @@ class OrderCompanyViewSet(BaseListAPIServerSide, CompanyViewMixin, CreateAPIView
         return fields
 
 
-class TradeListView(BaseListAPIServerSide, ListAPIView):
+class TradeListView(HotPartitionsMixin, BaseListAPIServerSide, ListAPIView):
     """
     Returns all trades
     """
 
     serializer_class = TradeSerializer
-    pagination_class = StandardResultsSetPagination
+    values_serializer_class = TradeValuesSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
+    pagination_class = EstimatedCountPagination
     queryset = Trade.objects.add_value().select_related("buyer", "seller", "company", "tradehistory").all()
 
     def get_fields_sortable(self) -> [str]:
@@ -455,18 +591,43 @@ class TradeListView(BaseListAPIServerSide, ListAPIView):
         return fields
 
 
-class TradeCompanyListView(CompanyViewMixin, TradeListView):
+class TradeCompanyListView(ColdArchiveMixin, CompanyViewMixin, TradeListView):
     """
     Returns the trades of a company
     """
 
-    renderer_classes = (CompanyJsonRenderer,)
+    renderer_classes = (CompanyJsonRenderer, CompanyColumnarJsonRenderer)
+    archive_table = "trade"
 
     def get_filter_kwargs(self):
         id_ = self.get_id()
         return {"seller_id": id_, "seller_pd": False}
 
 
+class TradeCompanyExportView(StreamingExportMixin, TradeCompanyListView):
+    """
+    Streams all trades of a company given by isin as csv or ndjson
+    """
+
+    export_columns = (
+        "id",
+        "created",
+        "price",
+        "amount",
+        "value",
+        "price_bought",
+        "buyer.name",
+        "seller.name",
+        "company.name",
+        "history.buyer_name",
+        "history.seller_name",
+        "history.company_name",
+    )
+
+    def get_filename(self) -> str:
+        return f"trades_{get_company_isin(self.kwargs['isin'])}"
+
+
 class BuyerSellerListView(TradeCompanyListView):
     """
     Returns the Buyer/Sellers of a company
@@ -478,30 +639,14 @@ class BuyerSellerListView(TradeCompanyListView):
 
 
 class SidebarInfoRetrieveView(RetrieveAPIView):
-    def get(self, request, *args, **kwargs):
-        data = dict()
-
-        # TODO: Cache queries
-        companies = Company.objects.select_related("keyfigures").order_by("-id")[:5]
-        bond_rate = InterestRate.get_latest_rate()
-        companies_count = Company.objects.count()
-
-        orders = Order.objects.aggregate(
-            sell_count=Count("id", filter=Q(typ=Order.type_sell())),
-            buy_count=Count("id", filter=Q(typ=Order.type_buy())),
-        )
-        sell_orders_count = orders.get("sell_count")
-        buy_orders_count = orders.get("buy_count")
-
-        serializer = CompanySidebarSerializer(companies, many=True)
+    """
+    Returns the sidebar, which is shown on every page.
 
-        data["companies"] = serializer.data
-        data["bond_rate"] = bond_rate
-        data["companies_count"] = companies_count
-        data["buy_orders_count"] = buy_orders_count
-        data["sell_orders_count"] = sell_orders_count
+    The sidebar is precomputed by the periodic jobs, see core/sidebar.py
+    """
 
-        return Response(data=data)
+    def get(self, request, *args, **kwargs):
+        return Response(data=get_sidebar())
 
 
 class LiquidityOverviewView(RetrieveAPIView):
@@ -519,33 +664,9 @@ class LiquidityOverviewView(RetrieveAPIView):
     def get(self, request, *args, **kwargs):
         user_id = request.user.id
 
-        company = (
-            Company.objects.only("cash", "user_id")
-            .filter(user_id=user_id)
-            .annotate(
-                bond_value=Coalesce(
-                    Subquery(
-                        Bond.objects.filter(company_id=OuterRef("id"))
-                        .values("company_id")
-                        .annotate(s=Sum("value"))
-                        .values("s")[:1],
-                        output_field=DecimalField(),
-                    ),
-                    0,
-                ),
-                buy_orders=Coalesce(
-                    Subquery(
-                        Order.objects.add_value()
-                        .filter(order_by_id=OuterRef("id"), typ=Order.type_buy())
-                        .values("order_by_id")
-                        .annotate(s=Sum("value"))
-                        .values("s")[:1],
-                        output_field=DecimalField(),
-                    ),
-                    0,
-                ),
-            )
-            .values("cash", "bond_value", "buy_orders")
+        # The value of the buy orders is the reserved cash of the company
+        company = Company.objects.filter(user_id=user_id).values(
+            "cash", bond_value=F("keyfigures__bond_value"), buy_orders=F("reserved_cash")
         )
 
         company = company.first()
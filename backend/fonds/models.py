@@ -12,7 +12,7 @@ from unidecode import unidecode
 
 from common.storage import OverwriteStorage
 from common.utils import MarkdownText
-from notify.events import Event, store_event
+from notify.events import Event, store_events
 from users.models import BaseThread, BaseThreadPost, Article, Comment, ChatRoom, Notification
 
 
@@ -159,9 +159,7 @@ class FondApplication(models.Model):
 
         notifications = Notification.objects.bulk_create(notifications)
 
-        for obj in notifications:
-            e = Event(user_id=obj.user_id, typ="Notification", msg=obj.subject)
-            store_event(e)
+        store_events(Event(user_id=obj.user_id, typ="Notification", msg=obj.subject) for obj in notifications)
 
     def decline_application(self) -> Notification:
         """Declines the applications and sends a notification to the user"""
@@ -0,0 +1,122 @@
+import json
+import logging
+import time
+from typing import Callable, List, Tuple
+
+import redis
+
+from notify.events import NOTIFY_GROUP_NAME, NOTIFY_STREAM_NAME, SCHEMA_VERSION, Event
+from tsg.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class EventConsumer:
+    """
+    Reference consumer of the notify stream.
+
+    The go websocket worker consumes the stream the same way. This consumer is used in
+    the tests and can be used as a fallback worker.
+
+    Events are read in batches via a consumer group. Each read event stays pending for
+    this consumer until it has been acknowledged. After a restart the consumer first
+    reads its own pending events again, so no event gets lost. An event which
+    has been handled but not acknowledged yet can be delivered a second time.
+    """
+
+    # Start id for reading the pending events of this consumer
+    PENDING = "0-0"
+
+    # Id for reading events which have not been delivered to any consumer of the group yet
+    NEW = ">"
+
+    def __init__(
+        self, consumer: str, group: str = NOTIFY_GROUP_NAME, stream: str = NOTIFY_STREAM_NAME, count: int = 100
+    ):
+        self.consumer = consumer
+        self.group = group
+        self.stream = stream
+        self.count = count
+
+        # Read the pending events first, see read()
+        self._reading_pending = True
+        self._pending_id = self.PENDING
+
+    def create_group(self) -> None:
+        """Creates the consumer group and the stream if they do not exist yet"""
+        try:
+            redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if not str(e).startswith("BUSYGROUP"):
+                raise
+
+    def read(self, block: int = None) -> List[Tuple[str, Event]]:
+        """
+        Returns the next batch of events with their stream ids.
+
+        As long as this consumer has pending events, those are returned. Afterwards, new events
+        are read, waiting up to block milliseconds for them if block is given.
+        """
+        while self._reading_pending:
+            response = redis_client.xreadgroup(
+                self.group, self.consumer, {self.stream: self._pending_id}, count=self.count
+            )
+            entries = response[0][1] if response else []
+
+            if entries:
+                self._pending_id = entries[-1][0]
+                return self._decode(entries)
+
+            # All pending events have been read, continue with the new ones
+            self._reading_pending = False
+
+        response = redis_client.xreadgroup(
+            self.group, self.consumer, {self.stream: self.NEW}, count=self.count, block=block
+        )
+        return self._decode(response[0][1] if response else [])
+
+    def _decode(self, entries: list) -> List[Tuple[str, Event]]:
+        events = list()
+        skipped = list()
+
+        for id_, fields in entries:
+            id_ = id_.decode()
+
+            # pending entries which have been trimmed from the stream in the meantime have no fields anymore
+            if not fields or int(fields.get(b"v", 0)) != SCHEMA_VERSION:
+                logger.warning(f"Skipping event {id_} of {self.stream} with unknown schema: {fields}")
+                skipped.append(id_)
+                continue
+
+            data = json.loads(fields[b"event"])
+            events.append((id_, Event(user_id=data["user_id"], typ=data["typ"], msg=data["msg"])))
+
+        # Events which cannot be handled would otherwise be delivered again and again
+        self.ack(skipped)
+        return events
+
+    def ack(self, ids: List[str]) -> None:
+        """Acknowledges the given events, so they will not be delivered again"""
+        if ids:
+            redis_client.xack(self.stream, self.group, *ids)
+
+    def run(self, handle: Callable[[Event], None], block: int = 5000) -> None:
+        """
+        Consumes the stream forever and calls handle for each event.
+
+        A batch gets acknowledged after all of its events have been handled.
+        """
+        self.create_group()
+
+        while True:
+            try:
+                batch = self.read(block=block)
+            except redis.exceptions.ConnectionError:
+                logger.error("Could not connect with redis! Retrying in a second.")
+                time.sleep(1)
+                continue
+
+            for _, event in batch:
+                handle(event)
+
+            self.ack([id_ for id_, _ in batch])
@@ -1,14 +1,22 @@
 import redis
 import logging
 import json
+from typing import Iterable
 
-from tsg import settings
+from tsg.redis import redis_client
 
-NOTIFY_CHANNEL_NAME = "TSG_NOTIFY"
+NOTIFY_STREAM_NAME = "TSG_NOTIFY_STREAM"
 
-logger = logging.getLogger(__name__)
+# Consumer group of the go websocket worker
+NOTIFY_GROUP_NAME = "websocket"
+
+# Version of the fields of a stored event. Consumers skip events with a version they do not know.
+SCHEMA_VERSION = 1
 
-r = redis.Redis.from_url(settings.REDIS_URL)
+# The stream gets trimmed to roughly this length, so unconsumed events cannot fill up redis
+MAXLEN = 100_000
+
+logger = logging.getLogger(__name__)
 
 
 class Event:
@@ -32,15 +40,33 @@ def store_event(event: Event) -> None:
     The stored event then gets consumed by the go worker who proceeds to send
     the event to the user via a websocket connection if the user is connected.
     """
+    store_events([event])
+
+
+def store_events(events: Iterable[Event]) -> None:
+    """
+    Stores multiple events in the redis stream with a single round trip.
 
-    if isinstance(event, Event) is False:
-        logger.error(f"Can only save objects of typ {Event.__class__}. Object was of class {event.__class__}")
+    Each event becomes an entry of the stream with the schema version and the json encoded event.
+    The stream is consumed via a consumer group (see notify.consumer), so an event is only
+    removed from the pending entries of a consumer once it has been acknowledged.
+    """
+
+    fields = list()
+    for event in events:
+        if isinstance(event, Event) is False:
+            logger.error(f"Can only save objects of typ {Event.__class__}. Object was of class {event.__class__}")
+            continue
+        fields.append({"v": SCHEMA_VERSION, "event": event.to_json()})
+
+    if not fields:
         return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for f in fields:
+        pipe.xadd(NOTIFY_STREAM_NAME, f, maxlen=MAXLEN, approximate=True)
+
     try:
-        r.ping()
+        pipe.execute()
     except redis.exceptions.ConnectionError:
-        logger.error("Could not connect with redis!")
-        return
-
-    if not r.lpush(NOTIFY_CHANNEL_NAME, event.to_json()):
-        logger.error(f"Failed to push {event} to {NOTIFY_CHANNEL_NAME} queue!")
+        logger.error(f"Could not connect with redis! Dropped {len(fields)} events.")
@@ -0,0 +1,129 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import TestCase, mock
+
+from notify import events
+from notify.consumer import EventConsumer
+from notify.events import NOTIFY_STREAM_NAME, Event, store_event, store_events
+from tsg.redis import redis_client
+
+
+class StoreEventsTest(TestCase):
+    def setUp(self):
+        redis_client.delete(NOTIFY_STREAM_NAME)
+        self.consumer = EventConsumer("test", count=10)
+        self.consumer.create_group()
+
+    def tearDown(self):
+        redis_client.delete(NOTIFY_STREAM_NAME)
+
+    @staticmethod
+    def messages(batch) -> list:
+        return [event.msg for _, event in batch]
+
+    def test_store_event(self):
+        store_event(Event(user_id=1, typ="Bond", msg="first"))
+        store_event(Event(user_id=2, typ="Bond", msg="second"))
+
+        batch = self.consumer.read()
+        self.assertEqual(self.messages(batch), ["first", "second"])
+        self.assertEqual(batch[1][1].user_id, 2)
+        self.assertEqual(batch[1][1].typ, "Bond")
+
+    def test_store_events_single_round_trip(self):
+        with mock.patch.object(redis_client, "pipeline", wraps=redis_client.pipeline) as pipeline:
+            store_events(Event(user_id=i, typ="Order", msg=str(i)) for i in range(25))
+
+        pipeline.assert_called_once()
+        self.assertEqual(redis_client.xlen(NOTIFY_STREAM_NAME), 25)
+
+        # consumed in batches in the same order
+        self.assertEqual(self.messages(self.consumer.read()), [str(i) for i in range(10)])
+        self.assertEqual(self.messages(self.consumer.read()), [str(i) for i in range(10, 20)])
+        self.assertEqual(self.messages(self.consumer.read()), [str(i) for i in range(20, 25)])
+        self.assertEqual(self.consumer.read(), [])
+
+    def test_stream_gets_trimmed(self):
+        with mock.patch.object(events, "MAXLEN", 10):
+            store_events(Event(user_id=1, typ="Order", msg=str(i)) for i in range(1000))
+
+        # trimming is approximate
+        self.assertLess(redis_client.xlen(NOTIFY_STREAM_NAME), 1000)
+
+    def test_invalid_events_are_skipped(self):
+        store_events([Event(user_id=1, typ="Order", msg="valid"), "invalid"])
+        self.assertEqual(self.messages(self.consumer.read()), ["valid"])
+
+    def test_no_events(self):
+        with mock.patch.object(redis_client, "pipeline") as pipeline:
+            store_events([])
+        pipeline.assert_not_called()
+
+
+class EventConsumerTest(TestCase):
+    def setUp(self):
+        redis_client.delete(NOTIFY_STREAM_NAME)
+        EventConsumer("test").create_group()
+
+    def tearDown(self):
+        redis_client.delete(NOTIFY_STREAM_NAME)
+
+    def test_create_group_twice(self):
+        EventConsumer("test").create_group()
+
+    def test_unacknowledged_events_are_redelivered_after_restart(self):
+        store_events(Event(user_id=1, typ="Order", msg=str(i)) for i in range(3))
+
+        consumer = EventConsumer("worker")
+        batch = consumer.read()
+        consumer.ack([batch[0][0]])
+
+        # worker crashes and restarts, the unacknowledged events are read again
+        restarted = EventConsumer("worker")
+        batch = restarted.read()
+        self.assertEqual([event.msg for _, event in batch], ["1", "2"])
+        restarted.ack([id_ for id_, _ in batch])
+
+        store_event(Event(user_id=1, typ="Order", msg="new"))
+        batch = restarted.read()
+        self.assertEqual([event.msg for _, event in batch], ["new"])
+        restarted.ack([id_ for id_, _ in batch])
+
+        # nothing pending anymore
+        self.assertEqual(EventConsumer("worker").read(), [])
+        self.assertEqual(redis_client.xpending(NOTIFY_STREAM_NAME, "websocket")["pending"], 0)
+
+    def test_events_are_delivered_once_per_group(self):
+        store_events(Event(user_id=1, typ="Order", msg=str(i)) for i in range(4))
+
+        first = EventConsumer("first", count=2).read()
+        second = EventConsumer("second", count=2).read()
+
+        self.assertEqual([e.msg for _, e in first + second], ["0", "1", "2", "3"])
+
+    def test_unknown_schema_version_gets_skipped(self):
+        redis_client.xadd(NOTIFY_STREAM_NAME, {"v": 99, "event": "{}"})
+        store_event(Event(user_id=1, typ="Order", msg="known"))
+
+        consumer = EventConsumer("worker")
+        self.assertEqual([e.msg for _, e in consumer.read()], ["known"])
+        self.assertEqual(redis_client.xpending(NOTIFY_STREAM_NAME, "websocket")["pending"], 1)
+
+    def test_run(self):
+        store_events(Event(user_id=1, typ="Order", msg=str(i)) for i in range(3))
+
+        handled = list()
+
+        def handle(event):
+            handled.append(event.msg)
+            if len(handled) == 3:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            EventConsumer("worker").run(handle, block=10)
+
+        self.assertEqual(handled, ["0", "1", "2"])
@@ -5,28 +5,131 @@ license that can be found in the LICENSE.txt file.
 """
 
 import logging
+import threading
+import uuid
 
 import redis
 from contextlib import contextmanager
+from django.db import transaction
 
-from tsg import settings
-
-redis_client = redis.Redis.from_url(settings.REDIS_URL)
+from periodic_tasks.ledger import RunLedger
+from periodic_tasks.models import LeaseFence
+from tsg.redis import redis_client
 
 logger = logging.getLogger(__name__)
 
 
+class LockLost(Exception):
+    """
+    Raised if a task notices that it no longer holds its lease, so another worker might be running the same task.
+    """
+
+
+class LeaseLock:
+    """
+    Lock in redis which is only leased for a given time to the owner.
+
+    The lock expires after ttl seconds, so a crashed worker cannot block a task forever. While the
+    owner is alive, a background thread renews the lease. Only the owner can renew or release the lock.
+
+    Each acquisition also gets a fencing token from a counter in redis. The token increases
+    monotonically, so a later holder of the lock always has a greater token than an earlier one.
+    The database only accepts the writes of the greatest token, see CeleryTask.assert_lease.
+    """
+
+    TTL = 60
+
+    # Only touch the lock if it is still held by the given owner
+    RENEW_SCRIPT = redis_client.register_script(
+        """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("pexpire", KEYS[1], ARGV[2])
+        end
+        return 0
+        """
+    )
+
+    RELEASE_SCRIPT = redis_client.register_script(
+        """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("del", KEYS[1])
+        end
+        return 0
+        """
+    )
+
+    def __init__(self, name: str, ttl: float = TTL):
+        self.name = name
+        self.ttl = ttl
+        self.owner = uuid.uuid4().hex
+        self.token = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._renewal = None
+
+    @property
+    def fence_key(self) -> str:
+        return f"{self.name}:fence"
+
+    @property
+    def ttl_ms(self) -> int:
+        return int(self.ttl * 1000)
+
+    def acquire(self) -> bool:
+        """
+        Acquires the lock and starts renewing it. Returns False if someone else holds the lock.
+        """
+        if not redis_client.set(self.name, self.owner, nx=True, px=self.ttl_ms):
+            return False
+
+        self.token = redis_client.incr(self.fence_key)
+
+        self._renewal = threading.Thread(target=self._renew, name=f"lease-{self.name}", daemon=True)
+        self._renewal.start()
+        return True
+
+    def _renew(self) -> None:
+        # Renew three times per ttl, so a single failed renewal does not lose the lease
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.RENEW_SCRIPT(keys=[self.name], args=[self.owner, self.ttl_ms])
+            except redis.exceptions.RedisError:
+                logger.exception(f"Could not renew the lease of {self.name}")
+                continue
+
+            if not renewed:
+                self.lost = True
+                logger.error(f"Lease of {self.name} with token {self.token} has been lost!")
+                return
+
+    def is_held(self) -> bool:
+        """Returns True if the lock is still held by this owner"""
+        if self.lost:
+            return False
+        return redis_client.get(self.name) == self.owner.encode()
+
+    def release(self) -> None:
+        """Stops the renewal and deletes the lock if it is still held by this owner"""
+        self._stop.set()
+        if self._renewal is not None:
+            self._renewal.join()
+
+        self.RELEASE_SCRIPT(keys=[self.name], args=[self.owner])
+
+
 @contextmanager
-def redis_lock(lock_name):
+def redis_lock(lock_name: str, ttl: float = LeaseLock.TTL):
     """
-    Yield 1 if specified lock_name is not already set in redis. Otherwise returns 0.
+    Yields the acquired LeaseLock if the lock_name is not already held by someone else. Otherwise yields None.
     """
 
-    status = redis_client.set(lock_name, "lock", nx=True)
+    lease = LeaseLock(lock_name, ttl)
+    acquired = lease.acquire()
     try:
-        yield status
+        yield lease if acquired else None
     finally:
-        redis_client.delete(lock_name)
+        if acquired:
+            lease.release()
 
 
 class CeleryTask:
@@ -34,25 +137,70 @@ class CeleryTask:
     'Interface' that ensures all celery tasks have a run method
     """
 
+    # Tasks matching orders count their fills, so they show up in the run ledger.
+    fills = 0
+
+    # Set while the task runs under its lock, see get_lock_and_run
+    lease = None
+    fencing_token = None
+
     def run(self) -> None:
         raise NotImplementedError
 
     def lock_run(self) -> None:
+        """
+        Runs the task if its lock can be acquired and records the run in the ledger (see periodic_tasks.models.TaskRun)
+        """
         lock_id = self.get_lock_id()
-        self.get_lock_and_run(lock_id, self.run)
+        acquired = False
+        ledger = RunLedger(self.__class__.__name__)
+
+        try:
+            with ledger:
+                acquired = self.get_lock_and_run(lock_id, self.run)
+        finally:
+            ledger.save(
+                contended=not acquired and not ledger.failed, fills=self.fills, fencing_token=self.fencing_token
+            )
 
     def get_lock_and_run(self, lock_id: str, fun: callable) -> bool:
         """
         Runs a function if the lock specified by the lock_id has been acquired.
+
+        While the function runs, the lease and its fencing token are available as self.lease
+        and self.fencing_token.
         """
-        with redis_lock(lock_id) as acquired:
-            if acquired:
-                fun()
+        with redis_lock(lock_id) as lease:
+            if lease:
+                self.lease = lease
+                self.fencing_token = lease.token
+                try:
+                    fun()
+                finally:
+                    self.lease = None
                 return True
             else:
                 logger.warning(f"Task {self.__class__} already running. Could not acquire lock! Lock_id was: {lock_id}")
                 return False
 
+    def assert_lease(self) -> None:
+        """
+        Raises LockLost if the task runs under a lease which it does not hold anymore.
+
+        Tasks call this in the transaction of their writes, right before they write their results.
+        Besides checking the lease in redis, the fencing token is stored in the database (see LeaseFence).
+        The fence stays locked until the transaction ends, so a task which lost its lock either committed
+        before the new lock holder writes or rolls back instead of overwriting its results.
+        """
+        if self.lease is None:
+            return
+
+        if not transaction.get_connection().in_atomic_block:
+            raise RuntimeError("The lease has to be asserted in the transaction of the writes")
+
+        if not self.lease.is_held() or not LeaseFence.advance(self.lease.name, self.fencing_token):
+            raise LockLost(f"{self.__class__.__name__} lost its lease with the fencing token {self.fencing_token}")
+
     def get_lock_id(self) -> str:
         """Returns the lock_id which is in that case the name of the class subclassing this 'Interface'"""
         return str(self.__class__)
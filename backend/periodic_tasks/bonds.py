@@ -11,8 +11,9 @@ from django.db.models import F
 from django.utils import timezone
 
 from core.models import Bond, StatementOfAccount, Company
-from notify.events import Event, store_event
+from notify.events import Event, store_events
 from periodic_tasks.base import CeleryTask
+from stats.models import KeyFigures
 
 from users.models import Notification
 
@@ -46,9 +47,11 @@ class BondPayout(CeleryTask):
 
         with transaction.atomic():
             dict_ = dict()
+            bond_values = dict()
             for bond in bonds:
                 payout = bond.calc_value()
                 company_id = bond.company_id
+                bond_values[company_id] = bond_values.get(company_id, 0) + bond.value
 
                 statement = StatementOfAccount(company_id=company_id, received=True, amount=1, value=payout, typ="Bond")
 
@@ -76,10 +79,18 @@ class BondPayout(CeleryTask):
                     company.cash = F("cash") + payout
                     dict_[key] = company
 
+            self.assert_lease()
+
             # TODO: Batch same as in orders
             list_ = [dict_[k] for k in dict_]
             Company.objects.bulk_update(list_, ["cash"])
 
+            # Paid out bonds are no longer part of the liquidity, see core/signals.py -> add_bond_value
+            key_figures = list(KeyFigures.objects.filter(company_id__in=bond_values))
+            for k in key_figures:
+                k.bond_value = F("bond_value") - bond_values[k.company_id]
+            KeyFigures.objects.bulk_update(key_figures, ["bond_value"])
+
             statements = []
             for s in self.dict_bonds:
                 obj = self.dict_bonds[s]
@@ -93,6 +104,4 @@ class BondPayout(CeleryTask):
             # Store events in the redis database,
             # where the golang websocket worker can pick it up
             # and send them over to users if they are currently online and connected.
-            for obj in self.notifications:
-                event = Event(user_id=obj.user_id, typ="Bond", msg=obj.text)
-                store_event(event)
+            store_events(Event(user_id=obj.user_id, typ="Bond", msg=obj.text) for obj in self.notifications)
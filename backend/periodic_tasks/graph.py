@@ -0,0 +1,204 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+import uuid
+from typing import Callable, Iterable, List, Optional, Type
+
+from celery import chain, group, shared_task
+
+from common.cache import bump_market_version
+from periodic_tasks.base import CeleryTask, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    A single node of a JobGraph.
+
+    A job wraps a CeleryTask and declares by name which other jobs of the same graph
+    have to be finished before the job may run.
+
+    Optionally, a job can have a when predicate. The job is then skipped if there is nothing to do for it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        task_class: Type[CeleryTask],
+        depends_on: Iterable[str] = (),
+        when: Optional[Callable[[], bool]] = None,
+    ):
+        self.name = name
+        self.task_class = task_class
+        self.depends_on = tuple(depends_on)
+        self.when = when
+
+    def run(self) -> None:
+        if self.when is not None and not self.when():
+            logger.info(f"Skipping job {self} as there is nothing to do")
+            return
+
+        self.task_class().lock_run()
+
+    def __str__(self):
+        return self.name
+
+
+class JobGraph:
+    """
+    A small dependency graph of periodic jobs which make up a tick.
+
+    The jobs are grouped into stages. A job is placed in the first stage after all of its
+    dependencies, so all jobs of one stage are independent of each other. Each stage is dispatched
+    as a celery group, the stages themselves are chained. Hence, the latency of a tick is the
+    critical path through the graph and not the sum of all jobs anymore.
+
+    Only one run of a graph is active at a time. If the next beat tick arrives while the graph
+    is still running, the tick is not dispatched but marked as pending. Once the running tick
+    has finished, a single new run gets dispatched for all ticks which have been skipped in the meantime.
+
+    Each run stores its own token in the running flag. Only the first finish of a run removes the flag,
+    so a run which is finished several times, e.g. by the error callbacks of several failed jobs,
+    bumps the market version and dispatches the pending ticks only once.
+    """
+
+    # All declared graphs by name, so the celery tasks only need to pass the name around.
+    registry = dict()
+
+    # If a worker dies in the middle of a tick the running flag would never be removed.
+    # So it expires after a while, which is much longer than any tick should ever take.
+    RUNNING_TIMEOUT = 60 * 60
+
+    # Removes the running flag if it still belongs to the given run and then the pending flag.
+    # Returns -1 if the run has already been finished, otherwise whether ticks are pending.
+    FINISH_SCRIPT = redis_client.register_script(
+        """
+        if redis.call("get", KEYS[1]) ~= ARGV[1] then
+            return -1
+        end
+        redis.call("del", KEYS[1])
+        return redis.call("del", KEYS[2])
+        """
+    )
+
+    def __init__(self, name: str, jobs: List[Job]):
+        self.name = name
+        self.jobs = dict()
+
+        for job in jobs:
+            if job.name in self.jobs:
+                raise ValueError(f"Job {job} has been declared twice in the graph {name}")
+            self.jobs[job.name] = job
+
+        self.stages = self._build_stages()
+        JobGraph.registry[name] = self
+
+    def _build_stages(self) -> List[List[Job]]:
+        """
+        Groups the jobs into stages (topological levels of the graph).
+
+        Raises a ValueError if a job depends on an unknown job or if the graph contains a cycle.
+        """
+        for job in self.jobs.values():
+            for dependency in job.depends_on:
+                if dependency not in self.jobs:
+                    raise ValueError(f"Job {job} of graph {self.name} depends on the unknown job {dependency}")
+
+        stages = list()
+        done = set()
+        remaining = list(self.jobs.values())
+
+        while remaining:
+            stage = [job for job in remaining if all(d in done for d in job.depends_on)]
+
+            if not stage:
+                raise ValueError(f"Graph {self.name} contains a cycle: {', '.join(map(str, remaining))}")
+
+            stages.append(stage)
+            done.update(job.name for job in stage)
+            remaining = [job for job in remaining if job.name not in done]
+
+        return stages
+
+    @property
+    def running_key(self) -> str:
+        return f"tsg:graph:{self.name}:running"
+
+    @property
+    def pending_key(self) -> str:
+        return f"tsg:graph:{self.name}:pending"
+
+    def signature(self, token: str):
+        """
+        Returns the celery canvas for the run of the graph with the given token.
+        """
+        canvas = list()
+        for stage in self.stages:
+            signatures = [run_graph_job.si(self.name, job.name) for job in stage]
+            canvas.append(signatures[0] if len(signatures) == 1 else group(signatures))
+
+        canvas.append(finish_graph.si(self.name, token))
+        return chain(*canvas)
+
+    def dispatch(self) -> bool:
+        """
+        Dispatches a run of the graph.
+
+        Returns False if the graph is already running. In that case the run is
+        coalesced into a single follow up run after the current one has finished.
+        """
+        token = uuid.uuid4().hex
+        if not redis_client.set(self.running_key, token, nx=True, ex=self.RUNNING_TIMEOUT):
+            redis_client.set(self.pending_key, "pending", ex=self.RUNNING_TIMEOUT)
+            logger.warning(f"Graph {self.name} is still running. Coalescing tick into the next run.")
+            return False
+
+        try:
+            self.signature(token).apply_async(link_error=finish_graph.si(self.name, token))
+        except Exception:
+            redis_client.delete(self.running_key)
+            raise
+
+        return True
+
+    def finish(self, token: str) -> bool:
+        """
+        Marks the run with the given token as finished, invalidates the cached responses and
+        dispatches a new run if ticks have been skipped in the meantime.
+
+        Returns False if the run has already been finished before.
+        """
+        pending = self.FINISH_SCRIPT(keys=[self.running_key, self.pending_key], args=[token])
+        if pending < 0:
+            logger.info(f"Run {token} of graph {self.name} has already been finished")
+            return False
+
+        # The jobs changed the data of the whole market, so all cached responses are outdated
+        bump_market_version()
+
+        if pending:
+            logger.info(f"Ticks of graph {self.name} have been skipped while running. Dispatching them now.")
+            self.dispatch()
+
+        return True
+
+
+@shared_task
+def run_graph_job(graph_name: str, job_name: str) -> None:
+    """
+    Runs a single job of a graph
+    """
+    JobGraph.registry[graph_name].jobs[job_name].run()
+
+
+@shared_task
+def finish_graph(graph_name: str, token: str) -> None:
+    """
+    Last task of each graph run, see JobGraph.finish
+    """
+    JobGraph.registry[graph_name].finish(token)
@@ -7,25 +7,62 @@ license that can be found in the LICENSE.txt file.
 from celery.task import task
 
 from periodic_tasks.bonds import BondPayout
+from periodic_tasks.graph import Job, JobGraph
 from periodic_tasks.key_figures import KeyFiguresTask, PastKeyFiguresTask
 from periodic_tasks.orders import OrderTask, CentralBankOrdersTask, DynamicOrdersTask
 from periodic_tasks.rates import CalculateRates
+from periodic_tasks.reservations import ReservedAmountTask, ReservedCashTask
+from periodic_tasks.retention import TaskRunRetentionTask
+from periodic_tasks.scheduler import AdaptiveScheduler, pending_dynamic_orders
+from periodic_tasks.sidebar import SidebarTask
+
+# Matching orders and paying out bonds are independent of each other.
+# The key figures need the cash and depots after both of them. The centralbank
+# prices its new sell orders by the freshly calculated share prices, which are also shown in the sidebar.
+FIVE_MINUTES_GRAPH = JobGraph(
+    "five_minutes",
+    [
+        Job("orders", OrderTask),
+        Job("bonds", BondPayout),
+        Job("key_figures", KeyFiguresTask, depends_on=["orders", "bonds"]),
+        Job("centralbank_orders", CentralBankOrdersTask, depends_on=["key_figures"]),
+        Job("sidebar", SidebarTask, depends_on=["key_figures"]),
+    ],
+)
+
+HOUR_GRAPH = JobGraph(
+    "hour",
+    [
+        Job("rates", CalculateRates),
+        Job("dynamic_orders", DynamicOrdersTask, when=pending_dynamic_orders),
+        Job("reserved_cash", ReservedCashTask, depends_on=["dynamic_orders"]),
+        Job("reserved_amount", ReservedAmountTask),
+        Job("sidebar", SidebarTask, depends_on=["rates"]),
+    ],
+)
+
+DAILY_GRAPH = JobGraph(
+    "daily", [Job("past_key_figures", PastKeyFiguresTask), Job("task_run_retention", TaskRunRetentionTask)]
+)
+
+FIVE_MINUTES_SCHEDULER = AdaptiveScheduler(FIVE_MINUTES_GRAPH)
+
+
+@task()
+def adaptive_tick():
+    FIVE_MINUTES_SCHEDULER.tick()
 
 
 @task()
 def five_minutes_jobs():
-    OrderTask().lock_run()
-    BondPayout().lock_run()
-    KeyFiguresTask().lock_run()
-    CentralBankOrdersTask().lock_run()
+    FIVE_MINUTES_GRAPH.dispatch()
 
 
 @task()
 def hour_jobs():
-    CalculateRates().lock_run()
-    DynamicOrdersTask().lock_run()
+    HOUR_GRAPH.dispatch()
 
 
 @task()
 def daily_jobs():
-    PastKeyFiguresTask().lock_run()
+    DAILY_GRAPH.dispatch()
@@ -12,6 +12,7 @@ from django.db.models import Sum, Max, Min
 from django.utils import timezone
 
 from core.models import Company, DepotPosition, Order, Trade
+from core.shareholders import build_shareholders
 from periodic_tasks.base import CeleryTask
 from stats.models import KeyFigures, PastKeyFigures
 from tsg.const import CENTRALBANK
@@ -39,6 +40,9 @@ class KeyFiguresTask(CeleryTask):
 
     def run(self):
         with transaction.atomic():
+            # Also stores the largest shareholders of every company for the shareholder views
+            free_floats = build_shareholders()
+
             for c in (
                 Company.objects.select_related("keyfigures")
                 .prefetch_related("depotposition_set", "bond_set", "orders_of")
@@ -53,10 +57,12 @@ class KeyFiguresTask(CeleryTask):
                 # Not all companies have bonds, the queryset evaluation would return
                 # none if it does not have companies. So we use  the "or" operator to return 0 in that case
                 bond_value = c.bond_set.aggregate(s=Sum("value")).get("s", 0) or 0
-                k.book_value = KeyFigures.calc_book_value(c, bond_value)
+                k.bond_value = bond_value
+                k.depot_value, public_depot_value = KeyFigures.calc_depot_values(c)
+                k.book_value = KeyFigures.calc_book_value(c, bond_value, public_depot_value)
                 k.activity = k.activity
                 k.cdgr = KeyFigures.calc_cdgr(k.book_value, c)
-                k.free_float = KeyFigures.calc_free_float(c)
+                k.free_float = free_floats.get(c.id, 0)
                 k.ttoc = KeyFigures.calc_ttoc(c, bond_value, k.book_value)
                 k.share_price = KeyFigures.calc_share_price(c)
 
@@ -69,7 +75,8 @@ class KeyFiguresTask(CeleryTask):
 
     def insert_in_db(self):
         KeyFigures.objects.bulk_update(
-            self.key_figures, ["book_value", "activity", "cdgr", "free_float", "ttoc", "share_price"]
+            self.key_figures,
+            ["book_value", "activity", "cdgr", "free_float", "ttoc", "share_price", "bond_value", "depot_value"],
         )
         self.key_figures = list()
 
@@ -0,0 +1,89 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+import time
+
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from periodic_tasks.models import TaskRun
+
+logger = logging.getLogger(__name__)
+
+
+class RunLedger:
+    """
+    Context manager which measures a single run of a periodic task.
+
+    While active, every query of the current database connection goes through the
+    ledger, so we can count the queries, the time spent in the database and the
+    rows inserted & updated without having to run with DEBUG=True.
+    """
+
+    def __init__(self, task: str):
+        self.task = task
+        self.started = None
+        self.finished = None
+        self.wall_time = 0
+        self.query_count = 0
+        self.query_time = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.failed = False
+        self._wrapper = None
+        self._start = 0
+
+    def __enter__(self):
+        self.started = timezone.now()
+        self._start = time.perf_counter()
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._wrapper.__exit__(exc_type, exc_val, exc_tb)
+        self.wall_time = time.perf_counter() - self._start
+        self.finished = timezone.now()
+        self.failed = exc_type is not None
+        return False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.query_count += 1
+
+            rows = max(context["cursor"].rowcount, 0)
+            statement = sql.lstrip()[:6].upper()
+            if statement == "INSERT":
+                self.rows_inserted += rows
+            elif statement == "UPDATE":
+                self.rows_updated += rows
+
+    def save(self, contended: bool, fills: int = 0, fencing_token: int = None) -> None:
+        """
+        Persists the measured run. A failing ledger should never let a tick fail, so errors only get logged.
+        """
+        try:
+            TaskRun.objects.create(
+                task=self.task,
+                started=self.started,
+                finished=self.finished,
+                wall_time=self.wall_time,
+                query_count=self.query_count,
+                query_time=self.query_time,
+                rows_inserted=self.rows_inserted,
+                rows_updated=self.rows_updated,
+                fills=fills,
+                contended=contended,
+                failed=self.failed,
+                fencing_token=fencing_token,
+            )
+        except DatabaseError:
+            logger.exception(f"Could not save the run of {self.task} in the ledger")
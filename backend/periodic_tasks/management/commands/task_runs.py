@@ -0,0 +1,61 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from django.core.management.base import BaseCommand
+
+from periodic_tasks.models import TaskRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints percentiles of the wall time, queries and rows of the last runs of each periodic task. "
+        "With --prune, the runs older than the retention are deleted instead."
+    )
+
+    # (key of the summary, width of the column)
+    COLUMNS = (
+        ("runs", 6),
+        ("contended", 10),
+        ("failed", 7),
+        ("wall_time_p50", 14),
+        ("wall_time_p90", 14),
+        ("wall_time_p99", 14),
+        ("query_count_p90", 16),
+        ("query_time_p90", 15),
+        ("rows_inserted_p90", 18),
+        ("rows_updated_p90", 17),
+        ("fills_p90", 10),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--last", type=int, default=100, help="Amount of runs per task to take into account")
+        parser.add_argument("--task", type=str, default=None, help="Only show the given task, e.g. OrderTask")
+        parser.add_argument("--prune", action="store_true", help="Delete the runs older than the retention")
+        parser.add_argument(
+            "--days", type=int, default=None, help="Retention in days, by default TASK_RUN_RETENTION_DAYS"
+        )
+
+    def handle(self, *args, **options):
+        if options["prune"]:
+            deleted = TaskRun.prune(options["days"])
+            self.stdout.write(f"Deleted {deleted} runs")
+            return
+
+        summary = TaskRun.summary(last=options["last"], task=options["task"])
+
+        if not summary:
+            self.stdout.write("No runs recorded yet.")
+            return
+
+        self.stdout.write("task".ljust(24) + "".join(name.rjust(width) for name, width in self.COLUMNS))
+
+        for row in summary:
+            line = row["task"].ljust(24)
+            for name, width in self.COLUMNS:
+                value = row[name]
+                value = f"{value:.3f}" if isinstance(value, float) else str(value)
+                line += value.rjust(width)
+            self.stdout.write(line)
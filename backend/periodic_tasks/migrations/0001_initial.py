@@ -0,0 +1,38 @@
+# Generated by Django 3.0.4 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRun',
+            fields=[
+                ('id', models.BigAutoField(editable=False, primary_key=True, serialize=False)),
+                ('task', models.CharField(max_length=100)),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField()),
+                ('wall_time', models.FloatField(default=0)),
+                ('query_count', models.PositiveIntegerField(default=0)),
+                ('query_time', models.FloatField(default=0)),
+                ('rows_inserted', models.PositiveIntegerField(default=0)),
+                ('rows_updated', models.PositiveIntegerField(default=0)),
+                ('fills', models.PositiveIntegerField(default=0)),
+                ('contended', models.BooleanField(default=False)),
+                ('failed', models.BooleanField(default=False)),
+            ],
+            options={
+                'db_table': 'task_run',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='taskrun',
+            index=models.Index(fields=['task', '-id'], name='task_run_task_ae4c85_idx'),
+        ),
+    ]
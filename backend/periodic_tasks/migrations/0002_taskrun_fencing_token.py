@@ -0,0 +1,18 @@
+# Generated by Django 3.0.4 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('periodic_tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskrun',
+            name='fencing_token',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.4 on 2026-10-19 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('periodic_tasks', '0002_taskrun_fencing_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseFence',
+            fields=[
+                ('name', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('token', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'lease_fence',
+            },
+        ),
+    ]
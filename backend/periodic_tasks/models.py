@@ -0,0 +1,163 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Returns the p-th percentile (nearest-rank) of the given values
+    """
+    if not values:
+        return 0
+
+    values = sorted(values)
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class TaskRun(models.Model):
+    """
+    Ledger entry for a single run of a periodic task (see CeleryTask.lock_run).
+
+    It stores how long a run took, how many queries it needed and how many rows it touched.
+    If the lock of the task could not be acquired the run is stored as well, but marked as contended.
+
+    The ledger lets us see which ticks are getting slow before players notice it.
+    Runs older than TASK_RUN_RETENTION_DAYS are deleted daily, see prune().
+    """
+
+    id = models.BigAutoField(primary_key=True, editable=False)
+
+    # name of the CeleryTask subclass, for instance OrderTask
+    task = models.CharField(max_length=100)
+
+    started = models.DateTimeField()
+    finished = models.DateTimeField()
+
+    # in seconds
+    wall_time = models.FloatField(default=0)
+
+    query_count = models.PositiveIntegerField(default=0)
+
+    # time spent in the database in seconds
+    query_time = models.FloatField(default=0)
+
+    rows_inserted = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+
+    # Amount of matched orders, only set by the OrderTask
+    fills = models.PositiveIntegerField(default=0)
+
+    # True if the task did not run because the lock was already taken
+    contended = models.BooleanField(default=False)
+
+    failed = models.BooleanField(default=False)
+
+    # Fencing token of the lease the run has been executed with (see periodic_tasks.base.LeaseLock)
+    fencing_token = models.BigIntegerField(null=True)
+
+    class Meta:
+        db_table = "task_run"
+        indexes = [models.Index(fields=["task", "-id"])]
+
+    def __str__(self):
+        return f"{self.task} {self.started}: {self.wall_time}s"
+
+    @classmethod
+    def prune(cls, days: int = None) -> int:
+        """
+        Deletes the runs started more than the given amount of days ago, by default TASK_RUN_RETENTION_DAYS.
+        Returns the amount of deleted runs.
+        """
+        days = settings.TASK_RUN_RETENTION_DAYS if days is None else days
+        deleted, _ = cls.objects.filter(started__lt=timezone.now() - timedelta(days=days)).delete()
+        return deleted
+
+    @classmethod
+    def summary(cls, last: int = 100, task: str = None) -> list:
+        """
+        Returns percentiles over the last runs of each task.
+
+        Contended runs did not do any work, so they are only counted and
+        not taken into account for the percentiles.
+        """
+        tasks = [task] if task else cls.objects.order_by("task").values_list("task", flat=True).distinct()
+
+        summary = list()
+        for name in tasks:
+            runs = list(cls.objects.filter(task=name).order_by("-id")[:last])
+            if not runs:
+                continue
+
+            ran = [r for r in runs if not r.contended]
+            wall_times = [r.wall_time for r in ran]
+            queries = [r.query_count for r in ran]
+            query_times = [r.query_time for r in ran]
+
+            summary.append(
+                {
+                    "task": name,
+                    "runs": len(runs),
+                    "contended": len(runs) - len(ran),
+                    "failed": len([r for r in ran if r.failed]),
+                    "last_run": runs[0].started,
+                    "wall_time_p50": percentile(wall_times, 50),
+                    "wall_time_p90": percentile(wall_times, 90),
+                    "wall_time_p99": percentile(wall_times, 99),
+                    "wall_time_max": max(wall_times, default=0),
+                    "query_count_p50": percentile(queries, 50),
+                    "query_count_p90": percentile(queries, 90),
+                    "query_time_p50": percentile(query_times, 50),
+                    "query_time_p90": percentile(query_times, 90),
+                    "rows_inserted_p90": percentile([r.rows_inserted for r in ran], 90),
+                    "rows_updated_p90": percentile([r.rows_updated for r in ran], 90),
+                    "fills_p90": percentile([r.fills for r in ran], 90),
+                }
+            )
+
+        return summary
+
+
+class LeaseFence(models.Model):
+    """
+    Highest fencing token which wrote the results of a task under the lock with the given name
+    (see periodic_tasks.base.LeaseLock and CeleryTask.assert_lease).
+
+    The tokens are counted in redis. If redis loses its data, the counters start over
+    and the rows of this table have to be deleted.
+    """
+
+    name = models.CharField(max_length=200, primary_key=True)
+    token = models.BigIntegerField()
+
+    class Meta:
+        db_table = "lease_fence"
+
+    def __str__(self):
+        return f"{self.name}: {self.token}"
+
+    @classmethod
+    def advance(cls, name: str, token: int) -> bool:
+        """
+        Stores the token for the given lock unless a greater token has already been stored.
+        Returns False if a greater token exists, i.e. a later holder of the lock has already written.
+
+        The row stays locked until the surrounding transaction ends, so a later holder
+        cannot advance the fence before the writes of the current one have been committed.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {cls._meta.db_table} (name, token) VALUES (%s, %s) ON CONFLICT (name) "
+                f"DO UPDATE SET token = EXCLUDED.token WHERE {cls._meta.db_table}.token <= EXCLUDED.token",
+                [name, token],
+            )
+            return cursor.rowcount == 1
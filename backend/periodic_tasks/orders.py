@@ -10,15 +10,18 @@ from typing import Tuple
 
 from celery import shared_task
 from django.db import transaction, DEFAULT_DB_ALIAS
-from django.db.models import F, Sum
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.db.transaction import Atomic, get_connection
 from django.utils import timezone
 
 from core.models import Company, Order, Activity, DepotPosition, Trade, StatementOfAccount, DynamicOrder
-from notify.events import Event, store_event
+from core.sidebar import change_order_counts
+from notify.events import Event, store_events
 from periodic_tasks.base import CeleryTask
+from periodic_tasks.scheduler import mark_dirty
+from stats.models import Candle, CompanyVolume
 from tsg import settings
-from tsg.const import CENTRALBANK
 from users.models import Notification, User
 
 logger = logging.getLogger(__name__)
@@ -81,6 +84,10 @@ class OrderTask(CeleryTask):
         # list of orders which will be deleted since the have fully been fulfilled
         self.order_ids_delete = list()
 
+        # amount of deleted buy & sell orders for the order counts of the sidebar
+        self.buy_orders_deleted = 0
+        self.sell_orders_deleted = 0
+
         # list of notifications for users that their order has been fulfilled.
         self.notifications = list()
 
@@ -93,6 +100,9 @@ class OrderTask(CeleryTask):
 
         self.order_update = dict()
 
+        # dict of the [buy_volume, sell_volume, volume] of the companies on the current day
+        self.volumes = dict()
+
     def _update_single_depot_position(self, key: Tuple[int, int], amount: int, price: int) -> None:
         """
         Updates the depot position for a a given depot.
@@ -110,7 +120,7 @@ class OrderTask(CeleryTask):
             self.depot_positions_update[key] += amount
             return
 
-        if not DepotPosition.objects.filter(depot_of_id=key[0], company_id=key[1]).exists():
+        if not DepotPosition.objects.filter(depot_of_id=key[0], company_id=key[1], private_depot=False).exists():
             if key not in self.depot_positions_create:
                 self.depot_positions_create[key] = (amount, price)
             else:
@@ -123,22 +133,34 @@ class OrderTask(CeleryTask):
         with LockedAtomicTransactionCompanyDepotPosition():
             # TODO: Is there a way to filter only those companies
             # where the ask is <= than the bid
-            companies = Company.objects.exclude(name=CENTRALBANK)
+            companies = Company.objects.exclude(id=Company.get_centralbank_id())
 
             for c in companies.iterator():
                 self.check_single_company(c)
 
+            # Matching can take a while, make sure no one else started matching in the meantime
+            self.assert_lease()
             self.bulk_update()
 
-            # check that not more shares have been accidentally generated
-            for c in companies:
-                # TODO: Might be expensive. => Benchmark
-                total_shares = Company.objects.only("shares").get(id=c.id).shares
-                depot_total_shares = (
-                    DepotPosition.objects.only("amount").filter(company=c.id).aggregate(s=Sum("amount")).get("s")
-                )
-                if not total_shares == depot_total_shares:
-                    raise ValueError(f"{c}: Total shares {total_shares} != Market shares {depot_total_shares}")
+            # Sell orders cannot offer more shares than are left in the depot (see DepotPosition.reserved_amount),
+            # so the matching does not need to check the depots. Only make sure with a single query
+            # that not more shares have been accidentally generated.
+            depot_total_shares = (
+                DepotPosition.objects.filter(company_id=OuterRef("id"))
+                .order_by()
+                .values("company_id")
+                .annotate(s=Sum("amount"))
+                .values("s")[:1]
+            )
+            mismatch = (
+                companies.annotate(depot_total_shares=Coalesce(Subquery(depot_total_shares), 0))
+                .exclude(shares=F("depot_total_shares"))
+                .values_list("name", "shares", "depot_total_shares")
+                .first()
+            )
+            if mismatch is not None:
+                name, total_shares, depot_total_shares = mismatch
+                raise ValueError(f"{name}: Total shares {total_shares} != Market shares {depot_total_shares}")
 
     def check_single_company(self, c: Company):
 
@@ -163,6 +185,7 @@ class OrderTask(CeleryTask):
 
             if buy["order_by"] == sell["order_by"]:
                 self.order_ids_delete.append(buy["id"])
+                self.buy_orders_deleted += 1
                 i = i + 1
             else:
                 i, j = self.match_order(buy, sell, i, j)
@@ -180,10 +203,12 @@ class OrderTask(CeleryTask):
             amount = sell["amount"]
 
         value = amount * price
+        self.fills += 1
 
         if buy["amount"] == amount:
             buy_counter += 1
             self.order_ids_delete.append(buy["id"])
+            self.buy_orders_deleted += 1
         else:
             buy["amount"] -= amount
             self.order_update[buy["id"]] = buy["amount"]
@@ -191,6 +216,7 @@ class OrderTask(CeleryTask):
         if sell["amount"] == amount:
             sell_counter += 1
             self.order_ids_delete.append(sell["id"])
+            self.sell_orders_deleted += 1
         else:
             sell["amount"] -= amount
             self.order_update[sell["id"]] = sell["amount"]
@@ -199,6 +225,10 @@ class OrderTask(CeleryTask):
         self.update_cash(buy["order_by"], -value)
         self.update_cash(sell["order_by"], value)
 
+        self.update_volume(buy["order_by"], buy=value)
+        self.update_volume(sell["order_by"], sell=value)
+        self.update_volume(buy["order_of"], traded=value)
+
         self.update_depot(buy, sell, price, amount)
 
         if buy["order_by__user_id"]:
@@ -215,6 +245,12 @@ class OrderTask(CeleryTask):
         else:
             self.companies_cash_update[company_id] += value
 
+    def update_volume(self, company_id: int, buy: Decimal = 0, sell: Decimal = 0, traded: Decimal = 0):
+        volume = self.volumes.setdefault(company_id, [0, 0, 0])
+        volume[0] += buy
+        volume[1] += sell
+        volume[2] += traded
+
     def update_depot(self, buy, sell, price: Decimal, amount: int):
 
         if not buy["order_of"] == sell["order_of"]:
@@ -265,7 +301,9 @@ class OrderTask(CeleryTask):
 
             for key in self.depot_positions_update:
                 v = self.depot_positions_update[key]
-                DepotPosition.objects.filter(depot_of_id=key[0], company_id=key[1]).update(amount=F("amount") + v)
+                DepotPosition.objects.filter(depot_of_id=key[0], company_id=key[1], private_depot=False).update(
+                    amount=F("amount") + v
+                )
 
             self.depot_positions_update = dict()
 
@@ -286,17 +324,24 @@ class OrderTask(CeleryTask):
             Company.objects.bulk_update(l, ["cash"])
             self.companies_cash_update = dict()
 
+        # Add the volumes to the ones of the current day, see CompanyVolume
+        if not batch or len(self.volumes) > self.BATCH:
+            CompanyVolume.add_volumes(self.volumes, timezone.now().date())
+            self.volumes = dict()
+
         # delete Orders
         if not batch or len(self.order_ids_delete) > self.BATCH:
             Order.objects.filter(id__in=self.order_ids_delete).delete()
+            change_order_counts(buy=-self.buy_orders_deleted, sell=-self.sell_orders_deleted)
+
             self.order_ids_delete = list()
+            self.buy_orders_deleted = 0
+            self.sell_orders_deleted = 0
 
+        # Partially filled orders. Orders which got fully filled later on have already been deleted.
         if not batch or len(self.order_update) > self.BATCH:
-            l = list()
-            for k in self.order_update:
-                obj = Order(id=k, amount=self.order_update[k])
-                l.append(obj)
-            Order.objects.bulk_update(l, fields=["amount"])
+            Order.objects.update_amounts(self.order_update)
+            self.order_update = dict()
 
         # delete Positions
         if not batch:
@@ -341,14 +386,18 @@ class OrderTask(CeleryTask):
 
             StatementOfAccount.objects.bulk_create(self.statements)
 
+            # The trades are in the order they have been matched in
+            Candle.add_trades((t.company_id, t.price, t.amount, t.created) for t in self.trades)
+
             self.statements = list()
             self.trades = list()
 
         if not batch or len(self.notifications) > self.BATCH:
             Notification.objects.bulk_create(self.notifications)
-            # for obj in self.notifications:
-            #     e = Event(user_id=obj.user_id, typ="Order", msg=obj.subject)
-            #     store_event(e)
+
+            # Only tell the users about their fills once the trades have actually been committed
+            events = [Event(user_id=obj.user_id, typ="Order", msg=obj.subject) for obj in self.notifications]
+            transaction.on_commit(lambda: store_events(events))
 
             self.notifications = list()
 
@@ -377,17 +426,26 @@ def check_orders_single_company(company_id: int):
         o = OrderTask()
 
         def fn():
-            if not o.check_single_company(company):
-                logger.info(
-                    f"Could not run check_orders_single_company for {company_id} as an order matching is already running!"
-                )
+            o.check_single_company(company)
+
+            # The key figures of all companies which traded have to be recalculated during the next tick.
+            # bulk_update resets the cash updates, so remember them before.
+            traded = list(o.companies_cash_update)
+
+            # need to manually call the bulk_update method to insert the data in the database.
+            # This has to happen while we still hold the lock.
+            o.assert_lease()
+            o.bulk_update()
+
+            if traded:
+                mark_dirty(company_id, *traded)
 
         # As this is a shared_task and runs sperated from the normal OrderTask we have to acquire the lock
         # of the OrderTask and then run the check for a single company.
-        o.get_lock_and_run(o.get_lock_id(), fn)
-
-        # need to manually call the bulk_update method to insert the data in the database
-        o.bulk_update()
+        if not o.get_lock_and_run(o.get_lock_id(), fn):
+            logger.info(
+                f"Could not run check_orders_single_company for {company_id} as an order matching is already running!"
+            )
 
 
 class CentralBankOrdersTask(CeleryTask):
@@ -406,10 +464,12 @@ class CentralBankOrdersTask(CeleryTask):
     """
 
     def run(self):
-        cb = Company.get_centralbank()
+        cb_id = Company.get_centralbank_id()
 
-        depot = DepotPosition.objects.filter(depot_of=cb)
-        active_orders = Order.objects.filter(typ=Order.type_sell(), order_by=cb).values_list("order_of_id", flat=True)
+        depot = DepotPosition.objects.filter(depot_of_id=cb_id)
+        active_orders = Order.objects.filter(typ=Order.type_sell(), order_by_id=cb_id).values_list(
+            "order_of_id", flat=True
+        )
 
         total_new_orders = 0
 
@@ -424,7 +484,8 @@ class CentralBankOrdersTask(CeleryTask):
 
                 company = position.company
                 # get 10% of the shares in the depot
-                amount = position.amount * 0.1
+                # Order.amount is an integer, round down like the database would so the reserved shares match
+                amount = int(position.amount * 0.1)
 
                 if position.amount < company.shares * 0.1:
                     amount = position.amount
@@ -438,7 +499,7 @@ class CentralBankOrdersTask(CeleryTask):
 
                 # cannot bulk create because of multi inherited table
                 DynamicOrder.objects.create(
-                    order_by=cb,
+                    order_by_id=cb_id,
                     order_of=company,
                     amount=amount,
                     price=price,
@@ -449,6 +510,8 @@ class CentralBankOrdersTask(CeleryTask):
 
                 total_new_orders += 1
 
+            change_order_counts(sell=total_new_orders)
+
             logger.info(f"A total of {total_new_orders} sell orders have been created by the centralbank")
 
 
@@ -462,6 +525,9 @@ class DynamicOrdersTask(CeleryTask):
     def __init__(self):
         self.orders_list = list()
 
+        # dict of companies holding the changed value of their dynamic buy orders
+        self.companies_reserved_update = dict()
+
     def run(self):
         orders = DynamicOrder.objects.all()
 
@@ -484,6 +550,12 @@ class DynamicOrdersTask(CeleryTask):
                 if sign == 1 and new_price > order.limit:
                     continue
 
+                if sign == 1:
+                    change = (new_price - order.price) * order.amount
+                    self.companies_reserved_update[order.order_by_id] = (
+                        self.companies_reserved_update.get(order.order_by_id, 0) + change
+                    )
+
                 order.price = new_price
                 self.orders_list.append(order)
 
@@ -494,4 +566,6 @@ class DynamicOrdersTask(CeleryTask):
     def bulk_update(self, force: bool = False) -> None:
         if len(self.orders_list) > self.BATCH or force:
             DynamicOrder.objects.bulk_update(self.orders_list, ["price"])
+            Company.change_reserved_cash(self.companies_reserved_update)
             self.orders_list = list()
+            self.companies_reserved_update = dict()
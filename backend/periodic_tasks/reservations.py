@@ -0,0 +1,89 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.models import Company, DepotPosition, Order
+from periodic_tasks.base import CeleryTask
+from periodic_tasks.orders import LockedAtomicTransactionCompanyDepotPosition
+
+logger = logging.getLogger(__name__)
+
+
+class ReservedCashTask(CeleryTask):
+    """
+    Reconciles the reserved cash of the companies with the value of their buy orders.
+
+    The reserved cash is maintained on every change of a buy order (see Company.reserved_cash), so
+    a mismatch means an order has been changed without going through the ORM, for instance by a bulk_create.
+    Mismatches are logged and corrected.
+    """
+
+    def run(self):
+        # Same locks as the OrderTask, so no cash can be reserved or released in the meantime
+        with LockedAtomicTransactionCompanyDepotPosition():
+            orders_value = (
+                Order.objects.add_value()
+                .filter(order_by_id=OuterRef("id"), typ=Order.type_buy())
+                .order_by()
+                .values("order_by_id")
+                .annotate(s=Sum("value"))
+                .values("s")[:1]
+            )
+            companies = (
+                Company.objects.annotate(expected=Coalesce(Subquery(orders_value, output_field=DecimalField()), 0))
+                .exclude(reserved_cash=F("expected"))
+                .values_list("id", "reserved_cash", "expected")
+            )
+
+            updates = list()
+            for company_id, reserved_cash, expected in companies:
+                logger.warning(f"Company {company_id} reserved {reserved_cash} but has buy orders of {expected}")
+                updates.append(Company(id=company_id, reserved_cash=expected))
+
+            Company.objects.bulk_update(updates, ["reserved_cash"], batch_size=500)
+            logger.info(f"Reconciled the reserved cash of {len(updates)} companies")
+
+
+class ReservedAmountTask(CeleryTask):
+    """
+    Reconciles the reserved amount of the depot positions with the amount of their sell orders.
+
+    Same as the ReservedCashTask, mismatches are logged and corrected.
+    """
+
+    def run(self):
+        with LockedAtomicTransactionCompanyDepotPosition():
+            orders_amount = (
+                Order.objects.filter(
+                    order_by_id=OuterRef("depot_of_id"), order_of_id=OuterRef("company_id"), typ=Order.type_sell()
+                )
+                .order_by()
+                .values("order_by_id")
+                .annotate(s=Sum("amount"))
+                .values("s")[:1]
+            )
+            # The positions of the private depot are never reserved, see DepotPosition.change_reserved_amount
+            positions = (
+                DepotPosition.objects.filter(private_depot=False)
+                .annotate(expected=Coalesce(Subquery(orders_amount, output_field=IntegerField()), 0))
+                .exclude(reserved_amount=F("expected"))
+                .values_list("id", "depot_of_id", "company_id", "reserved_amount", "expected")
+            )
+
+            updates = list()
+            for position_id, depot_of_id, company_id, reserved_amount, expected in positions:
+                logger.warning(
+                    f"Depot position of {company_id} in depot {depot_of_id} reserved {reserved_amount} "
+                    f"but has sell orders of {expected}"
+                )
+                updates.append(DepotPosition(id=position_id, reserved_amount=expected))
+
+            DepotPosition.objects.bulk_update(updates, ["reserved_amount"], batch_size=500)
+            logger.info(f"Reconciled the reserved amount of {len(updates)} depot positions")
@@ -0,0 +1,23 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+
+from periodic_tasks.base import CeleryTask
+from periodic_tasks.models import TaskRun
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRunRetentionTask(CeleryTask):
+    """
+    Deletes the runs of the ledger, which are older than TASK_RUN_RETENTION_DAYS (see TaskRun.prune).
+    The adaptive tick records a run every minute, so the ledger would grow without bound otherwise.
+    """
+
+    def run(self):
+        deleted = TaskRun.prune()
+        logger.info(f"Deleted {deleted} old runs of the ledger")
@@ -0,0 +1,133 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from common.cache import bump_company_versions
+from core.models import Bond, Company, DynamicOrder, Order
+from periodic_tasks.base import redis_client
+from periodic_tasks.graph import JobGraph
+
+logger = logging.getLogger(__name__)
+
+# Set of company ids whose cash, depot or orders changed outside of a tick
+DIRTY_KEY = "tsg:scheduler:dirty"
+
+
+def mark_dirty(*company_ids: int) -> None:
+    """
+    Marks the given companies as changed, so the next adaptive tick knows that there is work to do.
+
+    Also invalidates the cached responses of the companies once the change has been committed.
+    """
+    if company_ids:
+        redis_client.sadd(DIRTY_KEY, *company_ids)
+        transaction.on_commit(lambda: bump_company_versions(*company_ids))
+
+
+def dirty_companies() -> int:
+    """Returns the amount of companies which changed since the last tick"""
+    return redis_client.scard(DIRTY_KEY)
+
+
+def due_bonds() -> bool:
+    """Returns True if at least one bond has to be paid out"""
+    return Bond.objects.filter(expires__lte=timezone.now()).exists()
+
+
+def crossed_books() -> bool:
+    """
+    Returns True if at least one company has a buy order which is greater or equal
+    than a sell order, so the OrderTask would match orders.
+
+    The highest buy and the lowest sell order of each company are single rows at the ends of
+    the order book index (see Order.Meta.indexes), so the check does not depend on the amount of orders.
+    """
+    orders = Order.objects.filter(order_of_id=OuterRef("id"))
+    bid = orders.filter(typ=Order.type_buy()).order_by("-price").values("price")[:1]
+    ask = orders.filter(typ=Order.type_sell()).order_by("price").values("price")[:1]
+    return (
+        Company.objects.exclude(id=Company.get_centralbank_id())
+        .annotate(bid=Subquery(bid), ask=Subquery(ask))
+        .filter(bid__gte=F("ask"))
+        .exists()
+    )
+
+
+def pending_dynamic_orders() -> bool:
+    """Returns True if there are dynamic orders whose price has to be updated"""
+    return DynamicOrder.objects.exists()
+
+
+class AdaptiveScheduler:
+    """
+    Dispatches a graph depending on how much work is pending instead of at a fixed interval.
+
+    The scheduler is ticked every minute by celery beat and only checks cheap signals:
+
+        - crossed order books are matched as often as every MIN_INTERVAL seconds
+        - dirty companies and due bonds are handled every INTERVAL seconds
+        - without any work the graph still runs every MAX_INTERVAL seconds as a safety net
+
+    So idle nights do not cost a full tick every five minutes, while busy periods get faster matching.
+    """
+
+    MIN_INTERVAL = 60
+    INTERVAL = 5 * 60
+    MAX_INTERVAL = 60 * 60
+
+    def __init__(self, graph: JobGraph):
+        self.graph = graph
+
+    @property
+    def last_run_key(self) -> str:
+        return f"tsg:scheduler:{self.graph.name}:last_run"
+
+    def seconds_since_last_run(self, now: float) -> float:
+        last_run = redis_client.get(self.last_run_key)
+        if last_run is None:
+            return float("inf")
+        return now - float(last_run)
+
+    def interval(self) -> int:
+        """
+        Returns after how many seconds the graph should run again, given the currently pending work
+        """
+        if crossed_books():
+            return self.MIN_INTERVAL
+
+        if dirty_companies() or due_bonds():
+            return self.INTERVAL
+
+        return self.MAX_INTERVAL
+
+    def tick(self) -> bool:
+        """
+        Dispatches the graph if it is due. Returns True if the graph has been dispatched.
+        """
+        now = timezone.now().timestamp()
+        elapsed = self.seconds_since_last_run(now)
+
+        # No need to look at any signal, the graph cannot run more often anyway
+        if elapsed < self.MIN_INTERVAL:
+            return False
+
+        if elapsed < self.MAX_INTERVAL and elapsed < self.interval():
+            return False
+
+        # Companies marked from now on will be picked up by the next run,
+        # everything marked before is handled by the run dispatched now.
+        pipe = redis_client.pipeline()
+        pipe.set(self.last_run_key, now)
+        pipe.delete(DIRTY_KEY)
+        pipe.execute()
+
+        logger.info(f"Adaptive scheduler dispatches graph {self.graph.name} after {elapsed} seconds")
+        return self.graph.dispatch()
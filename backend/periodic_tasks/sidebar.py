@@ -0,0 +1,17 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from core.sidebar import build_sidebar
+from periodic_tasks.base import CeleryTask
+
+
+class SidebarTask(CeleryTask):
+    """
+    Rebuilds the sidebar after the share prices or the interest rate changed
+    """
+
+    def run(self):
+        build_sidebar()
@@ -12,6 +12,7 @@ from freezegun import freeze_time
 from common.test_base import BaseTestCase, NOW
 from core.models import Bond, StatementOfAccount
 from periodic_tasks.bonds import BondPayout
+from stats.models import KeyFigures
 
 
 @freeze_time(NOW)
@@ -70,3 +71,11 @@ class BondPayoutTest(BaseTestCase):
         self.assertEqual(statement.value, self.bond.calc_value() + self.bond_two.calc_value())
         self.assertEqual(statement.company.id, self.company.id)
         self.assertEqual(statement.amount, 2)
+
+    def test_paid_out_bonds_are_subtracted_from_the_bond_value(self):
+        KeyFigures.objects.filter(company=self.company).update(bond_value=sum(b.value for b in self.bonds))
+
+        BondPayout().run()
+
+        # only the bond which does not expire yet is left
+        self.assertEqual(KeyFigures.objects.get(company=self.company).bond_value, self.ONE_HUNDRED_THOUSAND)
@@ -4,11 +4,15 @@ Use of this source code is governed by a AGPL-3.0
 license that can be found in the LICENSE.txt file.
 """
 
-from unittest import TestCase
-
+import time
 import pytest
+from django.db import transaction
+from django.test import TestCase
+
+from periodic_tasks.base import CeleryTask, LeaseLock, LockLost, redis_client, redis_lock
+from periodic_tasks.models import LeaseFence
 
-from periodic_tasks.base import CeleryTask
+LOCK_NAME = "tsg:test:lease"
 
 
 class CeleryTaskTest(TestCase):
@@ -16,3 +20,101 @@ class CeleryTaskTest(TestCase):
         c = CeleryTask()
         with pytest.raises(NotImplementedError):
             c.run()
+
+    def test_assert_lease(self):
+        c = CeleryTask()
+
+        # Not running under a lease at all
+        c.assert_lease()
+
+        redis_client.delete(LOCK_NAME)
+        with redis_lock(LOCK_NAME) as lease, transaction.atomic():
+            c.lease = lease
+            c.fencing_token = lease.token
+            c.assert_lease()
+
+            # someone else took over the lock
+            redis_client.set(LOCK_NAME, "other")
+            with pytest.raises(LockLost):
+                c.assert_lease()
+
+        self.assertEqual(redis_client.get(LOCK_NAME), b"other")
+        redis_client.delete(LOCK_NAME)
+
+    def test_writes_are_fenced(self):
+        c = CeleryTask()
+        with redis_lock(LOCK_NAME) as lease:
+            c.lease = lease
+            c.fencing_token = lease.token
+
+            with transaction.atomic():
+                c.assert_lease()
+
+            # The lease expired and a later holder of the lock wrote its results, before the lease in redis
+            # could be checked again. The fence rejects the writes even though the check in redis passes.
+            LeaseFence.advance(LOCK_NAME, lease.token + 1)
+            self.assertTrue(lease.is_held())
+
+            with pytest.raises(LockLost), transaction.atomic():
+                c.assert_lease()
+
+        # An earlier holder cannot lower the fence
+        self.assertFalse(LeaseFence.advance(LOCK_NAME, lease.token))
+        self.assertEqual(LeaseFence.objects.get(name=LOCK_NAME).token, lease.token + 1)
+
+
+class LeaseLockTest(TestCase):
+    def setUp(self):
+        redis_client.delete(LOCK_NAME)
+
+    def tearDown(self):
+        redis_client.delete(LOCK_NAME)
+
+    def test_contender_does_not_release_lock(self):
+        with redis_lock(LOCK_NAME) as lease:
+            self.assertIsNotNone(lease)
+
+            with redis_lock(LOCK_NAME) as contender:
+                self.assertIsNone(contender)
+
+            self.assertTrue(lease.is_held())
+
+        self.assertIsNone(redis_client.get(LOCK_NAME))
+
+    def test_fencing_tokens_increase(self):
+        with redis_lock(LOCK_NAME) as lease:
+            first = lease.token
+
+        with redis_lock(LOCK_NAME) as lease:
+            second = lease.token
+
+        self.assertGreater(second, first)
+
+    def test_only_owner_releases(self):
+        lease = LeaseLock(LOCK_NAME)
+        self.assertTrue(lease.acquire())
+
+        # The lease expired and someone else got the lock in the meantime
+        redis_client.set(LOCK_NAME, "other")
+        lease.release()
+
+        self.assertEqual(redis_client.get(LOCK_NAME), b"other")
+
+    def test_lock_expires(self):
+        with redis_lock(LOCK_NAME):
+            ttl = redis_client.pttl(LOCK_NAME)
+            self.assertGreater(ttl, 0)
+            self.assertLessEqual(ttl, LeaseLock.TTL * 1000)
+
+    def test_lease_gets_renewed(self):
+        with redis_lock(LOCK_NAME, ttl=0.3) as lease:
+            time.sleep(0.6)
+            self.assertTrue(lease.is_held())
+            self.assertFalse(lease.lost)
+
+    def test_lost_lease(self):
+        with redis_lock(LOCK_NAME, ttl=0.3) as lease:
+            redis_client.set(LOCK_NAME, "other")
+            time.sleep(0.3)
+            self.assertTrue(lease.lost)
+            self.assertFalse(lease.is_held())
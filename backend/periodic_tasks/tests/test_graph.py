@@ -0,0 +1,109 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from unittest import mock
+
+import pytest
+from django.test import TestCase
+
+from periodic_tasks.base import CeleryTask, redis_client
+from periodic_tasks.graph import Job, JobGraph
+from periodic_tasks.jobs import FIVE_MINUTES_GRAPH
+from tsg.celery import app
+
+CALLS = list()
+
+
+class FirstTask(CeleryTask):
+    def run(self):
+        CALLS.append("first")
+
+
+class SecondTask(CeleryTask):
+    def run(self):
+        CALLS.append("second")
+
+
+class LastTask(CeleryTask):
+    def run(self):
+        CALLS.append("last")
+
+
+class JobGraphTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+        self.graph = JobGraph(
+            "test",
+            [
+                Job("last", LastTask, depends_on=["first", "second"]),
+                Job("first", FirstTask),
+                Job("second", SecondTask),
+            ],
+        )
+        redis_client.delete(self.graph.running_key, self.graph.pending_key)
+        app.conf.task_always_eager = True
+
+    def tearDown(self):
+        app.conf.task_always_eager = False
+        redis_client.delete(self.graph.running_key, self.graph.pending_key)
+
+    def test_stages(self):
+        stages = [[job.name for job in stage] for stage in self.graph.stages]
+        self.assertEqual(stages, [["first", "second"], ["last"]])
+
+    def test_five_minutes_stages(self):
+        stages = [sorted(job.name for job in stage) for stage in FIVE_MINUTES_GRAPH.stages]
+        self.assertEqual(stages, [["bonds", "orders"], ["key_figures"], ["centralbank_orders", "sidebar"]])
+
+    def test_unknown_dependency(self):
+        with pytest.raises(ValueError):
+            JobGraph("unknown", [Job("first", FirstTask, depends_on=["missing"])])
+
+    def test_cycle(self):
+        with pytest.raises(ValueError):
+            JobGraph(
+                "cycle",
+                [Job("first", FirstTask, depends_on=["second"]), Job("second", SecondTask, depends_on=["first"])],
+            )
+
+    def test_dispatch(self):
+        self.assertTrue(self.graph.dispatch())
+        self.assertEqual(CALLS[-1], "last")
+        self.assertCountEqual(CALLS[:2], ["first", "second"])
+
+        # the run has finished, so the next tick can be dispatched
+        self.assertFalse(redis_client.exists(self.graph.running_key))
+
+    def test_overrunning_ticks_get_coalesced(self):
+        redis_client.set(self.graph.running_key, "running")
+
+        # The graph is still running, so both ticks get skipped
+        self.assertFalse(self.graph.dispatch())
+        self.assertFalse(self.graph.dispatch())
+        self.assertEqual(CALLS, [])
+
+        # Once the running graph has finished, the skipped ticks run exactly once
+        self.assertTrue(self.graph.finish("running"))
+        self.assertEqual(len(CALLS), 3)
+        self.assertFalse(redis_client.exists(self.graph.pending_key))
+
+    def test_run_is_only_finished_once(self):
+        redis_client.set(self.graph.running_key, "run")
+        self.assertFalse(self.graph.dispatch())
+
+        with mock.patch("periodic_tasks.graph.bump_market_version") as bump:
+            # e.g. the error callbacks of two failed jobs of the same stage
+            self.assertTrue(self.graph.finish("run"))
+            self.assertFalse(self.graph.finish("run"))
+
+        # The pending tick has been dispatched once, one bump for each of both runs
+        self.assertEqual(len(CALLS), 3)
+        self.assertEqual(bump.call_count, 2)
+
+        # A late finish of an old run does not remove the flag of the next one
+        redis_client.set(self.graph.running_key, "next")
+        self.assertFalse(self.graph.finish("run"))
+        self.assertEqual(redis_client.get(self.graph.running_key), b"next")
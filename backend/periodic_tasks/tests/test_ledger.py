@@ -0,0 +1,128 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import Company
+from periodic_tasks.base import CeleryTask, redis_client
+from periodic_tasks.models import TaskRun, percentile
+from periodic_tasks.retention import TaskRunRetentionTask
+
+
+class RenameTask(CeleryTask):
+    def run(self):
+        Company.objects.filter(name="Company").update(name="Renamed")
+
+
+class FailingTask(CeleryTask):
+    def run(self):
+        raise ValueError("Failed")
+
+
+class RunLedgerTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        redis_client.delete(RenameTask().get_lock_id())
+
+    def test_run_gets_recorded(self):
+        RenameTask().lock_run()
+
+        run = TaskRun.objects.get(task="RenameTask")
+        self.assertEqual(run.query_count, 1)
+        self.assertEqual(run.rows_updated, 1)
+        self.assertEqual(run.rows_inserted, 0)
+        self.assertFalse(run.contended)
+        self.assertFalse(run.failed)
+        self.assertGreaterEqual(run.finished, run.started)
+
+    def test_contended_run_gets_recorded(self):
+        task = RenameTask()
+        redis_client.set(task.get_lock_id(), "lock")
+        try:
+            task.lock_run()
+        finally:
+            redis_client.delete(task.get_lock_id())
+
+        run = TaskRun.objects.get(task="RenameTask")
+        self.assertTrue(run.contended)
+        self.assertEqual(run.query_count, 0)
+        self.assertTrue(Company.objects.filter(name="Company").exists())
+
+    def test_failed_run_gets_recorded(self):
+        with pytest.raises(ValueError):
+            FailingTask().lock_run()
+
+        run = TaskRun.objects.get(task="FailingTask")
+        self.assertTrue(run.failed)
+        self.assertFalse(run.contended)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 90), 0)
+
+    def test_summary_api_only_for_staff(self):
+        url = reverse("periodic_tasks:runs")
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+
+        RenameTask().lock_run()
+        RenameTask().lock_run()
+
+        response = self.client.get(url, {"last": 10})
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["task"], "RenameTask")
+        self.assertEqual(data[0]["runs"], 2)
+        self.assertEqual(data[0]["contended"], 0)
+        self.assertEqual(data[0]["query_count_p90"], 1)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command("task_runs", stdout=out)
+        self.assertIn("No runs recorded yet.", out.getvalue())
+
+        RenameTask().lock_run()
+
+        out = StringIO()
+        call_command("task_runs", "--last", "5", stdout=out)
+        self.assertIn("RenameTask", out.getvalue())
+        self.assertIn("wall_time_p90", out.getvalue())
+
+    def test_retention(self):
+        RenameTask().lock_run()
+        RenameTask().lock_run()
+        old, recent = TaskRun.objects.order_by("id")
+        TaskRun.objects.filter(id=old.id).update(started=timezone.now() - timedelta(days=15))
+
+        with override_settings(TASK_RUN_RETENTION_DAYS=14):
+            TaskRunRetentionTask().lock_run()
+
+        # the run of the retention task itself is recorded as well
+        self.assertFalse(TaskRun.objects.filter(id=old.id).exists())
+        self.assertEqual(TaskRun.objects.filter(task="RenameTask").get(), recent)
+        self.assertTrue(TaskRun.objects.filter(task="TaskRunRetentionTask").exists())
+
+        out = StringIO()
+        call_command("task_runs", "--prune", "--days", "0", stdout=out)
+        self.assertIn("Deleted 2 runs", out.getvalue())
+        self.assertFalse(TaskRun.objects.exists())
@@ -11,11 +11,13 @@ from typing import List, T
 
 from django.db.models import Sum
 from django.test import override_settings, TransactionTestCase, TestCase
+from django.utils import timezone
 
 from common.test_base import BaseTestCase
 from core.models import StatementOfAccount, Company, DepotPosition, Order, Trade
 from periodic_tasks.orders import OrderTask, check_orders_single_company
 from periodic_tasks.tests.tests import TestReadFile
+from stats.models import Candle, CompanyVolume
 from tsg.settings import BASE_DIR
 from users.models import User, Notification
 
@@ -91,6 +93,32 @@ class OrderTaskTest(TestCase):
         self.assertTrue(Trade.objects.filter(buyer_id=3, seller_id=4, company_id=2, price=2, amount=1_000).exists())
         self.check_market()
 
+    def test_trades_are_added_to_the_candles(self):
+        Order.objects.create(order_by_id=4, order_of_id=2, price=2, amount=1_000, typ=Order.type_sell())
+        Order.objects.create(order_by_id=5, order_of_id=2, price=3, amount=500, typ=Order.type_sell())
+        Order.objects.create(order_by_id=3, order_of_id=2, price=3, amount=1_200, typ=Order.type_buy())
+
+        OrderTask().run()
+
+        candles = Candle.objects.filter(company_id=2)
+        self.assertEqual(sorted(c.resolution for c in candles), ["1d", "1h", "5m"])
+        for candle in candles:
+            self.assertEqual((candle.open, candle.high, candle.low, candle.close, candle.volume), (3, 3, 3, 3, 1_200))
+
+    def test_volumes_are_added(self):
+        Order.objects.create(order_by_id=4, order_of_id=2, price=2, amount=1_000, typ=Order.type_sell())
+        Order.objects.create(order_by_id=3, order_of_id=2, price=3, amount=1_000, typ=Order.type_buy())
+
+        OrderTask().run()
+
+        volumes = {
+            v.company_id: (v.buy_volume, v.sell_volume, v.volume)
+            for v in CompanyVolume.objects.filter(day=timezone.now().date())
+        }
+        self.assertEqual(volumes[2], (0, 0, 3_000))
+        self.assertEqual(volumes[3], (3_000, 0, 0))
+        self.assertEqual(volumes[4], (0, 3_000, 0))
+
     def test_sell_order_exists_if_not_fully_matched(self):
         sell_order = Order.objects.create(order_by_id=4, order_of_id=2, price=2, amount=1_000, typ=Order.type_sell())
 
@@ -0,0 +1,234 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Sum
+from rest_framework.reverse import reverse
+
+from common.test_base import BaseTestCase
+from core.models import Company, DepotPosition, DynamicOrder, Order
+from periodic_tasks.orders import DynamicOrdersTask, OrderTask
+from periodic_tasks.reservations import ReservedAmountTask, ReservedCashTask
+
+
+class ReservationTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two, cash=100_000)
+        self.company_three = Company.objects.create(name="Company Three", cash=100_000)
+        DepotPosition.objects.create(depot_of=self.company_two, company=self.company_three, amount=1000)
+
+    def buy(self, price, amount, company=None) -> Order:
+        return Order.objects.create(
+            order_by=company or self.company,
+            order_of=self.company_three,
+            price=price,
+            amount=amount,
+            typ=Order.type_buy(),
+        )
+
+    def sell(self, price, amount) -> Order:
+        return Order.objects.create(
+            order_by=self.company_two, order_of=self.company_three, price=price, amount=amount, typ=Order.type_sell()
+        )
+
+
+class ReservedCashTest(ReservationTestMixin, BaseTestCase):
+    def reserved(self, company: Company) -> Decimal:
+        return Company.objects.get(id=company.id).reserved_cash
+
+    def assertLedger(self):
+        """Asserts that the reserved cash matches the buy orders of every company"""
+        for company in Company.objects.all():
+            expected = (
+                Order.objects.add_value().filter(order_by=company, typ=Order.type_buy()).aggregate(s=Sum("value"))["s"]
+                or 0
+            )
+            self.assertEqual(company.reserved_cash, expected, company)
+
+    def test_create_and_cancel(self):
+        order = self.buy(2.5, 100)
+        self.sell(3, 100)
+        self.assertEqual(self.reserved(self.company), 250)
+        self.assertEqual(self.reserved(self.company_two), 0)
+
+        order.price = 3
+        order.save()
+        self.assertEqual(self.reserved(self.company), 300)
+
+        order.delete()
+        self.assertEqual(self.reserved(self.company), 0)
+        self.assertLedger()
+
+    def test_queryset_delete(self):
+        self.buy(1, 100)
+        self.buy(2, 100)
+        self.buy(1, 10, company=self.company_two)
+
+        Order.objects.filter(typ=Order.type_buy()).delete()
+        self.assertLedger()
+        self.assertEqual(self.reserved(self.company), 0)
+
+    def test_partial_and_full_fills(self):
+        self.buy(2, 150)
+        self.buy(1, 100)
+        self.sell(1, 200)
+
+        task = OrderTask()
+        task.check_single_company(self.company_three)
+        task.bulk_update()
+
+        # 50 shares of the second order are still open
+        self.assertEqual(Order.objects.filter(typ=Order.type_buy()).get().amount, 50)
+        self.assertEqual(self.reserved(self.company), 50)
+        self.assertLedger()
+
+    def test_dynamic_orders(self):
+        DynamicOrder.objects.create(
+            order_by=self.company,
+            order_of=self.company_three,
+            price=10,
+            dynamic_value=1,
+            limit=15,
+            amount=100,
+            typ=Order.type_buy(),
+        )
+        self.assertEqual(self.reserved(self.company), 1000)
+
+        DynamicOrdersTask().run()
+        self.assertEqual(self.reserved(self.company), 1100)
+        self.assertLedger()
+
+    def test_enough_money_uses_reserved_cash(self):
+        self.buy(1, 1000)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.company.enough_money(self.company.cash - 1000))
+        self.assertFalse(self.company.enough_money(self.company.cash - 999))
+
+    def test_reconciliation(self):
+        Order.objects.bulk_create(
+            [Order(order_by=self.company, order_of=self.company_three, price=1, amount=10, typ=Order.type_buy())]
+        )
+        Company.objects.filter(id=self.company_two.id).update(reserved_cash=5)
+
+        ReservedCashTask().run()
+        self.assertLedger()
+        self.assertEqual(self.reserved(self.company), 10)
+
+
+class ReservedAmountTest(ReservationTestMixin, BaseTestCase):
+    def reserved_amount(self, company: Company) -> int:
+        return DepotPosition.objects.get(
+            depot_of=company, company=self.company_three, private_depot=False
+        ).reserved_amount
+
+    def assertLedger(self):
+        """Asserts that the reserved amount matches the sell orders of every depot position"""
+        for position in DepotPosition.objects.all():
+            expected = (
+                Order.objects.filter(
+                    order_by_id=position.depot_of_id, order_of_id=position.company_id, typ=Order.type_sell()
+                ).aggregate(s=Sum("amount"))["s"]
+                or 0
+            )
+            self.assertEqual(position.reserved_amount, expected, position)
+
+    def test_create_and_cancel(self):
+        order = self.sell(3, 100)
+        self.sell(4, 50)
+        self.assertEqual(self.reserved_amount(self.company_two), 150)
+
+        order.amount = 200
+        order.save()
+        self.assertEqual(self.reserved_amount(self.company_two), 250)
+
+        order.delete()
+        self.assertEqual(self.reserved_amount(self.company_two), 50)
+        self.assertLedger()
+
+    def test_queryset_delete(self):
+        self.sell(1, 100)
+        self.sell(2, 100)
+
+        Order.objects.filter(typ=Order.type_sell()).delete()
+        self.assertLedger()
+        self.assertEqual(self.reserved_amount(self.company_two), 0)
+
+    def test_partial_and_full_fills(self):
+        self.buy(2, 150)
+        self.sell(1, 100)
+        self.sell(1, 200)
+
+        task = OrderTask()
+        task.check_single_company(self.company_three)
+        task.bulk_update()
+
+        # 150 shares of the second order are still open
+        self.assertEqual(Order.objects.filter(typ=Order.type_sell()).get().amount, 150)
+        self.assertEqual(self.reserved_amount(self.company_two), 150)
+        self.assertLedger()
+
+    def test_dynamic_orders(self):
+        DynamicOrder.objects.create(
+            order_by=self.company_two,
+            order_of=self.company_three,
+            price=10,
+            dynamic_value=1,
+            limit=5,
+            amount=100,
+            typ=Order.type_sell(),
+        )
+        DynamicOrdersTask().run()
+        self.assertEqual(self.reserved_amount(self.company_two), 100)
+        self.assertLedger()
+
+    def test_sell_validation_uses_reserved_amount(self):
+        self.sell(1, 600)
+        self.client.force_authenticate(user=self.user_two)
+        url = reverse("core:order_company", kwargs={"isin": self.company_three.isin})
+        data = {"order_of_isin": self.company_three.isin, "price": 1, "typ": Order.type_sell()}
+
+        rsp = self.client.post(url, {**data, "amount": 401}, format="json")
+        self.assertEqual(rsp.status_code, 400)
+        msg = "You only have 1000 shares in your depot, 600 of them are already in sell orders, but want to sell 401!"
+        self.assertEqual(rsp.json(), {"amount": [msg]})
+
+        rsp = self.client.post(url, {**data, "amount": 400}, format="json")
+        self.assertEqual(rsp.status_code, 201)
+        self.assertEqual(self.reserved_amount(self.company_two), 1000)
+
+    def test_reconciliation(self):
+        Order.objects.bulk_create(
+            [Order(order_by=self.company_two, order_of=self.company_three, price=1, amount=10, typ=Order.type_sell())]
+        )
+
+        ReservedAmountTask().run()
+        self.assertLedger()
+        self.assertEqual(self.reserved_amount(self.company_two), 10)
+
+    def test_private_depot_position_of_the_same_share(self):
+        private = DepotPosition.objects.create(
+            depot_of=self.company_two, company=self.company_three, amount=50, private_depot=True
+        )
+        self.sell(1, 100)
+        self.assertEqual(self.reserved_amount(self.company_two), 100)
+
+        snapshot = self.company_two.get_order_snapshot(self.company_three.id)
+        self.assertEqual((snapshot.depot_amount, snapshot.depot_reserved_amount), (1000, 100))
+        snapshot = self.company_two.get_order_snapshots([self.company_three.id])[self.company_three.id]
+        self.assertEqual((snapshot.depot_amount, snapshot.depot_reserved_amount), (1000, 100))
+
+        self.buy(1, 60)
+        task = OrderTask()
+        task.check_single_company(self.company_three)
+        task.bulk_update()
+        ReservedAmountTask().run()
+
+        self.assertEqual(self.reserved_amount(self.company_two), 40)
+        private.refresh_from_db()
+        self.assertEqual((private.amount, private.reserved_amount), (50, 0))
@@ -0,0 +1,112 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+from freezegun import freeze_time
+
+from common.test_base import BaseTestCase
+from core.models import Bond, Company, Order
+from periodic_tasks.base import redis_client
+from periodic_tasks.graph import Job, JobGraph
+from periodic_tasks.scheduler import (
+    DIRTY_KEY,
+    AdaptiveScheduler,
+    crossed_books,
+    dirty_companies,
+    due_bonds,
+    mark_dirty,
+)
+
+
+class AdaptiveSchedulerTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.graph = JobGraph("scheduler_test", [])
+        self.scheduler = AdaptiveScheduler(self.graph)
+        redis_client.delete(DIRTY_KEY, self.scheduler.last_run_key)
+
+        self.company_two = Company.objects.create(name="Company Two", user=self.user_two)
+
+    def tearDown(self):
+        redis_client.delete(DIRTY_KEY, self.scheduler.last_run_key)
+
+    def tick(self, now) -> bool:
+        with freeze_time(now), mock.patch.object(self.graph, "dispatch", return_value=True) as dispatch:
+            dispatched = self.scheduler.tick()
+            self.assertEqual(dispatched, dispatch.called)
+            return dispatched
+
+    def test_crossed_books(self):
+        self.assertFalse(crossed_books())
+
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=5, amount=10, typ=Order.type_buy())
+        Order.objects.create(
+            order_by=self.company_two, order_of=self.company_two, price=6, amount=10, typ=Order.type_sell()
+        )
+        self.assertFalse(crossed_books())
+
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=6, amount=10, typ=Order.type_buy())
+        with self.assertNumQueries(1):
+            self.assertTrue(crossed_books())
+
+    def test_due_bonds(self):
+        self.assertFalse(due_bonds())
+        Bond.objects.create(company=self.company, value=1000, rate=1, runtime=1)
+        self.assertFalse(due_bonds())
+
+        with freeze_time(timezone.now() + timedelta(days=2)):
+            self.assertTrue(due_bonds())
+
+    def test_mark_dirty(self):
+        mark_dirty()
+        self.assertEqual(dirty_companies(), 0)
+
+        mark_dirty(self.company.id, self.company_two.id, self.company.id)
+        self.assertEqual(dirty_companies(), 2)
+
+    def test_idle_market_runs_hourly(self):
+        start = timezone.now()
+        self.assertTrue(self.tick(start))
+        self.assertFalse(self.tick(start + timedelta(minutes=5)))
+        self.assertFalse(self.tick(start + timedelta(minutes=59)))
+        self.assertTrue(self.tick(start + timedelta(minutes=60)))
+
+    def test_dirty_companies_run_every_five_minutes(self):
+        start = timezone.now()
+        self.assertTrue(self.tick(start))
+
+        mark_dirty(self.company.id)
+        self.assertFalse(self.tick(start + timedelta(minutes=4)))
+        self.assertTrue(self.tick(start + timedelta(minutes=5)))
+
+        # the dirty companies got handled by the dispatched run
+        self.assertEqual(dirty_companies(), 0)
+        self.assertFalse(self.tick(start + timedelta(minutes=10)))
+
+    def test_crossed_books_run_every_minute(self):
+        Order.objects.create(order_by=self.company, order_of=self.company_two, price=6, amount=10, typ=Order.type_buy())
+        Order.objects.create(
+            order_by=self.company_two, order_of=self.company_two, price=5, amount=10, typ=Order.type_sell()
+        )
+
+        start = timezone.now()
+        self.assertTrue(self.tick(start))
+        self.assertFalse(self.tick(start + timedelta(seconds=30)))
+        self.assertTrue(self.tick(start + timedelta(minutes=1)))
+
+
+class JobWhenTest(BaseTestCase):
+    def test_job_gets_skipped(self):
+        task_class = mock.Mock()
+
+        Job("skipped", task_class, when=lambda: False).run()
+        task_class.assert_not_called()
+
+        Job("runs", task_class, when=lambda: True).run()
+        task_class.return_value.lock_run.assert_called_once()
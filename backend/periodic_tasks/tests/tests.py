@@ -7,6 +7,7 @@ license that can be found in the LICENSE.txt file.
 from django.db.models import Sum
 
 from core.models import Company, DepotPosition, Order
+from periodic_tasks.reservations import ReservedAmountTask, ReservedCashTask
 from tsg.const import CENTRALBANK
 from users.models import User
 
@@ -59,6 +60,9 @@ class TestReadFile:
 
             if self.setup_path == path:
                 Order.objects.bulk_create(orders)
+                # bulk_create does not reserve the cash of the buy orders & the shares of the sell orders
+                ReservedCashTask().run()
+                ReservedAmountTask().run()
 
             return orders
 
@@ -0,0 +1,13 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from django.urls import path
+
+from periodic_tasks import views
+
+app_name = "periodic_tasks"
+
+urlpatterns = [path("runs/", views.TaskRunSummaryView.as_view(), name="runs")]
@@ -0,0 +1,36 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from periodic_tasks.models import TaskRun
+
+
+class TaskRunSummaryView(APIView):
+    """
+    Returns percentiles over the last runs of each periodic task.
+
+    Query parameters:
+        last: amount of runs per task to take into account (default 100, max 10000)
+        task: only return the given task, e.g. OrderTask
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    MAX_LAST = 10000
+
+    def get(self, request, *args, **kwargs):
+        try:
+            last = int(request.GET.get("last", 100))
+        except ValueError:
+            last = 100
+
+        last = min(max(last, 1), self.MAX_LAST)
+        task = request.GET.get("task")
+
+        return Response(data=TaskRun.summary(last=last, task=task))
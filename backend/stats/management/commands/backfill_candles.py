@@ -0,0 +1,40 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import Company, Trade
+from periodic_tasks.orders import LockedAtomicTransactionCompanyDepotPosition
+from stats.models import Candle
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the candles of all companies, or of the given one, from their trades"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--isin", type=str, default=None, help="Only rebuild the candles of the given company")
+
+    def handle(self, *args, **options):
+        trades = Trade.objects.exclude(company_id=None)
+        if options["isin"]:
+            trades = trades.filter(company_id=Company.get_id_from_isin(options["isin"]))
+
+        company_ids = trades.order_by("company_id").values_list("company_id", flat=True).distinct()
+
+        for company_id in company_ids.iterator():
+            # Same locks as the OrderTask, so no trades are added to the candles while they are rebuilt
+            with LockedAtomicTransactionCompanyDepotPosition():
+                company_trades = (
+                    trades.filter(company_id=company_id)
+                    .order_by("created", "id")
+                    .values_list("company_id", "price", "amount", "created")
+                )
+                candles = Candle.from_trades(company_trades.iterator())
+
+                Candle.objects.filter(company_id=company_id).delete()
+                Candle.objects.bulk_create(candles, batch_size=500)
+
+            self.stdout.write(f"Company {company_id}: {len(candles)} candles")
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_liquidity(apps, schema_editor):
+    """
+    Sets the bond & depot value of every key figures, same as the KeyFiguresTask
+    """
+    KeyFigures = apps.get_model("stats", "KeyFigures")
+    Bond = apps.get_model("core", "Bond")
+    DepotPosition = apps.get_model("core", "DepotPosition")
+
+    bond_value = (
+        Bond.objects.filter(company_id=OuterRef("company_id"))
+        .order_by()
+        .values("company_id")
+        .annotate(s=Sum("value"))
+        .values("s")[:1]
+    )
+    depot_value = (
+        DepotPosition.objects.filter(depot_of_id=OuterRef("company_id"))
+        .order_by()
+        .values("depot_of_id")
+        .annotate(
+            s=Sum(
+                ExpressionWrapper(
+                    F("amount") * F("company__keyfigures__share_price"), output_field=models.DecimalField()
+                )
+            )
+        )
+        .values("s")[:1]
+    )
+    KeyFigures.objects.update(
+        bond_value=Coalesce(Subquery(bond_value, output_field=models.DecimalField()), 0),
+        depot_value=Coalesce(Subquery(depot_value, output_field=models.DecimalField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_depotposition_holders_idx"),
+        ("stats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="keyfigures",
+            name="bond_value",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=40),
+        ),
+        migrations.AddField(
+            model_name="keyfigures",
+            name="depot_value",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=40),
+        ),
+        migrations.RunPython(backfill_liquidity, migrations.RunPython.noop),
+    ]
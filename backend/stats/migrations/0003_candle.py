@@ -0,0 +1,33 @@
+# Generated by Django 3.0.4 on 2026-10-19 13:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_depotposition_holders_idx'),
+        ('stats', '0002_keyfigures_liquidity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('5m', '5m'), ('1h', '1h'), ('1d', '1d')], max_length=2)),
+                ('start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=40)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=40)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=40)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=40)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Company')),
+            ],
+            options={
+                'db_table': 'candle',
+                'unique_together': {('company', 'resolution', 'start')},
+            },
+        ),
+    ]
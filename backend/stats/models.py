@@ -8,13 +8,15 @@ from __future__ import annotations
 import datetime
 import logging
 from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
 
 from django.db import models
-from django.db.models import Sum, Max, Min
+from django.db.models import Max, Min, Q, Sum
 
 
 from django.utils import timezone
 
+from common.db import upsert
 from core.models import Company, DepotPosition, Order, Trade
 
 logger = logging.getLogger(__name__)
@@ -75,7 +77,7 @@ class KeyFiguresBase(models.Model):
     # one or multiple companies hold most to all shares.
 
     # We calculate the free float by taking only the depot positions in consideration, which
-    # make only a maximum of 20% of the company.
+    # make only a maximum of 20% of the company. See core/shareholders.py for the calculation.
     free_float = models.DecimalField(max_digits=25, decimal_places=2, default=0)
 
     class Meta:
@@ -89,51 +91,32 @@ class KeyFiguresBase(models.Model):
         return self.company.ask()
 
     @classmethod
-    def calc_book_value(cls, c: Company, bond_value: Decimal) -> Decimal:
+    def calc_depot_values(cls, c: Company) -> Tuple[Decimal, Decimal]:
         """
-        Calculates the book value
-
-        For an explanation of this key figure please see the book_value field
-        in the KeyFiguresBase model.
+        Calculates the value of all shares in the depot of a company and the value of the shares
+        which are not in its private depot. Only the latter counts to the book value.
         """
-
-        depot_value = (
+        values = (
             c.depotposition_set.add_value()
-            .filter(depot_of_id=c.id, private_depot=False)
-            .aggregate(s=Sum("value"))
-            .get("s", 0)
+            .filter(depot_of_id=c.id)
+            .aggregate(s=Sum("value"), public=Sum("value", filter=Q(private_depot=False)))
         )
-        depot_value = depot_value or 0
-
-        assert bond_value >= 0
-        assert depot_value >= 0
-        total = bond_value + depot_value + c.cash
-
-        return total
+        return values["s"] or 0, values["public"] or 0
 
     @classmethod
-    def calc_free_float(cls, c: Company) -> Decimal:
+    def calc_book_value(cls, c: Company, bond_value: Decimal, depot_value: Decimal) -> Decimal:
         """
-        Calculates the free float of a company
+        Calculates the book value
 
-        For an explanation of this key figure please see the free_float field
+        For an explanation of this key figure please see the book_value field
         in the KeyFiguresBase model.
         """
-        v = (
-            # DepotPosition.objects.add_percentage()
-            c.in_depots.add_percentage()
-            .filter(percentage__lte=20)
-            .aggregate(s=Sum("percentage"))
-            .get("s", 0)
-        )
-
-        # if not a single shareholder matches the condition the queryset returns None
-        v = v or 0
 
-        logger.debug(f"Free float of {c}: {v}")
-        assert v <= 100
+        assert bond_value >= 0
+        assert depot_value >= 0
+        total = bond_value + depot_value + c.cash
 
-        return v
+        return total
 
     @classmethod
     def calc_ttoc(cls, c: Company, bond_value: Decimal, book_value: Decimal) -> Decimal:
@@ -219,6 +202,13 @@ class KeyFigures(KeyFiguresBase):
     # so we change the field from ForeignKey to OneToOneField
     company = models.OneToOneField("core.Company", on_delete=models.CASCADE)
 
+    # Components of the liquidity of the company, stored by the KeyFiguresTask so the liquidity views
+    # only read a single row. The depot value includes the private depot, unlike the book value.
+    # The cash & the value of the buy orders are read live from the company.
+    # Bonds bought between two runs are added right away, see core/signals.py -> add_bond_value
+    bond_value = models.DecimalField(max_digits=40, decimal_places=2, default=0)
+    depot_value = models.DecimalField(max_digits=40, decimal_places=2, default=0)
+
     class Meta:
         db_table = "key_figures"
 
@@ -244,7 +234,13 @@ class PastKeyFigures(KeyFiguresBase):
         db_table = "past_key_figures"
 
     @classmethod
-    def past_from_current_key_figure(cls, k: KeyFigures, day: datetime = timezone.now()) -> PastKeyFigures:
+    def past_from_current_key_figure(
+        cls, k: KeyFigures, day: datetime = timezone.now(), shares: int = None
+    ) -> PastKeyFigures:
+        """
+        Copies the given key figures. The shares of the company can be passed if they are known already,
+        otherwise the company of the key figures is loaded.
+        """
         p = cls()
         p.book_value = k.book_value
         p.activity = k.activity
@@ -252,9 +248,9 @@ class PastKeyFigures(KeyFiguresBase):
         p.free_float = k.free_float
         p.ttoc = k.ttoc
         p.share_price = k.share_price
-        p.shares = k.company.shares
+        p.shares = k.company.shares if shares is None else shares
         p.day = day
-        p.company = k.company
+        p.company_id = k.company_id
         return p
 
 
@@ -284,6 +280,22 @@ class CompanyVolume(models.Model):
         unique_together = ["company", "day"]
         db_table = "company_volume"
 
+    @classmethod
+    def add_volumes(cls, volumes: Dict[int, List[Decimal]], day: datetime.date) -> None:
+        """
+        Adds the given [buy_volume, sell_volume, volume] of every company id to the volumes of the day
+        with a single query per batch. Volumes, which do not exist yet, are created.
+        """
+        fields = ["company", "day", "buy_volume", "sell_volume", "volume"]
+        rows = [[company_id, day, *values] for company_id, values in volumes.items()]
+        upsert(
+            cls,
+            fields,
+            rows,
+            conflict_fields=["company", "day"],
+            update={name: f"current.{name} + EXCLUDED.{name}" for name in ["buy_volume", "sell_volume", "volume"]},
+        )
+
 
 class HistoryCompanyData(models.Model):
     """
@@ -297,3 +309,97 @@ class HistoryCompanyData(models.Model):
 
     class Meta:
         db_table = "company_history"
+
+
+class Candle(models.Model):
+    """
+    Model to store the open, high, low & close price and the volume of the trades of a company
+    within 5 minutes, an hour or a day, so price charts do not need to scan the trades.
+
+    The candles are updated by the OrderTask after every batch of trades (see Candle.add_trades)
+    and can be rebuilt from the trades with the backfill_candles command.
+    """
+
+    # Length of the resolutions in seconds. The candles start at multiples of their length since the epoch,
+    # so the daily candles start at midnight UTC.
+    RESOLUTIONS = {"5m": 5 * 60, "1h": 60 * 60, "1d": 24 * 60 * 60}
+
+    company = models.ForeignKey("core.Company", on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=2, choices=[(r, r) for r in RESOLUTIONS])
+    start = models.DateTimeField()
+
+    open = models.DecimalField(max_digits=40, decimal_places=2)
+    high = models.DecimalField(max_digits=40, decimal_places=2)
+    low = models.DecimalField(max_digits=40, decimal_places=2)
+    close = models.DecimalField(max_digits=40, decimal_places=2)
+
+    # Amount of shares traded
+    volume = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["company", "resolution", "start"]
+        db_table = "candle"
+
+    def __str__(self):
+        return f"{self.company_id} {self.resolution} {self.start}: {self.open} {self.high} {self.low} {self.close}"
+
+    @classmethod
+    def get_start(cls, time: datetime.datetime, resolution: str) -> datetime.datetime:
+        """Returns the start of the candle of the given resolution, which contains the given time"""
+        seconds = cls.RESOLUTIONS[resolution]
+        timestamp = int(time.timestamp()) // seconds * seconds
+        return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+    @classmethod
+    def from_trades(cls, trades: Iterable[Tuple[int, Decimal, int, datetime.datetime]]) -> List[Candle]:
+        """
+        Returns the candles of all resolutions for the given (company_id, price, amount, created) tuples.
+        The trades have to be ordered by their creation.
+        """
+        candles = dict()
+        for company_id, price, amount, created in trades:
+            for resolution in cls.RESOLUTIONS:
+                start = cls.get_start(created, resolution)
+                candle = candles.get((company_id, resolution, start))
+                if candle is None:
+                    candles[(company_id, resolution, start)] = cls(
+                        company_id=company_id,
+                        resolution=resolution,
+                        start=start,
+                        open=price,
+                        high=price,
+                        low=price,
+                        close=price,
+                        volume=amount,
+                    )
+                    continue
+
+                candle.high = max(candle.high, price)
+                candle.low = min(candle.low, price)
+                candle.close = price
+                candle.volume += amount
+
+        return list(candles.values())
+
+    @classmethod
+    def add_trades(cls, trades: Iterable[Tuple[int, Decimal, int, datetime.datetime]]) -> None:
+        """
+        Merges the given trades into the stored candles with a single query per batch.
+
+        The trades have to be newer than the trades already stored, so the close price of the
+        stored candles is replaced. See Candle.from_trades for the format of the trades.
+        """
+        fields = ["company", "resolution", "start", "open", "high", "low", "close", "volume"]
+        rows = [[getattr(c, f.attname) for f in map(cls._meta.get_field, fields)] for c in cls.from_trades(trades)]
+        upsert(
+            cls,
+            fields,
+            rows,
+            conflict_fields=["company", "resolution", "start"],
+            update={
+                "high": "GREATEST(current.high, EXCLUDED.high)",
+                "low": "LEAST(current.low, EXCLUDED.low)",
+                "close": "EXCLUDED.close",
+                "volume": "current.volume + EXCLUDED.volume",
+            },
+        )
@@ -6,7 +6,7 @@ license that can be found in the LICENSE.txt file.
 
 from rest_framework import serializers
 
-from stats.models import KeyFigures, PastKeyFigures
+from stats.models import Candle, KeyFigures, PastKeyFigures
 
 
 class KeyFiguresSerializer(serializers.ModelSerializer):
@@ -21,3 +21,18 @@ class PastKeyFiguresSerializer(serializers.ModelSerializer):
         model = PastKeyFigures
         fields = ("book_value", "ttoc", "cdgr", "share_price", "activity", "free_float", "shares", "day", "id")
         read_only_fields = fields
+
+
+class CandleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Candle
+        fields = ("start", "open", "high", "low", "close", "volume")
+        read_only_fields = fields
+
+
+class CandleRangeSerializer(serializers.Serializer):
+    """Validates the query parameters of the candles of a company"""
+
+    resolution = serializers.ChoiceField(choices=list(Candle.RESOLUTIONS), default="1h")
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
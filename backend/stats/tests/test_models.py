@@ -3,15 +3,18 @@ Copyright 2020 Dario Heinisch. All rights reserved.
 Use of this source code is governed by a AGPL-3.0
 license that can be found in the LICENSE.txt file.
 """
+import datetime
 from decimal import Decimal
+from io import StringIO
 
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.utils import timezone
 
 from common.test_base import BaseTestCase
-from stats.models import HistoryCompanyData, CompanyVolume, PastKeyFigures, KeyFigures
+from stats.models import Candle, HistoryCompanyData, CompanyVolume, PastKeyFigures, KeyFigures
 
-from core.models import Order, Company
+from core.models import Bond, Company, DepotPosition, Order, Trade
 
 
 class HistoryCompanyDataTestCase(BaseTestCase):
@@ -33,6 +36,20 @@ class CompanyVolumeTestCase(BaseTestCase):
         with self.assertRaises(IntegrityError):
             CompanyVolume.objects.create(company=self.company, day=day)
 
+    def test_add_volumes(self):
+        day = timezone.now().date()
+        company_two = Company.objects.create(name="Two")
+        CompanyVolume.objects.filter(company=company_two).delete()
+
+        CompanyVolume.add_volumes({self.company.id: [10, 0, 5], company_two.id: [0, 20, 0]}, day)
+        CompanyVolume.add_volumes({self.company.id: [1, 2, 3]}, day)
+
+        volume = CompanyVolume.objects.get(company=self.company, day=day)
+        self.assertEqual((volume.buy_volume, volume.sell_volume, volume.volume), (11, 2, 8))
+
+        volume = CompanyVolume.objects.get(company=company_two, day=day)
+        self.assertEqual((volume.buy_volume, volume.sell_volume, volume.volume), (0, 20, 0))
+
 
 class PastKeyFiguresTestCase(BaseTestCase):
     def test_company_can_only_have_one_key_figure_per_day(self):
@@ -87,3 +104,75 @@ class KeyFiguresTestCase(BaseTestCase):
         )
 
         self.assertEqual(new_share_price, KeyFigures.calc_share_price(self.company))
+
+    def test_calc_depot_values_splits_the_private_depot(self):
+        DepotPosition.objects.create(depot_of=self.company_two, company=self.company, amount=100)
+        DepotPosition.objects.create(depot_of=self.company_two, company=self.company, amount=50, private_depot=True)
+        share_price = self.company.keyfigures.share_price
+
+        self.assertEqual(KeyFigures.calc_depot_values(self.company_two), (150 * share_price, 100 * share_price))
+
+    def test_bought_bonds_are_added_to_the_bond_value(self):
+        Bond.objects.create(company=self.company, value=1000, rate=1, runtime=1)
+        Bond.objects.create(company=self.company, value=500, rate=1, runtime=1)
+
+        self.assertEqual(KeyFigures.objects.get(company=self.company).bond_value, 1500)
+
+
+class CandleTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.time = datetime.datetime(2020, 4, 1, 10, 2, tzinfo=datetime.timezone.utc)
+
+    def trade(self, price, amount: int, minutes: int = 0) -> tuple:
+        return self.company.id, Decimal(price), amount, self.time + datetime.timedelta(minutes=minutes)
+
+    def test_get_start(self):
+        self.assertEqual(Candle.get_start(self.time, "5m"), self.time.replace(minute=0))
+        self.assertEqual(Candle.get_start(self.time, "1h"), self.time.replace(minute=0))
+        self.assertEqual(Candle.get_start(self.time, "1d"), self.time.replace(hour=0, minute=0))
+
+    def test_from_trades(self):
+        trades = [
+            self.trade(2, 10),
+            self.trade(3, 5, minutes=1),
+            self.trade(1, 1, minutes=2),
+            self.trade(4, 7, minutes=3),
+        ]
+        candles = {(c.resolution, c.start): c for c in Candle.from_trades(trades)}
+
+        self.assertEqual(len(candles), 4)
+
+        first = candles[("5m", self.time.replace(minute=0))]
+        self.assertEqual((first.open, first.high, first.low, first.close, first.volume), (2, 3, 1, 1, 16))
+
+        second = candles[("5m", self.time.replace(minute=5))]
+        self.assertEqual((second.open, second.high, second.low, second.close, second.volume), (4, 4, 4, 4, 7))
+
+        hour = candles[("1h", self.time.replace(minute=0))]
+        self.assertEqual((hour.open, hour.high, hour.low, hour.close, hour.volume), (2, 4, 1, 4, 23))
+
+    def test_add_trades_merges_the_stored_candles(self):
+        Candle.add_trades([self.trade(2, 10), self.trade(3, 5)])
+        Candle.add_trades([self.trade("1.5", 1, minutes=1)])
+
+        candle = Candle.objects.get(company=self.company, resolution="5m")
+        self.assertEqual(
+            (candle.open, candle.high, candle.low, candle.close, candle.volume),
+            (2, 3, Decimal("1.5"), Decimal("1.5"), 16),
+        )
+        self.assertEqual(Candle.objects.filter(company=self.company).count(), 3)
+
+    def test_backfill_candles(self):
+        Trade.objects.create(company=self.company, price=2, amount=10)
+        Trade.objects.create(company=self.company, price=3, amount=5)
+        Trade.objects.update(created=self.time)
+        Candle.objects.create(
+            company=self.company, resolution="1d", start=self.time, open=1, high=1, low=1, close=1, volume=1
+        )
+
+        call_command("backfill_candles", "--isin", self.company.isin, stdout=StringIO())
+
+        self.assertEqual(Candle.objects.filter(company=self.company).count(), 3)
+        for candle in Candle.objects.filter(company=self.company):
+            self.assertEqual((candle.open, candle.high, candle.low, candle.close, candle.volume), (2, 3, 2, 3, 15))
@@ -6,11 +6,14 @@ license that can be found in the LICENSE.txt file.
 
 # Create your tests here.
 
+import datetime
+from unittest import mock
+
 from freezegun import freeze_time
 from rest_framework.reverse import reverse
 
 from common.test_base import NOW, BaseTestCase
-from stats.models import PastKeyFigures
+from stats.models import Candle, PastKeyFigures
 
 
 @freeze_time(NOW)
@@ -58,3 +61,48 @@ class PastKeyFiguresApiTest(BaseTestCase):
         ]
 
         self.assertListEqual(should_be, response.json())
+
+
+class CandleApiTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("stats:candles", kwargs={"isin": self.company.isin})
+        self.time = datetime.datetime(2020, 4, 1, tzinfo=datetime.timezone.utc)
+
+        for hour in range(3):
+            for resolution in ["1h", "5m"]:
+                Candle.objects.create(
+                    company=self.company,
+                    resolution=resolution,
+                    start=self.time + datetime.timedelta(hours=hour),
+                    open=hour,
+                    high=hour,
+                    low=hour,
+                    close=hour,
+                    volume=hour,
+                )
+
+    def test_candles(self):
+        rsp = self.client.get(self.url)
+        self.assertEqual(rsp.status_code, 200)
+
+        data = rsp.json()
+        self.assertEqual([c["close"] for c in data], [0, 1, 2])
+        self.assertEqual(set(data[0]), {"start", "open", "high", "low", "close", "volume"})
+
+    def test_range(self):
+        start = (self.time + datetime.timedelta(hours=1)).isoformat()
+        end = (self.time + datetime.timedelta(hours=2)).isoformat()
+        rsp = self.client.get(self.url, {"resolution": "5m", "start": start, "end": end})
+
+        self.assertEqual([c["close"] for c in rsp.json()], [1])
+
+    def test_latest_candles_are_returned(self):
+        with mock.patch("stats.views.MAXIMUM_CANDLES", 2):
+            rsp = self.client.get(self.url)
+
+        self.assertEqual([c["close"] for c in rsp.json()], [1, 2])
+
+    def test_invalid_resolution(self):
+        rsp = self.client.get(self.url, {"resolution": "1y"})
+        self.assertEqual(rsp.status_code, 400)
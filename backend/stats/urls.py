@@ -10,4 +10,7 @@ from stats import views
 
 app_name = "stats"
 
-urlpatterns = [path("<slug:isin>/key_figures/", views.PastKeyFiguresListApiView.as_view(), name="past_key_figures")]
+urlpatterns = [
+    path("<slug:isin>/key_figures/", views.PastKeyFiguresListApiView.as_view(), name="past_key_figures"),
+    path("<slug:isin>/candles/", views.CandleListApiView.as_view(), name="candles"),
+]
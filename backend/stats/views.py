@@ -6,20 +6,51 @@ license that can be found in the LICENSE.txt file.
 
 from rest_framework.generics import ListAPIView
 
-from core.models import Company
-from stats.models import PastKeyFigures
-from stats.serializers import PastKeyFiguresSerializer
+from common.renderers import TABLE_RENDERER_CLASSES
+from common.views import CachedResponseMixin
+from core.views import CompanyViewMixin
+from stats.models import Candle, PastKeyFigures
+from stats.serializers import CandleRangeSerializer, CandleSerializer, PastKeyFiguresSerializer
+from tsg.const import MAXIMUM_CANDLES
 
 
-class PastKeyFiguresListApiView(ListAPIView):
+class PastKeyFiguresListApiView(CompanyViewMixin, CachedResponseMixin, ListAPIView):
     """
     Returns the PastKeyFigures of a company given by isin
     """
 
     serializer_class = PastKeyFiguresSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
     queryset = PastKeyFigures.objects.all()
 
     def get_queryset(self):
-        isin = self.kwargs.get("isin")
-        id_ = Company.get_id_from_isin(isin)
-        return super().get_queryset().filter(company_id=id_).order_by("day")
+        return super().get_queryset().filter(company_id=self.get_id()).order_by("day")
+
+
+class CandleListApiView(CompanyViewMixin, CachedResponseMixin, ListAPIView):
+    """
+    Returns the candles of a company given by isin.
+
+    The resolution (5m, 1h or 1d, default 1h) and the range are passed as query parameters, e.g.
+    ?resolution=5m&start=2020-04-01T00:00:00Z&end=2020-04-02T00:00:00Z
+    At most the latest MAXIMUM_CANDLES candles of the range are returned, ordered by their start.
+    """
+
+    serializer_class = CandleSerializer
+    renderer_classes = TABLE_RENDERER_CLASSES
+    queryset = Candle.objects.all()
+
+    def get_queryset(self):
+        params = CandleRangeSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        qs = super().get_queryset().filter(company_id=self.get_id(), resolution=params["resolution"])
+
+        if "start" in params:
+            qs = qs.filter(start__gte=params["start"])
+
+        if "end" in params:
+            qs = qs.filter(start__lt=params["end"])
+
+        return list(reversed(qs.order_by("-start")[:MAXIMUM_CANDLES]))
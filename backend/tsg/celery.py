@@ -30,10 +30,17 @@ app.config_from_object("django.conf:settings")
 
 app.conf.broker_url = REDIS_URL
 
+# The periodic jobs run as chords (see periodic_tasks/graph.py), which need a result backend
+# to know when all tasks of a stage have finished.
+app.conf.result_backend = REDIS_URL
+app.conf.result_expires = 60 * 60
+
 logger.info(f"Broker url: {REDIS_URL}")
 
 app.conf.beat_schedule = {
-    "5-Min": {"task": "periodic_tasks.jobs.five_minutes_jobs", "schedule": crontab(minute="*/5")},
+    # Checks every minute whether orders need to be matched and dispatches the five minutes jobs
+    # only if there is work to do (see periodic_tasks/scheduler.py)
+    "Adaptive": {"task": "periodic_tasks.jobs.adaptive_tick", "schedule": crontab()},
     "Hour": {"task": "periodic_tasks.jobs.hour_jobs", "schedule": crontab(minute="*/60")},
     "Daily": {"task": "periodic_tasks.jobs.daily_jobs", "schedule": crontab(hour="*/24")},
 }
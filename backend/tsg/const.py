@@ -8,6 +8,8 @@ license that can be found in the LICENSE.txt file.
 
 CENTRALBANK = "Centralbank"
 MAXIMUM_BONDS = 10
+MAXIMUM_ORDER_BATCH = 50
+MAXIMUM_CANDLES = 1000
 DATE_FORMAT = "%m/%d/%Y"
 DATETIME_FORMAT = "%m/%d/%Y %H:%M"
 
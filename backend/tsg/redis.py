@@ -0,0 +1,15 @@
+"""
+Copyright 2020 Dario Heinisch. All rights reserved.
+Use of this source code is governed by a AGPL-3.0
+license that can be found in the LICENSE.txt file.
+"""
+
+import redis
+
+from tsg import settings
+
+# A single connection pool per process, shared by the periodic tasks and the notify events,
+# so they do not each open their own connections to redis.
+pool = redis.ConnectionPool.from_url(settings.REDIS_URL)
+
+redis_client = redis.Redis(connection_pool=pool)
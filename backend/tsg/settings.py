@@ -164,6 +164,12 @@ REST_FRAMEWORK = {
     ),
     'COERCE_DECIMAL_TO_STRING': False,
 
+    # Uses orjson if it is installed, see common/renderers.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'common.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema'
 }
 
@@ -171,7 +177,7 @@ REST_FRAMEWORK = {
 # Disable the browsable api in production and use only json
 # if DEBUG is False:
 #     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
-#         'rest_framework.renderers.JSONRenderer',
+#         'common.renderers.FastJSONRenderer',
 #     ]
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
@@ -252,6 +258,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = "/mediafiles/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "mediafiles")
 
+# Archived trades & statements of account, see core/cold_archive.py
+COLD_ARCHIVE_DIR = os.environ.get("COLD_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+
+# Days the runs of the periodic tasks are kept in the ledger, see periodic_tasks.models.TaskRun
+TASK_RUN_RETENTION_DAYS = int(os.environ.get("TASK_RUN_RETENTION_DAYS", 14))
+
 logging.info(f"Running in {'Development' if DEBUG else 'Production'}")
 
 # Disable email verification for now
@@ -35,6 +35,7 @@ urlpatterns = [
     path("api/stats/", include("stats.urls")),
     path("api/social/", include("users.urls")),
     path("api/fonds/", include("fonds.urls")),
+    path("api/tasks/", include("periodic_tasks.urls")),
     path("api-token-auth/", obtain_auth_token),
     path("docs/", include_docs_urls(title="TheShareGame API", public=True)),
     path("api/auth/github/", GithubLogin.as_view(), name="github_login"),
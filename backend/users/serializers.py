@@ -9,6 +9,7 @@ import logging
 from django.contrib.auth import authenticate
 from rest_framework import serializers
 
+from core.company_cache import company_cache
 from core.models import Company
 from fonds.models import FondArticle, FondComment
 from fonds.models import Member
@@ -211,9 +212,8 @@ class ArticleSerializer(serializers.ModelSerializer):
 
         # check whether the related-model exists
         if hasattr(instance, "companyarticle"):
-            from core.serializers import CompanyUrlSerializer
-
-            author = CompanyUrlSerializer(instance=instance.companyarticle.company).data
+            company = company_cache.get(instance.companyarticle.company_id)
+            author = company.url_data() if company is not None else dict()
 
         elif hasattr(instance, "fondarticle"):
             from fonds.serializers import InvestmentFondUrlSerializer
@@ -245,7 +245,8 @@ class ArticleSerializer(serializers.ModelSerializer):
         if value:
             user = self.context["request"].user
             user_id = user.id
-            if Company.objects.filter(user_id=user_id, id=value).exists() is False:
+            # Read from the database, the company might just have been handed over to another user
+            if not Company.objects.filter(id=value, user_id=user_id).exists():
                 logger.warning(f"{user} is not the ceo of {value}!")
                 raise serializers.ValidationError("You are not the ceo of this company")
         return value
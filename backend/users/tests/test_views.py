@@ -10,6 +10,8 @@ from freezegun import freeze_time
 from rest_framework.reverse import reverse
 
 from common.test_base import NOW, NOW_FORMAT, NOW_STR, BaseTestCase
+from core.company_cache import company_cache
+from core.models import Company
 from fonds.models import InvestmentFond, Member
 from users.models import (
     CompanyArticle,
@@ -152,6 +154,12 @@ class ArticleApiTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 400)
         self.assertDictEqual(response.json(), {"company_id": ["You are not the ceo of this company"]})
 
+        # the ownership is read from the database, not from a stale company cache
+        company_cache.get(self.company.id)
+        Company.objects.filter(id=self.company.id).update(user=user)
+        response = client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+
     def test_post_no_id(self):
         user = self.user_two
         url = self.url
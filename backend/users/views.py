@@ -18,10 +18,10 @@ from rest_framework.generics import (
     RetrieveUpdateAPIView,
 )
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from common.pagination import StandardResultsSetPagination
+from common.pagination import EstimatedCountPagination, StandardResultsSetPagination
+from common.renderers import FastJSONRenderer
 from common.views import BaseListAPIServerSide
 from core.models import Company
 from users.models import (
@@ -63,7 +63,7 @@ class RegistrationAPI(generics.GenericAPIView):
 	"""
 
     serializer_class = CreateUserSerializer
-    renderer_classes = (JSONRenderer,)
+    renderer_classes = (FastJSONRenderer,)
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -218,7 +218,7 @@ class ConversationListCreateAPIView(BaseListAPIServerSide, ListCreateAPIView):
         return {"users__in": [user_id]}
 
 
-class MessageJsonRenderer(JSONRenderer):
+class MessageJsonRenderer(FastJSONRenderer):
     """
     Custom Renderer for the MessagesListCreateAPIView which also adds information about
     the conversation
@@ -274,7 +274,7 @@ class NotificationListAPIView(BaseListAPIServerSide, ListAPIView):
     serializer_class = NotificationSerializer
     queryset = Notification.objects.all()
     permission_classes = (IsAuthenticated,)
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
 
     def get_filter_kwargs(self):
         user_id = self.request.user.id